@@ -1,5 +1,15 @@
+import os
+
 from django.apps import AppConfig
 
 class AccountsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "accounts"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from facekit import registry
+
+        # Load the models before the first request rather than during it
+        if os.getenv("FACE_WARMUP", "").lower() == "true":
+            registry.components()
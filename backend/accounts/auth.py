@@ -1,13 +1,29 @@
 from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
 from django.http import JsonResponse
 
+from .models import User
+
 
 def login_required_json(view_func):
     """Require an authenticated user; else return 401 JSON instead of redirecting.
 
     Use for API endpoints where a browser redirect to a login page is not desired.
+    Async views are wrapped with an async check that loads the user via ``auser()``.
     """
 
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _awrapped(request, *args, **kwargs):
+            auser = getattr(request, "auser", None)
+            user = await auser() if auser is not None else None
+            if not user or not user.is_authenticated:
+                return JsonResponse({"detail": "unauthorized"}, status=401)
+            return await view_func(request, *args, **kwargs)
+
+        return _awrapped
+
     @wraps(view_func)
     def _wrapped(request, *args, **kwargs):
         user = getattr(request, "user", None)
@@ -17,3 +33,14 @@ def login_required_json(view_func):
 
     return _wrapped
 
+
+
+def resolve_login_hint(hint: str):
+    """Map an OIDC ``login_hint`` (email address or ``sub``) to an active user, or None."""
+    hint = (hint or "").strip()
+    if not hint:
+        return None
+    users = User.objects.filter(is_active=True)
+    if hint.isdigit():
+        return users.filter(pk=int(hint)).first()
+    return users.filter(email__iexact=hint).first()
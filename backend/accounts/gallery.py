@@ -0,0 +1,625 @@
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from facekit.adapter import normalize_vector
+from facekit.crypto import decrypt
+from facekit.index import CentroidIndex, make_index
+from facekit.pipeline import GalleryEngine
+from facekit.quant import QuantizedSnapshot, quantize, unpack_vector
+from facekit.shm import SharedGalleryReader
+from facekit.snapshot import GallerySnapshot, SnapshotOverlay
+from orgs.models import GalleryMember
+from .auth import resolve_login_hint
+from .models import FaceEmbedding, GalleryState
+
+
+_GALLERIES: dict = {}
+_GALLERIES_LOCK = threading.Lock()
+
+
+def _decode(token, norm=None) -> np.ndarray | None:
+    try:
+        vec = unpack_vector(decrypt(bytes(token)))
+    except Exception:
+        return None
+    if norm is None:
+        # Written before embeddings were stored unit length.
+        vec, _ = normalize_vector(vec)
+    return vec
+
+
+def _safe_name(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+
+
+def snapshot_path(model_name: str) -> str | None:
+    """Location of the memory-mapped snapshot for ``model_name`` (``FACE_GALLERY_SNAPSHOT_DIR``)."""
+    directory = os.getenv("FACE_GALLERY_SNAPSHOT_DIR", "")
+    if not directory:
+        return None
+    return os.path.join(directory, f"{_safe_name(model_name)}.gallery")
+
+
+def _scope_members(scope):
+    """User ids in a tenant gallery ``scope`` (``("org", id)`` or ``("client", id)``).
+
+    An org gallery holds the org-level members only (rows without a client).
+    """
+    kind, pk = scope
+    if kind == "org":
+        members = GalleryMember.objects.filter(org_id=pk, client__isnull=True)
+    else:
+        members = GalleryMember.objects.filter(client_id=pk)
+    return members.values("user_id")
+
+
+def _gallery_dtype(name: str) -> str:
+    """In-memory gallery precision: ``float16`` or ``int8``, else ``float32``."""
+    name = (name or "float32").strip().lower()
+    if name not in ("float32", "float16", "int8"):
+        logging.warning("unsupported FACE_GALLERY_DTYPE %r, using float32", name)
+        return "float32"
+    return name
+
+
+def _current_generation(model_name: str) -> int:
+    gen = GalleryState.objects.filter(model_name=model_name).values_list("generation", flat=True).first()
+    return int(gen or 0)
+
+
+class Gallery:
+    """Decrypted, process-resident gallery for one embedding model.
+
+    Active embeddings are kept as a contiguous float32 matrix of unit rows with
+    arrays of embedding ids and owner (user) ids. ``view()`` returns arrays
+    that are never mutated afterwards: appends go into spare capacity past the
+    published size, and removals publish freshly compacted arrays, so a
+    request holding a view can't see a half-updated gallery.
+
+    Freshness across processes is tracked through ``GalleryState.generation``;
+    when it moves, only rows with ``updated_at`` past the last watermark are
+    decrypted again.
+
+    With ``FACE_GALLERY_SNAPSHOT_DIR`` set and a snapshot written by the
+    ``gallery_snapshot`` command, the bulk of the gallery is an ``np.memmap``
+    shared by every worker on the host; only rows changed after the
+    snapshot's watermark are decrypted into the in-memory part, and snapshot
+    rows they supersede are masked out. ANN indexes are not used in this mode.
+
+    ``FACE_INDEX=centroid`` keeps a per-user centroid next to the rows and
+    publishes a two-stage view (centroids, then the best users' templates).
+
+    ``FACE_GALLERY_DTYPE=float16|int8`` scans a copy of the matrix in that
+    precision (int8 with one scale per row) and publishes a
+    :class:`~facekit.quant.QuantizedSnapshot` that re-ranks its best rows
+    against the float32 rows kept alongside; other values fall back to
+    float32. ANN and centroid indexes are not used in this mode.
+
+    ANN indexes are trained on a background thread; until one is ready the
+    view is the exact matrix (or the previous index, when retraining). With
+    ``background_index=False`` they are trained inline, as the
+    ``build_gallery_index`` command does. Indexes marked ``offline`` (HNSW)
+    are never trained by a serving gallery, only restored from
+    ``FACE_INDEX_DIR``.
+
+    A ``scope`` (see ``OAuthClient.gallery_key``) restricts the gallery to the
+    members of one org or client; scoped galleries always load from the
+    database, since snapshots hold every user of the model.
+    """
+
+    def __init__(self, model_name: str, use_snapshot: bool = True, index_kind: str | None = None,
+                 scope: tuple[str, int] | None = None, dtype: str | None = None, background_index: bool = True):
+        self.model_name = model_name
+        self._background_index = background_index
+        self._building = False
+        self.scope = scope
+        self._dtype_name = _gallery_dtype(dtype or os.getenv("FACE_GALLERY_DTYPE", ""))
+        self._use_snapshot = use_snapshot and scope is None
+        self._index_kind = index_kind
+        self._lock = threading.RLock()
+        self._reset()
+        self._generation = None
+
+    def _reset(self):
+        self._vectors = None
+        self._ids = np.empty((0,), dtype=np.int64)
+        self._owners = np.empty((0,), dtype=np.int64)
+        self._live = np.empty((0,), dtype=bool)
+        self._rows: dict[int, int] = {}
+        self._size = 0
+        self._dead = 0
+        self._watermark = None
+        self._base = None
+        self._base_live = None
+        self._base_count = 0
+        self._index = make_index(self._index_kind)
+        kind = self._index_kind if self._index_kind is not None else os.getenv("FACE_INDEX", "exact")
+        self._templates = CentroidIndex() if kind.strip().lower() == "centroid" else None
+        self._dtype = np.dtype(self._dtype_name)
+        self._scales = np.empty((0,), dtype=np.float32)
+        # float32 rows for re-ranking quantized scans (quantized mode only)
+        self._exact = None
+        if self._dtype != np.float32:
+            self._index = None
+            self._templates = None
+        self._view = (np.empty((0, 0), dtype=np.float32), np.empty((0,), dtype=np.int64))
+
+    def _active(self):
+        qs = FaceEmbedding.objects.filter(model_name=self.model_name, active=True, user__is_active=True)
+        if self.scope is not None:
+            qs = qs.filter(user_id__in=_scope_members(self.scope))
+        return qs
+
+    def _in_scope(self, owner_id: int) -> bool:
+        return self.scope is None or _scope_members(self.scope).filter(user_id=owner_id).exists()
+
+    # -- storage -----------------------------------------------------------
+    def _grow(self, dim: int):
+        cap = max(64, 2 * len(self._ids))
+        vectors = np.zeros((cap, dim), dtype=self._dtype)
+        scales = np.ones((cap,), dtype=np.float32)
+        ids = np.zeros((cap,), dtype=np.int64)
+        owners = np.zeros((cap,), dtype=np.int64)
+        live = np.zeros((cap,), dtype=bool)
+        n = self._size
+        if self._vectors is not None:
+            vectors[:n] = self._vectors[:n]
+            scales[:n] = self._scales[:n]
+            ids[:n] = self._ids[:n]
+            owners[:n] = self._owners[:n]
+            live[:n] = self._live[:n]
+        self._vectors, self._scales, self._ids, self._owners, self._live = vectors, scales, ids, owners, live
+        if self._dtype != np.float32:
+            exact = np.zeros((cap, dim), dtype=np.float32)
+            if self._exact is not None:
+                exact[:n] = self._exact[:n]
+            self._exact = exact
+
+    def _mask_base(self, emb_ids=None, rows=None):
+        if self._base is None:
+            return
+        if rows is None:
+            rows = self._base.rows_for(list(emb_ids))
+            rows = rows[rows >= 0]
+        rows = rows[self._base_live[rows]]
+        if rows.size:
+            live = self._base_live.copy()
+            live[rows] = False
+            self._base_live = live
+            self._base_count -= len(rows)
+
+    def _add(self, emb_id: int, owner_id: int, vec: np.ndarray):
+        if emb_id in self._rows:
+            self._remove([emb_id])
+        self._mask_base([emb_id])
+        dim = self._vectors.shape[1] if self._vectors is not None else (self._base.dim if self._base is not None else None)
+        if dim is not None and vec.shape[0] != dim:
+            return
+        if self._vectors is None or self._size == len(self._ids):
+            self._grow(vec.shape[0])
+        row = self._size
+        if self._dtype == np.float32:
+            self._vectors[row] = vec
+        else:
+            codes, scales = quantize(vec, self._dtype)
+            self._vectors[row], self._scales[row] = codes[0], scales[0]
+            self._exact[row] = vec
+        self._ids[row] = emb_id
+        self._owners[row] = owner_id
+        self._live[row] = True
+        self._rows[emb_id] = row
+        self._size += 1
+        if self._templates is not None:
+            self._templates.add(owner_id, vec)
+        if self._index is not None:
+            self._index.add(np.array([row], dtype=np.int64), self._vectors)
+
+    def _remove(self, emb_ids):
+        rest = []
+        for emb_id in emb_ids:
+            row = self._rows.pop(int(emb_id), None)
+            if row is not None:
+                if self._templates is not None:
+                    self._templates.remove(self._owners[row], self._vectors[row])
+                self._live[row] = False
+                self._dead += 1
+            else:
+                rest.append(int(emb_id))
+        if rest:
+            self._mask_base(rest)
+
+    def _live_count(self) -> int:
+        return len(self._rows) + self._base_count
+
+    def _publish(self):
+        n = self._size
+        if self._dead:
+            # Compact into fresh buffers; published views keep the old ones.
+            keep = np.flatnonzero(self._live[:n])
+            dim = self._vectors.shape[1]
+            cap = max(64, 2 * len(keep))
+            vectors = np.zeros((cap, dim), dtype=self._dtype)
+            vectors[:len(keep)] = self._vectors[keep]
+            scales = np.ones((cap,), dtype=np.float32)
+            scales[:len(keep)] = self._scales[keep]
+            ids = np.zeros((cap,), dtype=np.int64)
+            ids[:len(keep)] = self._ids[keep]
+            owners = np.zeros((cap,), dtype=np.int64)
+            owners[:len(keep)] = self._owners[keep]
+            live = np.zeros((cap,), dtype=bool)
+            live[:len(keep)] = True
+            self._vectors, self._scales, self._ids, self._owners, self._live = vectors, scales, ids, owners, live
+            if self._exact is not None:
+                exact = np.zeros((cap, dim), dtype=np.float32)
+                exact[:len(keep)] = self._exact[keep]
+                self._exact = exact
+            if self._index is not None:
+                mapping = np.full((n,), -1, dtype=np.int64)
+                mapping[keep] = np.arange(len(keep), dtype=np.int64)
+                self._index.remap(mapping)
+            self._size = n = len(keep)
+            self._dead = 0
+            self._rows = dict(zip(ids[:n].tolist(), range(n)))
+        if self._base is not None:
+            dim = self._base.dim
+            delta = self._vectors[:n] if self._vectors is not None else np.empty((0, dim), dtype=np.float32)
+            vectors = SnapshotOverlay(self._base.vectors, self._base_live, delta, self._live_count())
+            self._view = (vectors, np.concatenate([self._base.owners, self._owners[:n]]))
+            return
+        if self._vectors is None:
+            return
+        vectors = self._vectors[:n]
+        if self._dtype != np.float32:
+            vectors = QuantizedSnapshot(vectors, self._scales[:n], fetch=self._exact[:n].__getitem__)
+        elif self._index is not None:
+            if self._index.needs_training(n) and not self._building and not self._restore_index(n) and self._may_train():
+                self._train_index()
+            if self._index.is_trained:
+                vectors = self._index.snapshot(vectors)
+        elif self._templates is not None:
+            vectors = self._templates.snapshot(vectors, self._owners[:n])
+        self._view = (vectors, self._owners[:n])
+
+    # -- index building ----------------------------------------------------
+    def _train_index(self):
+        n = self._size
+        # Rows [:n] of the current buffers are never written again
+        vectors, ids = self._vectors[:n], self._ids[:n].copy()
+        if not self._background_index:
+            index = make_index(self._index_kind)
+            index.train(vectors)
+            self._index = index
+            self.save_index()
+            return
+        self._building = True
+        threading.Thread(target=self._train_in_background, args=(vectors, ids),
+                         name=f"face-index-{self.model_name}", daemon=True).start()
+
+    def _may_train(self) -> bool:
+        # Offline-only indexes (HNSW) come from build_gallery_index via FACE_INDEX_DIR
+        return not self._background_index or not getattr(self._index, "offline", False)
+
+    def _train_in_background(self, vectors, ids):
+        try:
+            index = make_index(self._index_kind)
+            index.train(vectors)
+        except Exception:
+            logging.exception("building the %s gallery index failed", self.model_name)
+            index = None
+        with self._lock:
+            self._building = False
+            # A snapshot opened meanwhile serves without an index
+            if index is None or self._index is None:
+                return
+            self._attach_index(index, ids)
+            self._index = index
+            self._publish()
+            self.save_index()
+
+    def _attach_index(self, index, ids: np.ndarray):
+        """Point ``index``, built over rows with embedding ids ``ids``, at the current rows."""
+        n = self._size
+        mapping = np.array([self._rows.get(i, -1) for i in ids.tolist()], dtype=np.int64)
+        index.remap(mapping, size=n)
+        covered = np.zeros((n,), dtype=bool)
+        covered[mapping[mapping >= 0]] = True
+        index.add(np.flatnonzero(~covered), self._vectors)
+
+    # -- index persistence -------------------------------------------------
+    def _index_path(self) -> str | None:
+        directory = os.getenv("FACE_INDEX_DIR", "")
+        if not directory or not hasattr(self._index, "save"):
+            return None
+        name = self.model_name if self.scope is None else "{}.{}{}".format(self.model_name, *self.scope)
+        return os.path.join(directory, f"{_safe_name(name)}.{type(self._index).__name__.lower()}.npz")
+
+    def _restore_index(self, n: int) -> bool:
+        """Reattach a saved index (``FACE_INDEX_DIR``) to the freshly loaded rows."""
+        path = self._index_path()
+        if path is None or self._index.is_trained or not os.path.exists(path):
+            return False
+        saved_ids = self._index.load(path)
+        if saved_ids is None:
+            return False
+        self._attach_index(self._index, saved_ids)
+        return True
+
+    def save_index(self) -> str | None:
+        """Persist the ANN index under ``FACE_INDEX_DIR`` if the index supports it."""
+        with self._lock:
+            path = self._index_path()
+            if path is None or not self._index.is_trained:
+                return None
+            self._index.save(path, self._ids[:self._size])
+            return path
+
+    # -- loading -----------------------------------------------------------
+    def _load_rows(self, rows):
+        for emb_id, owner_id, token, norm in rows:
+            vec = _decode(token, norm)
+            if vec is not None and vec.size:
+                self._add(emb_id, owner_id, vec)
+
+    def _open_snapshot(self) -> bool:
+        path = snapshot_path(self.model_name) if self._use_snapshot else None
+        if path is None or not os.path.exists(path):
+            return False
+        try:
+            base = GallerySnapshot(path)
+            if base.model_name != self.model_name:
+                raise ValueError("snapshot is for a different model")
+            if os.getenv("FACE_SNAPSHOT_VERIFY", "").lower() == "true" and not base.verify():
+                raise ValueError("checksum mismatch")
+        except (OSError, ValueError) as exc:
+            logging.warning("ignoring gallery snapshot %s: %s", path, exc)
+            return False
+        self._base = base
+        self._index = None
+        self._templates = None
+        self._dtype = np.dtype(np.float32)
+        self._base_live = np.ones((base.count,), dtype=bool)
+        self._base_count = base.count
+        self._watermark = datetime.fromtimestamp(base.watermark, tz=dt_timezone.utc)
+        return True
+
+    def _load_all(self):
+        self._reset()
+        if self._open_snapshot():
+            # Snapshot rows are already decrypted; pull what changed since.
+            self._load_delta()
+            return
+        started = timezone.now()
+        self._load_rows(self._active().values_list("id", "user_id", "vector", "norm").iterator())
+        self._watermark = started
+
+    def _load_delta(self):
+        started = timezone.now()
+        changed = FaceEmbedding.objects.filter(
+            model_name=self.model_name, updated_at__gte=self._watermark
+        ).values_list("id", "user_id", "vector", "norm", "active", "user__is_active")
+        if self.scope is not None:
+            # Rows of users outside the scope count as removed.
+            members = set(self._active().filter(updated_at__gte=self._watermark).values_list("id", flat=True))
+        for emb_id, owner_id, token, norm, active, user_active in changed:
+            if active and user_active and (self.scope is None or emb_id in members):
+                self._load_rows([(emb_id, owner_id, token, norm)])
+            else:
+                self._remove([emb_id])
+        self._watermark = started
+        # Hard deletes and rows committed late leave no trace past the
+        # watermark; reconcile by id only when the counts disagree.
+        if self._active().count() != self._live_count():
+            current = set(self._active().values_list("id", flat=True))
+            cached = set(self._rows)
+            if self._base is not None:
+                cached.update(self._base.ids[self._base_live].tolist())
+            self._remove(cached - current)
+            missing = current - cached
+            if missing:
+                self._load_rows(self._active().filter(id__in=missing).values_list("id", "user_id", "vector", "norm"))
+
+    def sync(self):
+        """Bring the cache up to date with the shared generation counter."""
+        generation = _current_generation(self.model_name)
+        if generation == self._generation:
+            return
+        with self._lock:
+            if generation == self._generation:
+                return
+            if self._generation is None:
+                self._load_all()
+            else:
+                self._load_delta()
+            self._generation = generation
+            self._publish()
+
+    def view(self):
+        """Return ``(vectors, owner_ids)`` for all active embeddings.
+
+        ``vectors`` is an (N, d) float32 matrix, or an ANN index (or centroid)
+        snapshot over it when ``FACE_INDEX`` selects one; either can be passed straight to
+        ``FaceAdapter.match``. ``owner_ids[i]`` is the user id owning row ``i``.
+        """
+        self.sync()
+        return self._view
+
+    # -- local change notifications ----------------------------------------
+    def apply_embedding(self, emb_id: int, owner_id: int, token, norm, live: bool):
+        with self._lock:
+            if self._generation is None:
+                return
+            if live and self._in_scope(owner_id):
+                self._load_rows([(emb_id, owner_id, token, norm)])
+            else:
+                self._remove([emb_id])
+            self._publish()
+
+    def apply_owner(self, owner_id: int):
+        with self._lock:
+            if self._generation is None:
+                return
+            n = self._size
+            rows = np.flatnonzero(self._live[:n] & (self._owners[:n] == owner_id))
+            self._remove(self._ids[rows].tolist())
+            if self._base is not None:
+                self._mask_base(rows=np.flatnonzero(self._base.owners == owner_id))
+            self._load_rows(self._active().filter(user_id=owner_id).values_list("id", "user_id", "vector", "norm"))
+            self._publish()
+
+    @property
+    def generation(self) -> int | None:
+        return self._generation
+
+    def export(self):
+        """Return ``(vectors, ids, owners, watermark)`` of the in-memory rows, sorted by id."""
+        self.sync()
+        with self._lock:
+            n = self._size
+            order = np.argsort(self._ids[:n], kind="stable")
+            vectors = self._vectors if self._exact is None else self._exact
+            vectors = vectors[:n][order] if vectors is not None else np.empty((0, 0), dtype=np.float32)
+            return vectors, self._ids[:n][order], self._owners[:n][order], self._watermark
+
+    def note_generation(self, generation: int):
+        """Adopt ``generation`` if ours was the only change since the last sync."""
+        with self._lock:
+            if self._generation is not None and generation == self._generation + 1:
+                self._generation = generation
+
+
+class SharedGallery:
+    """Gallery attached to a shared-memory segment published by ``gallery_shm_loader``.
+
+    The loader process decrypts embeddings once for all workers on the host;
+    request workers only map its current segment, so ``view()`` costs no
+    database query and no decrypt. While no loader is publishing (not yet
+    started, or stopped) this falls back to an in-process :class:`Gallery`.
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._reader = SharedGalleryReader(model_name)
+        self._snapshot = None
+        self._view = None
+        self._fallback = None
+
+    def view(self):
+        snapshot = self._reader.current()
+        if snapshot is None:
+            if self._fallback is None:
+                self._fallback = Gallery(self.model_name)
+            return self._fallback.view()
+        if snapshot is not self._snapshot:
+            self._view = (snapshot.vectors, snapshot.owners)
+            self._snapshot = snapshot
+        return self._view
+
+    # The loader picks changes up through the generation counter; only the
+    # fallback gallery (if any) needs local notifications.
+    def apply_embedding(self, *args):
+        if self._fallback is not None:
+            self._fallback.apply_embedding(*args)
+
+    def apply_owner(self, owner_id: int):
+        if self._fallback is not None:
+            self._fallback.apply_owner(owner_id)
+
+    def note_generation(self, generation: int):
+        if self._fallback is not None:
+            self._fallback.note_generation(generation)
+
+
+def get_gallery(model_name: str, scope: tuple[str, int] | None = None) -> Gallery | SharedGallery:
+    """Return the process-wide gallery for ``model_name`` and ``scope``, creating it lazily.
+
+    ``FACE_GALLERY_SHM=true`` selects the shared-memory gallery for the
+    global (unscoped) gallery.
+    """
+    key = (model_name, scope)
+    gallery = _GALLERIES.get(key)
+    if gallery is None:
+        shared = scope is None and os.getenv("FACE_GALLERY_SHM", "").lower() == "true"
+        with _GALLERIES_LOCK:
+            gallery = _GALLERIES.get(key)
+            if gallery is None:
+                gallery = _GALLERIES[key] = SharedGallery(model_name) if shared else Gallery(model_name, scope=scope)
+    return gallery
+
+
+def _galleries_for(model_name: str) -> list:
+    return [gallery for (name, _scope), gallery in list(_GALLERIES.items()) if name == model_name]
+
+
+def user_view(model_name: str, user_id: int):
+    """``(vectors, owner_ids)`` for one user's active embeddings, for 1:1 verification.
+
+    Decrypts just that user's templates straight from the database, so the
+    shared gallery is neither loaded nor scanned.
+    """
+    rows = FaceEmbedding.objects.filter(
+        model_name=model_name, user_id=user_id, active=True, user__is_active=True
+    ).values_list("vector", "norm")
+    vectors = [vec for vec in (_decode(token, norm) for token, norm in rows) if vec is not None and vec.size]
+    vectors = [vec for vec in vectors if vec.shape == vectors[0].shape]
+    if not vectors:
+        return np.empty((0, 0), dtype=np.float32), np.empty((0,), dtype=np.int64)
+    return np.vstack(vectors), np.full((len(vectors),), user_id, dtype=np.int64)
+
+
+def match_engine(scope: tuple[str, int] | None = None, hint: str = "") -> GalleryEngine:
+    """``FacePipeline`` engine for a face flow.
+
+    With a login ``hint`` (email or sub) it verifies 1:1 against that user's
+    templates (none when the hint resolves to nobody), whatever the
+    ``scope``: this is how a user not yet in a tenant gallery gets in (see
+    ``oauth.views._grant``). Otherwise it searches the ``scope`` gallery,
+    exactly or through its index. Loads on a stage pool thread close that
+    thread's stale DB connections afterwards.
+    """
+    if hint:
+        def load(model_name):
+            user = resolve_login_hint(hint)
+            if user is None:
+                return np.empty((0, 0), dtype=np.float32), np.empty((0,), dtype=np.int64)
+            return user_view(model_name, user.pk)
+
+        return GalleryEngine(load, verify=True, release=close_old_connections)
+    return GalleryEngine(lambda model_name: get_gallery(model_name, scope).view(), release=close_old_connections)
+
+
+def bump_generation(model_name: str) -> int:
+    GalleryState.objects.get_or_create(model_name=model_name)
+    GalleryState.objects.filter(model_name=model_name).update(generation=F("generation") + 1)
+    generation = _current_generation(model_name)
+    for gallery in _galleries_for(model_name):
+        gallery.note_generation(generation)
+    return generation
+
+
+def embedding_changed(instance, deleted: bool = False):
+    """Apply a saved/deleted ``FaceEmbedding`` locally and announce it to other workers."""
+    user = getattr(instance, "user", None)
+    live = not deleted and instance.active and getattr(user, "is_active", True)
+    for gallery in _galleries_for(instance.model_name):
+        gallery.apply_embedding(instance.pk, instance.user_id, instance.vector, instance.norm, live)
+    bump_generation(instance.model_name)
+
+
+def owner_changed(user_id: int):
+    """Reload one user's rows after the user was (de)activated, deleted or changed tenant membership."""
+    qs = FaceEmbedding.objects.filter(user_id=user_id, active=True)
+    model_names = set(qs.values_list("model_name", flat=True))
+    # Touch the rows so other workers pick them up in their next delta.
+    qs.update(updated_at=timezone.now())
+    for gallery in list(_GALLERIES.values()):
+        gallery.apply_owner(user_id)
+    for model_name in model_names:
+        bump_generation(model_name)
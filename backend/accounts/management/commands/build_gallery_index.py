@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.gallery import Gallery
+from facekit.adapter import FaceAdapter
+
+
+class Command(BaseCommand):
+    help = "Load the gallery, build its ANN index (FACE_INDEX) and save it under FACE_INDEX_DIR."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model-name", default="", help="Defaults to FaceAdapter().model_name.")
+
+    def handle(self, *args, **options):
+        model_name = options["model_name"] or FaceAdapter().model_name
+        gallery = Gallery(model_name, background_index=False)
+        index, _owners = gallery.view()
+        path = gallery.save_index()
+        if path is None:
+            raise CommandError("nothing saved: set FACE_INDEX to a persistable index and FACE_INDEX_DIR, and check its min size")
+        self.stdout.write(f"{model_name}: saved index over {len(index)} rows to {path}")
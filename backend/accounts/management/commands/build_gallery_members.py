@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.gallery import bump_generation
+from accounts.models import GalleryState
+from oauth.models import AuthSession
+from orgs.models import GalleryMember, OAuthClient
+
+
+class Command(BaseCommand):
+    help = "Backfill scoped-gallery memberships from past face-verified authorizations (prior consents)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--client-id", action="append", default=[], help="OAuth client_id; repeatable. Defaults to all scoped clients.")
+
+    def handle(self, *args, **options):
+        clients = OAuthClient.objects.exclude(gallery_scope="global")
+        if options["client_id"]:
+            clients = OAuthClient.objects.filter(client_id__in=options["client_id"])
+            if len(clients) != len(set(options["client_id"])):
+                raise CommandError("unknown client_id")
+        created = 0
+        for client in clients:
+            # Org-scoped clients share the org's gallery: record org-level rows
+            member_client = client if client.gallery_scope == "client" else None
+            existing = GalleryMember.objects.filter(org_id=client.org_id, client=member_client)
+            user_ids = (
+                AuthSession.objects.filter(client=client, verified_face=True, user__isnull=False)
+                .values_list("user_id", flat=True)
+                .distinct()
+            )
+            # A null client never conflicts in the unique constraint; skip members explicitly
+            new_ids = user_ids.exclude(user_id__in=existing.values("user_id"))
+            members = [
+                GalleryMember(org_id=client.org_id, client=member_client, user_id=user_id, source="consent")
+                for user_id in new_ids
+            ]
+            # bulk_create skips the membership signals; bump generations once below.
+            GalleryMember.objects.bulk_create(members)
+            created += len(members)
+            self.stdout.write(f"{client.client_id}: {len(members)} new of {user_ids.count()} consenting users")
+        if created:
+            for model_name in GalleryState.objects.values_list("model_name", flat=True):
+                bump_generation(model_name)
@@ -0,0 +1,41 @@
+import os
+import signal
+import sys
+
+from django.core.management.base import BaseCommand
+
+from facekit import sidecar
+from facekit.adapter import FaceAdapter
+from facekit.detect import FaceDetector
+from facekit.env import env_int
+from facekit.liveness import LivenessChecker
+
+
+class Command(BaseCommand):
+    help = (
+        "Load FACE_DETECT_FUNC, FACE_LIVENESS_FUNC and FACE_EMBED_FUNC once and serve them to "
+        "request workers running with FACE_SIDECAR_SOCKET set."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socket", default=sidecar.socket_path(), help="Defaults to FACE_SIDECAR_SOCKET.")
+        parser.add_argument("--replicas", type=int, default=env_int("FACE_SIDECAR_REPLICAS", 1),
+                            help="Servers on <socket>.0 .. <socket>.N-1 when above 1 (FACE_SIDECAR_REPLICAS).")
+        parser.add_argument("--pin", action="store_true", help="Pin each replica to its own CPU.")
+
+    def handle(self, *args, **options):
+        path = options["socket"]
+        if not path:
+            self.stderr.write("--socket or FACE_SIDECAR_SOCKET is required")
+            sys.exit(1)
+        # The components below must load their models here, not call back into the sidecar
+        os.environ.pop("FACE_SIDECAR_SOCKET", None)
+        # Run the cleanup in serve() on SIGTERM too, not only on Ctrl-C.
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        self.stdout.write(f"face sidecar on {path} ({options['replicas']} replica(s))")
+        self.stdout.flush()
+        try:
+            sidecar.serve(path, lambda: (FaceAdapter(), FaceDetector(), LivenessChecker()),
+                          options["replicas"], options["pin"])
+        except KeyboardInterrupt:
+            pass
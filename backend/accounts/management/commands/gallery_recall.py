@@ -0,0 +1,26 @@
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.gallery import get_gallery
+from facekit.adapter import FaceAdapter
+
+
+class Command(BaseCommand):
+    help = "Report recall@k of the configured ANN gallery index against exact search."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model-name", default="", help="Defaults to FaceAdapter().model_name.")
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("-k", type=int, default=10)
+        parser.add_argument("--noise", type=float, default=0.05, help="Gaussian noise added to sampled gallery rows.")
+
+    def handle(self, *args, **options):
+        model_name = options["model_name"] or FaceAdapter().model_name
+        index, _owners = get_gallery(model_name).view()
+        if not hasattr(index, "recall"):
+            raise CommandError(f"no ANN index active for {model_name!r} (check FACE_INDEX and gallery size)")
+        rng = np.random.default_rng(0)
+        rows = rng.choice(len(index), size=min(options["queries"], len(index)), replace=False)
+        queries = index.vectors[rows] + rng.normal(0, options["noise"], size=(len(rows), index.vectors.shape[1]))
+        recall = index.recall(queries.astype(np.float32), k=options["k"])
+        self.stdout.write(f"{model_name}: recall@{options['k']} = {recall:.4f} over {len(rows)} queries, {len(index)} rows")
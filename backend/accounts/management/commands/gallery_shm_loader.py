@@ -0,0 +1,43 @@
+import signal
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from accounts.gallery import Gallery
+from facekit.adapter import FaceAdapter
+from facekit.shm import SharedGalleryWriter
+
+
+class Command(BaseCommand):
+    help = (
+        "Keep the decrypted gallery in shared memory for request workers running with "
+        "FACE_GALLERY_SHM=true. Segments are removed when this process exits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model-name", default="", help="Defaults to FaceAdapter().model_name.")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds between generation checks.")
+
+    def handle(self, *args, **options):
+        model_name = options["model_name"] or FaceAdapter().model_name
+        gallery = Gallery(model_name, use_snapshot=False, index_kind="exact", dtype="float32")
+        writer = SharedGalleryWriter(model_name)
+        published = None
+        # Run the cleanup below on SIGTERM too, not only on Ctrl-C.
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            while True:
+                close_old_connections()
+                gallery.sync()
+                if gallery.generation != published:
+                    vectors, ids, owners, watermark = gallery.export()
+                    name = writer.publish(vectors, ids, owners, watermark.timestamp(), gallery.generation)
+                    published = gallery.generation
+                    self.stdout.write(f"{model_name}: published {len(ids)} embeddings as {name}")
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,27 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.gallery import Gallery, snapshot_path
+from facekit.adapter import FaceAdapter
+from facekit.snapshot import GallerySnapshot, write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Decrypt the active gallery once and write it as a memory-mapped snapshot under FACE_GALLERY_SNAPSHOT_DIR."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model-name", default="", help="Defaults to FaceAdapter().model_name.")
+
+    def handle(self, *args, **options):
+        model_name = options["model_name"] or FaceAdapter().model_name
+        path = snapshot_path(model_name)
+        if path is None:
+            raise CommandError("FACE_GALLERY_SNAPSHOT_DIR is not set")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        gallery = Gallery(model_name, use_snapshot=False, index_kind="exact", dtype="float32")
+        vectors, ids, owners, watermark = gallery.export()
+        write_snapshot(path, model_name, vectors, ids, owners, watermark.timestamp(), gallery._generation or 0)
+        if not GallerySnapshot(path).verify():
+            raise CommandError(f"checksum mismatch after writing {path}")
+        self.stdout.write(f"{model_name}: wrote {len(ids)} embeddings to {path}")
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.gallery import bump_generation
+from accounts.models import FaceEmbedding
+from facekit.adapter import FaceAdapter
+from facekit.crypto import decrypt
+from facekit.quant import unpack_vector
+
+
+class Command(BaseCommand):
+    help = "Re-encrypt stored face embeddings as unit-length vectors with the current keys."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Also rewrite rows that are already normalized (e.g. after key rotation or a FACE_EMBED_STORE_DTYPE change).")
+        parser.add_argument("--model-name", default="", help="Only rewrite embeddings for this model_name.")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        adapter = FaceAdapter()
+        qs = FaceEmbedding.objects.all()
+        if not options["all"]:
+            qs = qs.filter(norm__isnull=True)
+        if options["model_name"]:
+            qs = qs.filter(model_name=options["model_name"])
+        updated = 0
+        failed = 0
+        model_names = set()
+        rows = qs.values_list("id", "model_name", "vector", "norm")
+        for fe_id, model_name, token, stored_norm in rows.iterator(chunk_size=options["batch_size"]):
+            try:
+                vec = unpack_vector(decrypt(bytes(token)))
+            except Exception:
+                failed += 1
+                continue
+            vector_enc, norm = adapter.encrypt_embedding(vec)
+            if stored_norm is not None:
+                # Already unit length: the stored norm is the raw embedding's, keep it
+                norm = stored_norm
+            # Row-level update: skips per-row signals, one generation bump per model below
+            FaceEmbedding.objects.filter(id=fe_id).update(vector=vector_enc, norm=norm, updated_at=timezone.now())
+            model_names.add(model_name)
+            updated += 1
+        for model_name in model_names:
+            bump_generation(model_name)
+        self.stdout.write(f"normalized {updated} embeddings ({failed} could not be decrypted)")
@@ -42,9 +42,27 @@ class FaceEmbedding(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     model_name = models.CharField(max_length=100)
     vector = models.BinaryField()
+    # L2 norm of the raw embedding; the stored vector is unit length.
+    # Null for rows written before normalization (see normalize_embeddings).
+    norm = models.FloatField(null=True, blank=True)
     active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Embedding({self.user_id}, {self.model_name})"
+
+
+class GalleryState(models.Model):
+    """Shared generation counter for the in-process face gallery cache.
+
+    Bumped whenever embeddings for ``model_name`` change so that other worker
+    processes know to pull the delta on their next request.
+    """
+
+    model_name = models.CharField(max_length=100, unique=True)
+    generation = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"GalleryState({self.model_name}, {self.generation})"
@@ -1,10 +1,8 @@
 from rest_framework import serializers
 from .models import User, FaceEmbedding
-from facekit.adapter import FaceAdapter
-from facekit.crypto import encrypt
-from PIL import Image
-import numpy as np
-from io import BytesIO
+from facekit.imaging import ImageDecodeError, decode_bgr
+from facekit.quant import unpack_vector
+from facekit.registry import components
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -17,17 +15,22 @@ class FaceEmbeddingSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = FaceEmbedding
-        fields = ["id", "user", "model_name", "vector", "active", "created_at", "updated_at", "image"]
-        read_only_fields = ["id", "created_at", "updated_at"]
+        fields = ["id", "user", "model_name", "vector", "norm", "active", "created_at", "updated_at", "image"]
+        read_only_fields = ["id", "norm", "created_at", "updated_at"]
 
     def create(self, validated_data):
         image = validated_data.pop("image", None)
+        adapter = components().adapter
         if image is not None:
-            adapter = FaceAdapter()
-            image_bytes = image.read()
-            img = Image.open(BytesIO(image_bytes)).convert("RGB")
-            image_bgr = np.array(img)[:, :, ::-1]
-            validated_data["vector"] = adapter.embed_and_encrypt(image_bgr)
+            try:
+                image_bgr = decode_bgr(image.read())
+            except ImageDecodeError as exc:
+                raise serializers.ValidationError({"image": str(exc)})
+            vector = adapter.embed(image_bgr)
         else:
-            validated_data["vector"] = encrypt(validated_data["vector"])
+            try:
+                vector = unpack_vector(bytes(validated_data["vector"]))
+            except ValueError:
+                raise serializers.ValidationError({"vector": "expected float32 or headered vector bytes"})
+        validated_data["vector"], validated_data["norm"] = adapter.encrypt_embedding(vector)
         return super().create(validated_data)
@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from orgs.models import GalleryMember
+from .models import User, FaceEmbedding
+from . import gallery
+
+
+@receiver(post_save, sender=FaceEmbedding)
+def face_embedding_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: gallery.embedding_changed(instance))
+
+
+@receiver(post_delete, sender=FaceEmbedding)
+def face_embedding_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: gallery.embedding_changed(instance, deleted=True))
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    # Remember the stored activation so user_saved can tell whether it changed
+    if instance.pk is None or (update_fields is not None and "is_active" not in update_fields):
+        instance._was_active = instance.is_active
+        return
+    instance._was_active = User.objects.filter(pk=instance.pk).values_list("is_active", flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created=False, **kwargs):
+    # Only activation changes matter; skip e.g. profile edits and last_login updates.
+    if created or getattr(instance, "_was_active", instance.is_active) == instance.is_active:
+        return
+    transaction.on_commit(lambda: gallery.owner_changed(instance.pk))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: gallery.owner_changed(instance.pk))
+
+
+@receiver(post_save, sender=GalleryMember)
+@receiver(post_delete, sender=GalleryMember)
+def gallery_member_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: gallery.owner_changed(instance.user_id))
@@ -0,0 +1,540 @@
+import io
+import os
+import tempfile
+from contextlib import nullcontext
+from io import StringIO
+from unittest import mock
+from urllib.parse import urlencode
+
+import numpy as np
+from PIL import Image
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import (
+    AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.utils import timezone
+
+from . import gallery, views_face, views_face_async
+from .auth import resolve_login_hint
+from .gallery import Gallery, _current_generation, bump_generation, get_gallery, match_engine, user_view
+from .models import FaceEmbedding, User
+from .uploads import crop_hint, read_upload, request_fields
+from facekit import registry
+from facekit.adapter import FaceAdapter
+from facekit.crypto import decrypt, encrypt
+from facekit.imaging import decode_bgr
+from facekit.index import CentroidSnapshot, HNSWSnapshot, exact_search
+from facekit.quant import pack_vector, unpack_vector
+from facekit.snapshot import SnapshotOverlay
+from oauth import views as oauth_views, views_async as oauth_views_async
+from oauth.models import AuthSession
+from orgs.models import GalleryMember, OAuthClient, Organization
+
+
+MODEL = "test-model"
+
+# Deterministic embeddings; distinct noise images score about 0.7 against each other
+FACE_ENV = {
+    "FACE_EMBED_FUNC": "facekit.devfuncs:robust_embed",
+    "FACE_EMBED_MODEL_NAME": MODEL,
+    "FACE_MATCH_THRESHOLD": "0.97",
+}
+
+
+def _png(seed: int | None = None) -> bytes:
+    """A textured noise image, or a black one (which fails liveness) when ``seed`` is None."""
+    if seed is None:
+        arr = np.zeros((64, 64, 3), dtype=np.uint8)
+    else:
+        arr = (np.random.default_rng(seed).random((64, 64, 3)) * 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(arr).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _unit(seed: int, dim: int = 16) -> np.ndarray:
+    vec = np.random.default_rng(seed).normal(size=dim)
+    return vec / np.linalg.norm(vec)
+
+
+def _owners(view) -> list[int]:
+    return sorted(set(view[1].tolist()))
+
+
+class GalleryTestMixin:
+    def setUp(self):
+        super().setUp()
+        gallery._GALLERIES.clear()
+        self.addCleanup(gallery._GALLERIES.clear)
+        self.adapter = FaceAdapter()
+
+    def committed(self):
+        """Run the gallery signals' on_commit hooks on leaving the block."""
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def add_embedding(self, user, vector, model_name: str = MODEL):
+        token, norm = self.adapter.encrypt_embedding(vector)
+        with self.committed():
+            return FaceEmbedding.objects.create(user=user, model_name=model_name, vector=token, norm=norm)
+
+
+class GalleryCacheTests(GalleryTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user(email="alice@example.com", display_name="Alice")
+        self.bob = User.objects.create_user(email="bob@example.com", display_name="Bob")
+        self.add_embedding(self.alice, _unit(0))
+
+    def test_enrollment_is_applied_to_the_cached_gallery(self):
+        cached = get_gallery(MODEL)
+        self.assertEqual(_owners(cached.view()), [self.alice.pk])
+        self.add_embedding(self.bob, _unit(1))
+        self.assertEqual(_owners(cached.view()), [self.alice.pk, self.bob.pk])
+        np.testing.assert_allclose(cached.view()[0][1], _unit(1), atol=1e-6)
+
+    def test_deactivated_embedding_leaves_the_gallery(self):
+        cached = get_gallery(MODEL)
+        emb = self.add_embedding(self.bob, _unit(1))
+        self.assertEqual(len(cached.view()[0]), 2)
+        emb.active = False
+        with self.committed():
+            emb.save(update_fields=["active", "updated_at"])
+        self.assertEqual(_owners(cached.view()), [self.alice.pk])
+
+    def test_deactivated_user_leaves_the_gallery(self):
+        cached = get_gallery(MODEL)
+        self.add_embedding(self.bob, _unit(1))
+        self.bob.is_active = False
+        with self.committed():
+            self.bob.save()
+        self.assertEqual(_owners(cached.view()), [self.alice.pk])
+        self.bob.is_active = True
+        with self.committed():
+            self.bob.save(update_fields=["is_active"])
+        self.assertEqual(_owners(cached.view()), [self.alice.pk, self.bob.pk])
+
+    def test_profile_edits_leave_the_gallery_alone(self):
+        self.add_embedding(self.bob, _unit(1))
+        generation = _current_generation(MODEL)
+        stamp = FaceEmbedding.objects.get(user=self.bob).updated_at
+        self.bob.display_name = "Robert"
+        with self.committed():
+            self.bob.save()
+        with self.committed():
+            self.bob.save(update_fields=["last_login"])
+        self.assertEqual(_current_generation(MODEL), generation)
+        self.assertEqual(FaceEmbedding.objects.get(user=self.bob).updated_at, stamp)
+
+    def test_other_workers_catch_up_through_the_generation(self):
+        # A gallery outside the registry stands in for another worker's cache
+        other = Gallery(MODEL)
+        self.assertEqual(len(other.view()[0]), 1)
+        emb = self.add_embedding(self.bob, _unit(1))
+        self.assertEqual(_owners(other.view()), [self.alice.pk, self.bob.pk])
+        # Bulk updates skip the signals; the next generation bump publishes them
+        FaceEmbedding.objects.filter(pk=emb.pk).update(active=False)
+        self.assertEqual(len(other.view()[0]), 2)
+        bump_generation(MODEL)
+        self.assertEqual(_owners(other.view()), [self.alice.pk])
+
+    def test_galleries_are_per_model(self):
+        self.add_embedding(self.bob, _unit(1, dim=8), model_name="other-model")
+        self.assertEqual(_owners(get_gallery(MODEL).view()), [self.alice.pk])
+        self.assertEqual(_owners(get_gallery("other-model").view()), [self.bob.pk])
+
+
+class NormalizeEmbeddingsTests(GalleryTestMixin, TestCase):
+    def test_rerunning_with_all_keeps_the_raw_norm(self):
+        user = User.objects.create_user(email="carol@example.com", display_name="Carol")
+        raw = 3.0 * _unit(2)
+        # A legacy row: raw vector, no norm recorded
+        emb = FaceEmbedding.objects.create(user=user, model_name=MODEL, vector=encrypt(pack_vector(raw)))
+        for flags in ([], ["--all"], ["--all"]):
+            call_command("normalize_embeddings", *flags, stdout=StringIO())
+            emb.refresh_from_db()
+            self.assertAlmostEqual(emb.norm, 3.0, places=5)
+            np.testing.assert_allclose(unpack_vector(decrypt(bytes(emb.vector))), _unit(2), atol=1e-6)
+
+
+class OfflineIndexTests(GalleryTestMixin, TestCase):
+    def test_hnsw_is_served_only_from_a_prebuilt_graph(self):
+        for i in range(30):
+            user = User.objects.create_user(email=f"user{i}@example.com", display_name=f"User {i}")
+            self.add_embedding(user, _unit(i))
+        with tempfile.TemporaryDirectory() as directory, mock.patch.dict(
+                os.environ, {"FACE_INDEX": "hnsw", "FACE_HNSW_MIN_SIZE": "20", "FACE_INDEX_DIR": directory}):
+            self.assertIsInstance(Gallery(MODEL).view()[0], np.ndarray)
+            call_command("build_gallery_index", "--model-name", MODEL, stdout=StringIO())
+            vectors, owners = Gallery(MODEL).view()
+            self.assertIsInstance(vectors, HNSWSnapshot)
+            self.assertEqual(owners[vectors.search(_unit(7), 1).index], User.objects.get(email="user7@example.com").pk)
+
+
+class CentroidGalleryTests(GalleryTestMixin, TestCase):
+    def test_templates_are_grouped_per_user(self):
+        alice = User.objects.create_user(email="alice@example.com", display_name="Alice")
+        bob = User.objects.create_user(email="bob@example.com", display_name="Bob")
+        self.add_embedding(alice, _unit(0))
+        self.add_embedding(alice, _unit(1))
+        bob_emb = self.add_embedding(bob, _unit(2))
+        gallery = Gallery(MODEL, index_kind="centroid")
+        vectors, owners = gallery.view()
+        self.assertIsInstance(vectors, CentroidSnapshot)
+        self.assertEqual(sorted(vectors.centroid_owners.tolist()), [alice.pk, bob.pk])
+        self.assertEqual(owners[vectors.search(_unit(1), 1).index], alice.pk)
+        bob_emb.active = False
+        with self.committed():
+            bob_emb.save(update_fields=["active", "updated_at"])
+        gallery.apply_embedding(bob_emb.pk, bob.pk, bob_emb.vector, bob_emb.norm, False)
+        self.assertEqual(gallery.view()[0].centroid_owners.tolist(), [alice.pk])
+
+
+class GallerySnapshotTests(GalleryTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.dict(os.environ, {"FACE_GALLERY_SNAPSHOT_DIR": directory.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.alice = User.objects.create_user(email="alice@example.com", display_name="Alice")
+        self.bob = User.objects.create_user(email="bob@example.com", display_name="Bob")
+        self.alice_emb = self.add_embedding(self.alice, _unit(0))
+        call_command("gallery_snapshot", "--model-name", MODEL, stdout=StringIO())
+
+    def test_gallery_serves_the_snapshot_plus_later_changes(self):
+        self.add_embedding(self.bob, _unit(1))
+        vectors, owners = Gallery(MODEL).view()
+        self.assertIsInstance(vectors, SnapshotOverlay)
+        self.assertEqual(_owners((vectors, owners)), [self.alice.pk, self.bob.pk])
+        self.assertEqual(owners[vectors.search(_unit(1), 1).index], self.bob.pk)
+
+    def test_rows_removed_since_the_snapshot_are_masked(self):
+        self.alice_emb.active = False
+        with self.committed():
+            self.alice_emb.save(update_fields=["active", "updated_at"])
+        vectors, _owners = Gallery(MODEL).view()
+        self.assertEqual(len(vectors), 0)
+        self.assertEqual(vectors.search(_unit(0), 1).index, -1)
+
+
+class HintVerifyTests(GalleryTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user(email="alice@example.com", display_name="Alice")
+        self.carol = User.objects.create_user(email="carol@example.com", display_name="Carol")
+        self.add_embedding(self.alice, _unit(0))
+        self.add_embedding(self.carol, _unit(2))
+        self.add_embedding(self.carol, _unit(3))
+
+    def test_hint_resolves_by_email_or_sub(self):
+        self.assertEqual(resolve_login_hint(" carol@example.com "), self.carol)
+        self.assertEqual(resolve_login_hint(str(self.carol.pk)), self.carol)
+        self.assertIsNone(resolve_login_hint("nobody@example.com"))
+        self.carol.is_active = False
+        self.carol.save()
+        self.assertIsNone(resolve_login_hint("carol@example.com"))
+
+    def test_user_view_holds_only_that_user(self):
+        vectors, owners = user_view(MODEL, self.carol.pk)
+        self.assertEqual(vectors.shape, (2, 16))
+        self.assertEqual(owners.tolist(), [self.carol.pk, self.carol.pk])
+        self.assertEqual(user_view(MODEL, 0)[0].shape, (0, 0))
+
+    def test_login_hint_verifies_against_one_user(self):
+        engine = match_engine(hint="carol@example.com")
+        self.assertTrue(engine.verify)
+        self.assertEqual(_owners(engine.candidates(MODEL)), [self.carol.pk])
+        self.assertEqual(_owners(match_engine(hint=str(self.carol.pk)).candidates(MODEL)), [self.carol.pk])
+        self.assertEqual(_owners(match_engine(hint="nobody@example.com").candidates(MODEL)), [])
+        # The shared gallery is never loaded for a hinted login
+        self.assertNotIn((MODEL, None), gallery._GALLERIES)
+
+
+class ScopedGalleryTests(GalleryTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user(email="alice@example.com", display_name="Alice")
+        self.bob = User.objects.create_user(email="bob@example.com", display_name="Bob")
+        self.carol = User.objects.create_user(email="carol@example.com", display_name="Carol")
+        for seed, user in enumerate((self.alice, self.bob, self.carol)):
+            self.add_embedding(user, _unit(seed))
+        org = Organization.objects.create(name="Org", owner=self.alice)
+        self.client_app = OAuthClient.objects.create(org=org, name="RP", client_secret_hash="x",
+                                                     redirect_uris=["https://rp.example/cb"], gallery_scope="client")
+        self.org = org
+        with self.committed():
+            GalleryMember.objects.create(org=org, client=self.client_app, user=self.bob)
+
+    def test_scoped_gallery_holds_only_members(self):
+        scope = self.client_app.gallery_key()
+        self.assertEqual(_owners(get_gallery(MODEL, scope).view()), [self.bob.pk])
+        self.assertEqual(_owners(get_gallery(MODEL).view()), [self.alice.pk, self.bob.pk, self.carol.pk])
+
+    def test_org_gallery_holds_only_org_level_members(self):
+        with self.committed():
+            GalleryMember.objects.create(org=self.org, client=None, user=self.carol)
+        self.assertEqual(_owners(get_gallery(MODEL, ("org", self.org.pk)).view()), [self.carol.pk])
+        self.assertEqual(_owners(get_gallery(MODEL, self.client_app.gallery_key()).view()), [self.bob.pk])
+
+    def test_membership_changes_update_the_scoped_gallery(self):
+        scoped = get_gallery(MODEL, self.client_app.gallery_key())
+        self.assertEqual(_owners(scoped.view()), [self.bob.pk])
+        with self.committed():
+            GalleryMember.objects.create(org=self.org, client=self.client_app, user=self.carol)
+        self.assertEqual(_owners(scoped.view()), [self.bob.pk, self.carol.pk])
+        with self.committed():
+            GalleryMember.objects.filter(user=self.bob).delete()
+        self.assertEqual(_owners(scoped.view()), [self.carol.pk])
+
+    def test_login_hint_verifies_outside_the_scope(self):
+        scope = self.client_app.gallery_key()
+        self.assertEqual(_owners(match_engine(scope, "bob@example.com").candidates(MODEL)), [self.bob.pk])
+        self.assertEqual(_owners(match_engine(scope, "carol@example.com").candidates(MODEL)), [self.carol.pk])
+        self.assertEqual(_owners(match_engine(scope, "nobody@example.com").candidates(MODEL)), [])
+
+    def test_backfill_records_org_level_members_once(self):
+        org_app = OAuthClient.objects.create(org=self.org, name="Org RP", client_secret_hash="x",
+                                             redirect_uris=["https://rp.example/cb"], gallery_scope="org")
+        for user in (self.alice, self.carol):
+            AuthSession.objects.create(client=org_app, user=user, state="s", nonce="", code_challenge="",
+                                       code_challenge_method="", redirect_uri="https://rp.example/cb", scope="",
+                                       expires_at=timezone.now(), verified_face=True)
+        for _ in range(2):
+            call_command("build_gallery_members", "--client-id", org_app.client_id, stdout=StringIO())
+        org_rows = GalleryMember.objects.filter(org=self.org, client=None)
+        self.assertEqual(sorted(org_rows.values_list("user_id", flat=True)), [self.alice.pk, self.carol.pk])
+
+
+class FaceViewTestMixin(GalleryTestMixin):
+    """Face views run with deterministic embeddings; the pipeline loads galleries on pool threads."""
+
+    def setUp(self):
+        self.addCleanup(registry.reload)
+        self.enterContext(mock.patch.dict(os.environ, FACE_ENV))
+        registry.reload()
+        super().setUp()
+        self.alice = User.objects.create_user(email="alice@example.com", display_name="Alice")
+
+    def committed(self):
+        # Without a wrapping transaction the hooks have already run
+        return nullcontext()
+
+    def enroll(self, user, seed: int):
+        adapter = registry.components().adapter
+        return self.add_embedding(user, adapter.embed(decode_bgr(_png(seed))))
+
+    def request(self, factory, data: dict, image: bytes, user=None, raw: bool = False):
+        """A multipart upload, or with ``raw`` an ``image/png`` body with the fields in the query string."""
+        if raw:
+            request = factory.post(f"/?{urlencode(data)}", image, content_type="image/png")
+        else:
+            request = factory.post("/", {**data, "image": SimpleUploadedFile("face.png", image, "image/png")})
+        request.session = SessionStore()
+        request.user = user or AnonymousUser()
+
+        async def auser():
+            return request.user
+
+        request.auser = auser
+        return request
+
+
+class FaceLoginViewTests(FaceViewTestMixin, TransactionTestCase):
+    def cases(self):
+        """``(image, login_hint, status, body)`` for face_login, with Alice enrolled from image 0."""
+        return [
+            (b"not an image", "", 400, b"invalid image upload"),
+            (_png(), "", 400, b"liveness failed"),
+            (_png(5), "", 404, b"user not found"),
+            (_png(5), "alice@example.com", 404, b"user not found"),
+            (_png(0), "nobody@example.com", 404, b"user not found"),
+            (_png(0), "", 200, b'"authenticated": true'),
+            (_png(0), "alice@example.com", 200, b'"authenticated": true'),
+        ]
+
+    def test_empty_gallery(self):
+        response = views_face.face_login(self.request(RequestFactory(), {}, _png(0)))
+        self.assertEqual((response.status_code, response.content), (400, b"no enrolled faces"))
+
+    async def test_empty_gallery_async(self):
+        response = await views_face_async.face_login(self.request(AsyncRequestFactory(), {}, _png(0)))
+        self.assertEqual((response.status_code, response.content), (400, b"no enrolled faces"))
+
+    def test_rejections(self):
+        self.enroll(self.alice, 0)
+        for image, hint, status, body in self.cases():
+            with self.subTest(hint=hint, status=status, body=body):
+                response = views_face.face_login(self.request(RequestFactory(), {"login_hint": hint}, image))
+                self.assertEqual(response.status_code, status)
+                self.assertIn(body, response.content)
+
+    async def test_rejections_async(self):
+        await sync_to_async(self.enroll)(self.alice, 0)
+        for image, hint, status, body in self.cases():
+            with self.subTest(hint=hint, status=status, body=body):
+                request = self.request(AsyncRequestFactory(), {"login_hint": hint}, image)
+                response = await views_face_async.face_login(request)
+                self.assertEqual(response.status_code, status)
+                self.assertIn(body, response.content)
+
+
+class FaceEnrollViewTests(FaceViewTestMixin, TransactionTestCase):
+    def test_rejections(self):
+        for image, body in ((b"not an image", b"invalid image upload"), (_png(), b"liveness failed")):
+            with self.subTest(body=body):
+                response = views_face.face_enroll(self.request(RequestFactory(), {}, image, self.alice))
+                self.assertEqual((response.status_code, response.content), (400, body))
+        self.assertFalse(FaceEmbedding.objects.exists())
+        response = views_face.face_enroll(self.request(RequestFactory(), {}, _png(0), self.alice))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(FaceEmbedding.objects.filter(user=self.alice).count(), 1)
+
+    async def test_rejections_async(self):
+        for image, body in ((b"not an image", b"invalid image upload"), (_png(), b"liveness failed")):
+            with self.subTest(body=body):
+                request = self.request(AsyncRequestFactory(), {}, image, self.alice)
+                response = await views_face_async.face_enroll(request)
+                self.assertEqual((response.status_code, response.content), (400, body))
+        self.assertFalse(await FaceEmbedding.objects.aexists())
+        response = await views_face_async.face_enroll(self.request(AsyncRequestFactory(), {}, _png(0), self.alice))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await FaceEmbedding.objects.filter(user=self.alice).acount(), 1)
+
+    def test_reenroll_runs_the_same_stages(self):
+        self.enroll(self.alice, 0)
+        response = views_face.face_reenroll(self.request(RequestFactory(), {}, _png(), self.alice))
+        self.assertEqual((response.status_code, response.content), (400, b"liveness failed"))
+        self.assertEqual(FaceEmbedding.objects.filter(user=self.alice, active=True).count(), 1)
+        response = views_face.face_reenroll(self.request(RequestFactory(), {}, _png(1), self.alice))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(FaceEmbedding.objects.filter(user=self.alice, active=True).count(), 1)
+        self.assertEqual(FaceEmbedding.objects.filter(user=self.alice).count(), 2)
+
+
+class FaceSignupViewTests(FaceViewTestMixin, TransactionTestCase):
+    def test_undecodable_image_creates_no_account(self):
+        data = {"email": "new@example.com", "display_name": "New"}
+        response = views_face.face_signup(self.request(RequestFactory(), data, b"not an image"))
+        self.assertEqual((response.status_code, response.content), (400, b"invalid image upload"))
+        self.assertFalse(User.objects.filter(email="new@example.com").exists())
+        response = views_face.face_signup(self.request(RequestFactory(), data, _png(0)))
+        self.assertEqual(response.status_code, 201)
+
+    def test_password_is_refused_in_the_query_string(self):
+        data = {"email": "new@example.com", "display_name": "New", "password": "hunter22"}
+        response = views_face.face_signup(self.request(RequestFactory(), data, _png(0), raw=True))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(email="new@example.com").exists())
+        del data["password"]
+        response = views_face.face_signup(self.request(RequestFactory(), data, _png(0), raw=True))
+        self.assertEqual(response.status_code, 201)
+
+
+class AuthorizeVerifyViewTests(FaceViewTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.bob = User.objects.create_user(email="bob@example.com", display_name="Bob")
+        self.enroll(self.alice, 0)
+        self.enroll(self.bob, 1)
+        org = Organization.objects.create(name="Org", owner=self.alice)
+        self.client_app = OAuthClient.objects.create(org=org, name="RP", client_secret_hash="x",
+                                                     redirect_uris=["https://rp.example/cb"], gallery_scope="client")
+        GalleryMember.objects.create(org=org, client=self.client_app, user=self.bob)
+
+    def data(self, hint: str = "") -> dict:
+        return {"client_id": self.client_app.client_id, "redirect_uri": "https://rp.example/cb",
+                "state": "s", "login_hint": hint}
+
+    def cases(self):
+        """``(image, login_hint, status, body)`` in order; only Bob starts in the client's gallery."""
+        return [
+            (_png(5), "", 400, b"face not recognized"),
+            (_png(0), "", 400, b"face not recognized"),
+            (_png(1), "alice@example.com", 400, b"face not recognized"),
+            (_png(1), "", 302, b""),
+            (_png(1), "bob@example.com", 302, b""),
+            # A verified login_hint is Alice's consent: she joins the client's gallery
+            (_png(0), "alice@example.com", 302, b""),
+            (_png(0), "", 302, b""),
+        ]
+
+    def test_consent_grows_the_scoped_gallery(self):
+        self.check_cases(raw=False)
+
+    def test_raw_image_body_reads_params_from_the_query(self):
+        self.check_cases(raw=True)
+
+    async def test_consent_grows_the_scoped_gallery_async(self):
+        for image, hint, status, body in self.cases():
+            with self.subTest(hint=hint, status=status, body=body):
+                request = self.request(AsyncRequestFactory(), self.data(hint), image)
+                response = await oauth_views_async.authorize_verify(request)
+                self.assertEqual((response.status_code, response.content), (status, body))
+        members = GalleryMember.objects.filter(client=self.client_app).values_list("user_id", "source")
+        self.assertEqual(sorted([row async for row in members]),
+                         sorted([(self.bob.pk, "allowlist"), (self.alice.pk, "consent")]))
+
+    def check_cases(self, raw: bool):
+        for image, hint, status, body in self.cases():
+            with self.subTest(hint=hint, status=status, body=body):
+                request = self.request(RequestFactory(), self.data(hint), image, raw=raw)
+                response = oauth_views.authorize_verify(request)
+                self.assertEqual((response.status_code, response.content), (status, body))
+        members = GalleryMember.objects.filter(client=self.client_app).values_list("user_id", "source")
+        self.assertEqual(sorted(members), sorted([(self.bob.pk, "allowlist"), (self.alice.pk, "consent")]))
+
+
+class UploadTests(SimpleTestCase):
+    def test_raw_body_is_returned_as_sent(self):
+        request = RequestFactory().post("/?login_hint=a%40example.com", b"jpeg bytes", content_type="image/jpeg")
+        self.assertEqual(read_upload(request), b"jpeg bytes")
+        self.assertEqual(request_fields(request)["login_hint"], "a@example.com")
+
+    def test_empty_or_oversized_raw_bodies_are_refused(self):
+        factory = RequestFactory()
+        self.assertEqual(read_upload(factory.post("/", b"", content_type="image/webp")).content, b"image required")
+        with override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=4):
+            response = read_upload(factory.post("/", b"12345", content_type="image/jpeg"))
+        self.assertEqual(response.content, b"image too large")
+
+    def test_json_data_url_is_still_accepted(self):
+        request = RequestFactory().post("/", {"image": "data:image/png;base64,aGVsbG8=", "login_hint": "x"},
+                                        content_type="application/json")
+        self.assertEqual(read_upload(request), b"hello")
+        self.assertEqual(request_fields(request)["login_hint"], "x")
+
+    def test_crop_hint(self):
+        cases = [
+            ({"face_bbox": "10,20,224,224", "face_score": "0.93"}, (True, 0.93)),
+            ({"face_bbox": "10,20,224,224"}, (True, None)),
+            ({"face_bbox": "10,20,224,224", "face_score": "high"}, (True, None)),
+            ({"face_bbox": "10,20,0,224", "face_score": "0.93"}, (False, None)),
+            ({"face_bbox": "10,20,224", "face_score": "0.93"}, (False, None)),
+            ({"face_score": "0.93"}, (False, None)),
+        ]
+        for fields, expected in cases:
+            with self.subTest(fields=fields):
+                request = RequestFactory().post(f"/?{urlencode(fields)}", b"jpeg", content_type="image/jpeg")
+                self.assertEqual(crop_hint(request), expected)
+
+
+class QuantizedGalleryTests(GalleryTestMixin, TestCase):
+    def test_quantized_search_matches_exact_search(self):
+        users = [User.objects.create_user(email=f"user{i}@example.com", display_name=f"User {i}") for i in range(20)]
+        for i, user in enumerate(users):
+            self.add_embedding(user, _unit(i))
+        exact_vectors, exact_owners = Gallery(MODEL, dtype="float32").view()
+        for dtype in ("float16", "int8"):
+            vectors, owners = Gallery(MODEL, dtype=dtype).view()
+            self.assertEqual(vectors.codes.dtype, np.dtype(dtype))
+            for i in range(20):
+                probe = _unit(i) + 0.3 * _unit(100 + i)
+                res, exact = vectors.search(probe, 2), exact_search(exact_vectors, probe, 2)
+                with self.subTest(dtype=dtype, probe=i):
+                    self.assertEqual(owners[res.index], exact_owners[exact.index])
+                    self.assertAlmostEqual(res.score, exact.score, places=6)
@@ -0,0 +1,95 @@
+import base64
+import json
+
+from django.conf import settings
+from django.http import HttpResponseBadRequest
+
+
+# Content types accepted as a raw image body (``fetch(url, {body: blob})``)
+IMAGE_CONTENT_TYPES = ("image/jpeg", "image/webp", "image/png", "application/octet-stream")
+
+
+def _content_type(request) -> str:
+    return request.META.get("CONTENT_TYPE", "").split(";")[0].strip().lower()
+
+
+def is_raw_image(request) -> bool:
+    return _content_type(request) in IMAGE_CONTENT_TYPES
+
+
+def request_fields(request):
+    """Non-image fields of a face upload.
+
+    Multipart and urlencoded forms read ``request.POST``, raw image bodies
+    the query string, anything else is parsed as a JSON object (once per
+    request).
+    """
+    fields = getattr(request, "_face_fields", None)
+    if fields is not None:
+        return fields
+    ctype = _content_type(request)
+    if is_raw_image(request):
+        fields = request.GET
+    elif ctype.startswith("multipart/") or ctype == "application/x-www-form-urlencoded":
+        fields = request.POST
+    else:
+        try:
+            fields = json.loads(request.body.decode() or "{}")
+        except Exception:
+            fields = {}
+        if not isinstance(fields, dict):
+            fields = {}
+    request._face_fields = fields
+    return fields
+
+
+def read_upload(request):
+    """The uploaded face image, still encoded, for ``FacePipeline``'s decode stage.
+
+    Accepts a raw ``image/jpeg``/``image/webp``/``image/png`` body, a
+    multipart file part ``image``, or (legacy) a base64 data URL in the
+    ``image`` field of a JSON or form body. Raw bodies are capped at
+    ``DATA_UPLOAD_MAX_MEMORY_SIZE`` like JSON bodies are. Returns bytes or
+    the UploadedFile, or an HttpResponseBadRequest.
+    """
+    if is_raw_image(request):
+        try:
+            length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = 0
+        if not length:
+            return HttpResponseBadRequest("image required")
+        limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        if limit is not None and length > limit:
+            return HttpResponseBadRequest("image too large")
+        return request.read()
+    if request.FILES.get("image"):
+        return request.FILES["image"]
+    image_b64 = request_fields(request).get("image")
+    if image_b64 and isinstance(image_b64, str):
+        try:
+            return base64.b64decode(image_b64.split(",")[-1])
+        except Exception:
+            return HttpResponseBadRequest("invalid image data")
+    return HttpResponseBadRequest("image required")
+
+
+def crop_hint(request) -> tuple[bool, float | None]:
+    """Client crop metadata sent by CameraCapture: ``(precropped, score)``.
+
+    ``face_bbox`` (``x,y,w,h`` of the padded crop in the camera frame) marks
+    the upload as a pre-cropped face; ``face_score`` is the client
+    detector's confidence when it reports one.
+    """
+    data = request_fields(request)
+    try:
+        x, y, w, h = (float(v) for v in str(data.get("face_bbox") or "").split(","))
+    except ValueError:
+        return False, None
+    if w <= 0 or h <= 0:
+        return False, None
+    try:
+        score = float(data.get("face_score"))
+    except (TypeError, ValueError):
+        score = None
+    return True, score
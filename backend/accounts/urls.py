@@ -1,20 +1,23 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
 from .views import UserViewSet, FaceEmbeddingViewSet
-from . import views_web, views_face, views_api
+from . import views_web, views_face, views_face_async, views_api
 
 router = DefaultRouter()
 router.register(r"users", UserViewSet, basename="user")
 router.register(r"embeddings", FaceEmbeddingViewSet, basename="embedding")
 
+face_views = views_face_async if settings.FACE_ASYNC_VIEWS else views_face
+
 urlpatterns = [
     path("signup/", views_web.signup, name="account-signup"),
     path("profile/", views_web.profile, name="account-profile"),
     # Face auth endpoints
-    path("face/login", views_face.face_login, name="account-face-login"),
+    path("face/login", face_views.face_login, name="account-face-login"),
     path("face/signup", views_face.face_signup, name="account-face-signup"),
-    path("face/enroll", views_face.face_enroll, name="account-face-enroll"),
+    path("face/enroll", face_views.face_enroll, name="account-face-enroll"),
     path("face/reenroll", views_face.face_reenroll, name="account-face-reenroll"),
     # Profile and email verification APIs
     path("profile.json", views_api.profile_api, name="account-profile-api"),
@@ -1,188 +1,118 @@
-import base64
-import io
-import json
 import os
 
-import numpy as np
-from PIL import Image
 from django.contrib.auth import login
-from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse, HttpResponseBadRequest
-from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 
 from .models import User, FaceEmbedding
 from .auth import login_required_json
-from facekit.adapter import FaceAdapter
-from facekit.liveness import LivenessChecker
-from facekit.detect import FaceDetector
-from facekit.crypto import encrypt, decrypt
-import logging
-import logging
+from .gallery import match_engine
+from .uploads import crop_hint, is_raw_image, read_upload, request_fields
+from facekit.pipeline import ENROLL_STAGES, MATCH_STAGES, FacePipeline, Rejected
 
 
-def _read_image_from_request(request):
-    """Extract an image from JSON data URL or multipart file field 'image'.
+def _login_hint(request) -> str:
+    """Optional ``login_hint`` (or ``email``) field; see ``uploads.request_fields``."""
+    data = request_fields(request)
+    return str(data.get("login_hint") or data.get("email") or "").strip()
 
-    Returns a PIL Image in RGB or an HttpResponseBadRequest.
-    """
-    # Multipart form with file
-    if request.FILES.get("image"):
-        try:
-            return Image.open(request.FILES["image"]).convert("RGB")
-        except Exception:
-            return HttpResponseBadRequest("invalid image upload")
-    # JSON with data URL
+
+def _debug() -> bool:
+    return os.getenv("FACE_DEBUG", "").lower() == "true"
+
+
+def _not_found(result=None):
+    payload = {"detail": "user not found"}
+    if result is not None and _debug():
+        payload["debug"] = result.debug()
+    return JsonResponse(payload, status=404)
+
+
+def _enroll_vector(request, upload, name: str):
+    """Run the enrollment stages on ``upload``; returns ``(adapter, vector)`` or an HttpResponseBadRequest."""
+    precropped, client_score = crop_hint(request)
+    pipeline = FacePipeline(ENROLL_STAGES, name=name)
     try:
-        data = json.loads(request.body.decode() or "{}")
-    except Exception:
-        data = {}
-    image_b64 = data.get("image")
-    if image_b64 and isinstance(image_b64, str):
-        try:
-            raw = base64.b64decode(image_b64.split(",")[-1])
-            return Image.open(io.BytesIO(raw)).convert("RGB")
-        except Exception:
-            return HttpResponseBadRequest("invalid image data")
-    return HttpResponseBadRequest("image required")
-
-
-def _gallery_vectors(adapter: FaceAdapter):
-    """Return (embeddings, owners) for all active FaceEmbeddings matching adapter.model_name (decrypted)."""
-    embeddings = []
-    owners = []
-    qs = FaceEmbedding.objects.filter(active=True, model_name=adapter.model_name).select_related("user")
-    for fe in qs:
-        try:
-            plaintext = decrypt(bytes(fe.vector))
-            vec = np.frombuffer(plaintext, dtype=np.float32)
-            embeddings.append(vec)
-            owners.append(fe.user)
-        except Exception:
-            continue
-    return embeddings, owners
+        res = pipeline.run(upload, precropped=precropped, client_score=client_score)
+    except Rejected as exc:
+        return HttpResponseBadRequest(exc.reason)
+    return pipeline.adapter, res.vector
+
+
+def _login_response(user, res):
+    resp = {
+        "authenticated": True,
+        "user": {"id": user.id, "email": user.email, "display_name": user.display_name},
+        "score": res.score,
+    }
+    if _debug():
+        resp["debug"] = res.debug()
+    return JsonResponse(resp)
 
 
 @csrf_exempt
 def face_login(request):
     if request.method != "POST":
         return HttpResponseBadRequest("POST required")
-    # Single-image JSON or multipart
-    img = _read_image_from_request(request)
-    if isinstance(img, HttpResponseBadRequest):
-        return img
-    bgr = np.array(img)[:, :, ::-1]
-    # Optional liveness check on single image
-    checker = LivenessChecker()
-    if not checker.check(bgr):
-        return HttpResponseBadRequest("liveness failed")
-    # Face detection & crop (required if detector configured)
-    detector = FaceDetector()
-    crop = detector.detect_and_crop(bgr)
-    if detector._fn is not None and crop is None:
-        return HttpResponseBadRequest("no face detected")
-    face_img = crop if crop is not None else bgr
-    adapter = FaceAdapter()
-    probe = adapter.embed(face_img).astype(np.float32)
-    n = float(np.linalg.norm(probe))
-    if n > 0:
-        probe /= n
-    embeddings, owners = _gallery_vectors(adapter)
-    if not embeddings:
-        return HttpResponseBadRequest("no enrolled faces")
-    idx, score = adapter.match(probe, embeddings)
+    # Single image: raw body, multipart or JSON data URL
+    upload = read_upload(request)
+    if isinstance(upload, HttpResponseBadRequest):
+        return upload
+    # With a login hint, verify 1:1 against that user's templates only
+    hint = _login_hint(request)
+    precropped, client_score = crop_hint(request)
     try:
-        threshold = float(os.getenv("FACE_MATCH_THRESHOLD", "0.7"))
-    except ValueError:
-        threshold = 0.7
-    try:
-        margin = float(os.getenv("FACE_MATCH_MARGIN", "0.0"))
-    except ValueError:
-        margin = 0.0
-    # Compute full sims for debug and margin checks
-    sims = [float(np.dot(probe, g) / (np.linalg.norm(probe) * np.linalg.norm(g))) for g in embeddings]
-    sims_sorted = sorted(sims, reverse=True) if sims else []
-    top1 = sims_sorted[0] if sims_sorted else 0.0
-    top2 = sims_sorted[1] if len(sims_sorted) > 1 else 0.0
-    if margin > 0 and len(embeddings) > 1:
-        if (top1 - top2) < margin:
-            if os.getenv("FACE_DEBUG", "").lower() == "true":
-                logging.info("face_login reject (margin): top1=%.3f top2=%.3f thr=%.3f margin=%.3f", top1, top2, threshold, margin)
-            payload = {"detail": "user not found"}
-            if os.getenv("FACE_DEBUG", "").lower() == "true":
-                payload["debug"] = {"top1": top1, "top2": top2, "threshold": threshold, "margin": margin}
-            return JsonResponse(payload, status=404)
-    if idx == -1 or score < threshold:
-        if os.getenv("FACE_DEBUG", "").lower() == "true":
-            logging.info("face_login reject (threshold): top1=%.3f top2=%.3f thr=%.3f margin=%.3f", top1, top2, threshold, margin)
-        payload = {"detail": "user not found"}
-        if os.getenv("FACE_DEBUG", "").lower() == "true":
-            payload["debug"] = {"top1": top1, "top2": top2, "threshold": threshold, "margin": margin}
-        return JsonResponse(payload, status=404)
-    user = owners[idx]
+        res = FacePipeline(MATCH_STAGES, name="face_login").run(upload, match_engine(hint=hint), precropped, client_score)
+    except Rejected as exc:
+        if exc.stage == "match" or (exc.stage == "gallery" and hint):
+            return _not_found(exc.result)
+        return HttpResponseBadRequest(exc.reason)
+    user = User.objects.filter(pk=res.owner_id, is_active=True).first()
+    if user is None:
+        return _not_found()
     login(request, user)
-    resp = {
-        "authenticated": True,
-        "user": {"id": user.id, "email": user.email, "display_name": user.display_name},
-        "score": score,
-    }
-    if os.getenv("FACE_DEBUG", "").lower() == "true":
-        resp["debug"] = {"top1": top1, "top2": top2, "threshold": threshold, "margin": margin}
-        logging.info("face_login accept: top1=%.3f top2=%.3f thr=%.3f margin=%.3f", top1, top2, threshold, margin)
-    return JsonResponse(resp)
+    return _login_response(user, res)
 
 
 @csrf_exempt
 def face_signup(request):
     """Create a user and enroll one face embedding in a single call.
 
-    Accepts either multipart form fields or JSON body with keys:
+    Accepts multipart form fields, a JSON body, or a raw image body with the
+    fields in the query string:
     - email (required)
     - display_name (required)
-    - password (optional)
-    - image (data URL or multipart file under 'image')
+    - password (optional; not accepted in the query string)
+    - image (multipart file 'image', raw image/jpeg or image/webp body, or data URL)
     """
     if request.method != "POST":
         return HttpResponseBadRequest("POST required")
 
-    # Extract fields from multipart or JSON
-    content_type = request.META.get("CONTENT_TYPE", "")
-    is_multipart = content_type.startswith("multipart/")
-    if is_multipart:
-        email = request.POST.get("email", "").strip()
-        display_name = request.POST.get("display_name", "").strip()
-        password = request.POST.get("password", None)
-    else:
-        try:
-            payload = json.loads(request.body.decode() or "{}")
-        except Exception:
-            payload = {}
-        email = (payload.get("email") or "").strip()
-        display_name = (payload.get("display_name") or "").strip()
-        password = payload.get("password")
+    data = request_fields(request)
+    if is_raw_image(request) and "password" in data:
+        # Raw image bodies carry their fields in the query string
+        return HttpResponseBadRequest("send password as a form field, not in the URL")
+    email = (data.get("email") or "").strip()
+    display_name = (data.get("display_name") or "").strip()
+    password = data.get("password")
 
     if not email or not display_name:
         return HttpResponseBadRequest("email and display_name required")
     if User.objects.filter(email=email).exists():
         return HttpResponseBadRequest("email already registered")
 
-    img = _read_image_from_request(request)
-    if isinstance(img, HttpResponseBadRequest):
-        return img
+    upload = read_upload(request)
+    if isinstance(upload, HttpResponseBadRequest):
+        return upload
+    # The face must pass every stage before the account is created
+    enrolled = _enroll_vector(request, upload, "face_signup")
+    if isinstance(enrolled, HttpResponseBadRequest):
+        return enrolled
+    adapter, vector = enrolled
 
     user = User.objects.create_user(email=email, password=password, display_name=display_name)
-    adapter = FaceAdapter()
-    bgr = np.array(img)[:, :, ::-1]
-    checker = LivenessChecker()
-    if not checker.check(bgr):
-        return HttpResponseBadRequest("liveness failed")
-    detector = FaceDetector()
-    crop = detector.detect_and_crop(bgr)
-    if detector._fn is not None and crop is None:
-        return HttpResponseBadRequest("no face detected")
-    face_img = crop if crop is not None else bgr
-    vector_enc = adapter.embed_and_encrypt(face_img)
-    FaceEmbedding.objects.create(user=user, model_name=adapter.model_name, vector=vector_enc)
+    vector_enc, norm = adapter.encrypt_embedding(vector)
+    FaceEmbedding.objects.create(user=user, model_name=adapter.model_name, vector=vector_enc, norm=norm)
     login(request, user)
     return JsonResponse({
         "created": True,
@@ -195,18 +125,15 @@ def face_signup(request):
 def face_enroll(request):
     if request.method != "POST":
         return HttpResponseBadRequest("POST required")
-    img = _read_image_from_request(request)
-    if isinstance(img, HttpResponseBadRequest):
-        return img
-    adapter = FaceAdapter()
-    bgr = np.array(img)[:, :, ::-1]
-    detector = FaceDetector()
-    crop = detector.detect_and_crop(bgr)
-    if detector._fn is not None and crop is None:
-        return HttpResponseBadRequest("no face detected")
-    face_img = crop if crop is not None else bgr
-    vector_enc = adapter.embed_and_encrypt(face_img)
-    FaceEmbedding.objects.create(user=request.user, model_name=adapter.model_name, vector=vector_enc)
+    upload = read_upload(request)
+    if isinstance(upload, HttpResponseBadRequest):
+        return upload
+    enrolled = _enroll_vector(request, upload, "face_enroll")
+    if isinstance(enrolled, HttpResponseBadRequest):
+        return enrolled
+    adapter, vector = enrolled
+    vector_enc, norm = adapter.encrypt_embedding(vector)
+    FaceEmbedding.objects.create(user=request.user, model_name=adapter.model_name, vector=vector_enc, norm=norm)
     return JsonResponse({"enrolled": True})
 
 
@@ -215,16 +142,17 @@ def face_enroll(request):
 def face_reenroll(request):
     if request.method != "POST":
         return HttpResponseBadRequest("POST required")
-    img = _read_image_from_request(request)
-    if isinstance(img, HttpResponseBadRequest):
-        return img
-    adapter = FaceAdapter()
-    bgr = np.array(img)[:, :, ::-1]
-    checker = LivenessChecker()
-    if not checker.check(bgr):
-        return HttpResponseBadRequest("liveness failed")
-    # Deactivate previous embeddings
-    FaceEmbedding.objects.filter(user=request.user, active=True).update(active=False)
-    vector_enc = adapter.embed_and_encrypt(bgr)
-    FaceEmbedding.objects.create(user=request.user, model_name=adapter.model_name, vector=vector_enc)
+    upload = read_upload(request)
+    if isinstance(upload, HttpResponseBadRequest):
+        return upload
+    enrolled = _enroll_vector(request, upload, "face_reenroll")
+    if isinstance(enrolled, HttpResponseBadRequest):
+        return enrolled
+    adapter, vector = enrolled
+    # Deactivate previous embeddings (saved one by one so the gallery cache is notified)
+    for fe in FaceEmbedding.objects.filter(user=request.user, active=True):
+        fe.active = False
+        fe.save(update_fields=["active", "updated_at"])
+    vector_enc, norm = adapter.encrypt_embedding(vector)
+    FaceEmbedding.objects.create(user=request.user, model_name=adapter.model_name, vector=vector_enc, norm=norm)
     return JsonResponse({"reenrolled": True})
@@ -0,0 +1,57 @@
+from django.contrib.auth import alogin
+from django.http import JsonResponse, HttpResponseBadRequest
+from django.views.decorators.csrf import csrf_exempt
+
+from .models import User, FaceEmbedding
+from .auth import login_required_json
+from .gallery import match_engine
+from .uploads import crop_hint, read_upload
+from .views_face import _login_hint, _login_response, _not_found
+from facekit.pipeline import ENROLL_STAGES, MATCH_STAGES, FacePipeline, Rejected
+
+
+# Async variants of views_face, routed under ASGI when FACE_ASYNC_VIEWS=true.
+# The pipeline runs through FacePipeline.arun and the ORM through Django's
+# async query API, so a request waiting on the model holds no worker thread.
+
+
+@csrf_exempt
+async def face_login(request):
+    if request.method != "POST":
+        return HttpResponseBadRequest("POST required")
+    upload = read_upload(request)
+    if isinstance(upload, HttpResponseBadRequest):
+        return upload
+    hint = _login_hint(request)
+    precropped, client_score = crop_hint(request)
+    try:
+        res = await FacePipeline(MATCH_STAGES, name="face_login").arun(upload, match_engine(hint=hint), precropped, client_score)
+    except Rejected as exc:
+        if exc.stage == "match" or (exc.stage == "gallery" and hint):
+            return _not_found(exc.result)
+        return HttpResponseBadRequest(exc.reason)
+    user = await User.objects.filter(pk=res.owner_id, is_active=True).afirst()
+    if user is None:
+        return _not_found()
+    await alogin(request, user)
+    return _login_response(user, res)
+
+
+@csrf_exempt
+@login_required_json
+async def face_enroll(request):
+    if request.method != "POST":
+        return HttpResponseBadRequest("POST required")
+    upload = read_upload(request)
+    if isinstance(upload, HttpResponseBadRequest):
+        return upload
+    precropped, client_score = crop_hint(request)
+    pipeline = FacePipeline(ENROLL_STAGES, name="face_enroll")
+    try:
+        res = await pipeline.arun(upload, precropped=precropped, client_score=client_score)
+    except Rejected as exc:
+        return HttpResponseBadRequest(exc.reason)
+    vector_enc, norm = pipeline.adapter.encrypt_embedding(res.vector)
+    user = await request.auser()
+    await FaceEmbedding.objects.acreate(user=user, model_name=pipeline.adapter.model_name, vector=vector_enc, norm=norm)
+    return JsonResponse({"enrolled": True})
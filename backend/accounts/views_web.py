@@ -3,9 +3,11 @@ from django.contrib.auth.decorators import login_required
 from django.shortcuts import redirect, render
 from django.views.decorators.csrf import csrf_protect
 from django import forms
+from django.db import transaction
 
 from .models import User, FaceEmbedding
-from facekit.adapter import FaceAdapter
+from facekit.imaging import ImageDecodeError, decode_bgr
+from facekit.registry import components
 
 
 class SignUpForm(forms.Form):
@@ -21,25 +23,27 @@ def signup(request):
     if request.method == "POST":
         form = SignUpForm(request.POST, request.FILES)
         if form.is_valid():
-            user = User.objects.create_user(
-                email=form.cleaned_data["email"],
-                password=form.cleaned_data["password"],
-                display_name=form.cleaned_data["display_name"],
-                avatar_url=form.cleaned_data.get("avatar_url", ""),
-            )
-            # Optional: create an initial embedding
+            # Embed the optional face image first, so a bad upload is reported
+            # on the form instead of leaving an account without a face
             img = form.cleaned_data.get("face_image")
+            vector = None
             if img:
-                import numpy as np
-                from PIL import Image
-                from io import BytesIO
-
-                adapter = FaceAdapter()
-                image_bytes = img.read()
-                pil = Image.open(BytesIO(image_bytes)).convert("RGB")
-                bgr = np.array(pil)[:, :, ::-1]
-                vector_enc = adapter.embed_and_encrypt(bgr)
-                FaceEmbedding.objects.create(user=user, model_name=adapter.model_name, vector=vector_enc)
+                try:
+                    vector = components().adapter.embed(decode_bgr(img.read()))
+                except ImageDecodeError as exc:
+                    form.add_error("face_image", str(exc))
+                    return render(request, "accounts/signup.html", {"form": form})
+            with transaction.atomic():
+                user = User.objects.create_user(
+                    email=form.cleaned_data["email"],
+                    password=form.cleaned_data["password"],
+                    display_name=form.cleaned_data["display_name"],
+                    avatar_url=form.cleaned_data.get("avatar_url", ""),
+                )
+                if vector is not None:
+                    adapter = components().adapter
+                    vector_enc, norm = adapter.encrypt_embedding(vector)
+                    FaceEmbedding.objects.create(user=user, model_name=adapter.model_name, vector=vector_enc, norm=norm)
 
             login(request, user)
             return redirect("account-profile")
@@ -1,5 +1,12 @@
+# Serve with an ASGI server (e.g. ``uvicorn config.asgi:application``) and
+# FACE_ASYNC_VIEWS=true to use the async face views
 import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 application = get_asgi_application()
+
+# Serving processes reload face models on FACE_RELOAD_SIGNAL
+from facekit import registry  # noqa: E402
+
+registry.install_reload_signal()
@@ -9,6 +9,8 @@ SECRET_KEY = os.getenv("DJANGO_SECRET_KEY", "dev-secret-key")
 DEBUG = os.getenv("DEBUG", "true").lower() == "true"
 ALLOWED_HOSTS = ["*"]
 FACE_DEBUG = os.getenv("FACE_DEBUG", "").lower() == "true"
+# Route face login/enroll and authorize/verify to their async views (serve config.asgi)
+FACE_ASYNC_VIEWS = os.getenv("FACE_ASYNC_VIEWS", "").lower() == "true"
 
 INSTALLED_APPS = [
     "django.contrib.admin",
@@ -3,3 +3,8 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 application = get_wsgi_application()
+
+# Serving processes (including runserver) reload face models on FACE_RELOAD_SIGNAL
+from facekit import registry  # noqa: E402
+
+registry.install_reload_signal()
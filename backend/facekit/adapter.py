@@ -1,7 +1,15 @@
-import os
 import importlib
+import logging
+import os
+from concurrent.futures import TimeoutError as FutureTimeout
 import numpy as np
+from .batching import get_batcher
+from .context import FaceContext, accepts_context
 from .crypto import encrypt
+from .execution import load_stage_callable
+from .index import MatchResult, exact_search
+from .quant import pack_vector
+from .sidecar import RemoteCallable
 
 def _load_callable(path: str):
     if not path:
@@ -14,52 +22,116 @@ def _load_callable(path: str):
         return None
 
 
+def normalize_vector(vec) -> tuple[np.ndarray, float]:
+    """Return ``(unit_vector, norm)`` as float32; zero/non-finite vectors are left as-is."""
+    vec = np.asarray(vec, dtype=np.float32).ravel()
+    norm = float(np.linalg.norm(vec))
+    if not np.isfinite(norm) or norm == 0.0:
+        return vec, 0.0
+    return vec / norm, norm
+
+
 class FaceAdapter:
     """Face recognition adapter with optional custom embed function.
 
     Provide env `FACE_EMBED_FUNC` as `module.sub:func` to use your own
     embedding function. The function should accept a BGR numpy array and
     return a 1D numpy array (float32 recommended).
+
+    Optionally set `FACE_EMBED_BATCH_FUNC` to a callable taking a list of BGR
+    arrays and returning an (N, d) array, for models with batched inference;
+    without it `embed_batch` loops over the single-image function. Set on its
+    own, `embed` calls it with a one-image batch.
+
+    `embed` and `embed_and_match` also take a `FaceContext` and embed its
+    face region; an embed function declaring a `ctx` parameter receives the
+    context too, to reuse its cached grayscale and resized crops.
+
+    With `FACE_SIDECAR_SOCKET` set the embed function runs in the embedding
+    sidecar (see `facekit.sidecar`), which batches across all workers; with
+    `FACE_STAGE_ROUTES=embed=process` in the stage process pool (see
+    `facekit.execution`).
     """
 
     def __init__(self):
         func_path = os.getenv("FACE_EMBED_FUNC", "")
-        self._custom_embed = _load_callable(func_path)
+        self._custom_embed = load_stage_callable("embed", func_path)
+        # Remote embeds are batched on the far side; a local batch function would load the model here
+        remote = isinstance(self._custom_embed, RemoteCallable)
+        self._custom_embed_batch = None if remote else _load_callable(os.getenv("FACE_EMBED_BATCH_FUNC", ""))
+        self._custom_embed_ctx = self._custom_embed is not None and accepts_context(self._custom_embed)
         # Model name used to tag embeddings and filter gallery
-        self.model_name = os.getenv("FACE_EMBED_MODEL_NAME", func_path or "dev-random").strip() or "dev-random"
+        default_name = func_path or os.getenv("FACE_EMBED_BATCH_FUNC", "").strip() or "dev-random"
+        self.model_name = os.getenv("FACE_EMBED_MODEL_NAME", default_name).strip() or "dev-random"
+        # Stored precision of new embeddings: float32, float16 or int8
+        self.store_dtype = os.getenv("FACE_EMBED_STORE_DTYPE", "float32").strip().lower() or "float32"
+        self.microbatch = os.getenv("FACE_MICROBATCH", "").lower() == "true"
 
     def embed(self, image_bgr) -> np.ndarray:
+        ctx = None
+        if isinstance(image_bgr, FaceContext):
+            ctx, image_bgr = image_bgr, image_bgr.face
         if self._custom_embed is not None:
+            if self._custom_embed_ctx:
+                return np.asarray(self._custom_embed(image_bgr, ctx=ctx))
             vec = self._custom_embed(image_bgr)
             return np.asarray(vec)
+        if self._custom_embed_batch is not None:
+            return np.asarray(self._custom_embed_batch([image_bgr]))[0]
         # Development fallback: random vector
         return np.random.rand(128)
 
+    def embed_batch(self, images_bgr) -> np.ndarray:
+        """Embed a list of BGR images; returns an (N, d) array, one row per image."""
+        images_bgr = list(images_bgr)
+        if self._custom_embed_batch is not None:
+            return np.asarray(self._custom_embed_batch(images_bgr))
+        if not images_bgr:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([np.asarray(self.embed(img)).ravel() for img in images_bgr])
+
+    def encrypt_embedding(self, vector) -> tuple[bytes, float]:
+        """L2-normalize ``vector`` and encrypt it; returns ``(token, original_norm)``.
+
+        Stored embeddings are unit length so matching is a plain dot product,
+        and carry a ``facekit.quant`` header recording their dtype and dimension.
+        """
+        unit, norm = normalize_vector(vector)
+        return encrypt(pack_vector(unit, self.store_dtype)), norm
+
     def embed_and_encrypt(self, image_bgr) -> bytes:
-        vector = self.embed(image_bgr).astype(np.float32)
-        return encrypt(vector.tobytes())
-
-    def match(self, probe: np.ndarray, gallery: list[np.ndarray], metric: str = "cosine") -> tuple[int, float]:
-        if not gallery:
-            return -1, 0.0
-        if metric == "cosine":
-            pnorm = float(np.linalg.norm(probe))
-            if not np.isfinite(pnorm) or pnorm == 0.0:
-                return -1, 0.0
-            sims: list[float] = []
-            for g in gallery:
-                gnorm = float(np.linalg.norm(g))
-                if not np.isfinite(gnorm) or gnorm == 0.0:
-                    sims.append(-1.0)
-                    continue
-                s = float(np.dot(probe, g) / (pnorm * gnorm))
-                if not np.isfinite(s):
-                    s = -1.0
-                # clip to [-1, 1] to be safe
-                s = max(-1.0, min(1.0, s))
-                sims.append(s)
-            if not sims:
-                return -1, 0.0
-            idx = int(np.argmax(sims))
-            return idx, sims[idx]
-        raise ValueError("Unsupported metric")
+        return self.encrypt_embedding(self.embed(image_bgr))[0]
+
+    def embed_and_match(self, image_bgr, gallery, k: int = 2, normalized: bool = True) -> tuple[np.ndarray, MatchResult]:
+        """Embed one probe image and match it; returns ``(unit_probe, MatchResult)``.
+
+        With ``FACE_MICROBATCH=true`` concurrent calls are coalesced into
+        batched embed and match calls (see ``facekit.batching``).
+        """
+        if self.microbatch:
+            # Batched embedding works on plain crops; the context is not shared
+            if isinstance(image_bgr, FaceContext):
+                image_bgr = image_bgr.face
+            try:
+                return get_batcher(self).embed_and_match(image_bgr, gallery, k, normalized)
+            except FutureTimeout:
+                logging.warning("micro-batch timed out; embedding the probe on its own")
+        probe, _ = normalize_vector(self.embed(image_bgr))
+        return probe, self.match(probe, gallery, k=k, normalized=normalized)
+
+    def match(self, probe: np.ndarray, gallery: np.ndarray | list[np.ndarray], metric: str = "cosine", k: int = 2,
+              normalized: bool = False) -> MatchResult:
+        """Score ``probe`` against the gallery and return the ``k`` best rows, best first.
+
+        ``gallery`` is either a contiguous (N, d) float32 matrix (lists of
+        vectors are stacked), scored exactly with one matrix-vector product,
+        or an index snapshot from ``facekit.index`` exposing ``search``. Pass
+        ``normalized=True`` when matrix rows are already unit length to skip
+        the per-row norm pass.
+        """
+        if metric != "cosine":
+            raise ValueError("Unsupported metric")
+        if hasattr(gallery, "search"):
+            # ANN index snapshot (see facekit.index); rows are unit length
+            return gallery.search(probe, k)
+        return exact_search(gallery, probe, k, normalized=normalized)
@@ -0,0 +1,133 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import numpy as np
+
+from .env import env_float, env_int
+from .index import MatchResult, exact_search_batch
+
+
+class MicroBatcher:
+    """Coalesces probes from concurrent requests into batched embed + match calls.
+
+    Request threads ``submit`` a face crop (and the gallery view to match
+    against) and wait on the returned future. A worker thread takes the
+    first queued probe, keeps collecting until ``max_batch`` probes or
+    ``max_wait_ms`` have passed, then runs one ``embed_batch`` call and, per
+    distinct gallery matrix, one matrix-matrix product. Index snapshots
+    (anything with ``search``) are searched per probe. When a batch fails,
+    its probes are retried one by one, so only the bad one gets the error.
+    Callers stop waiting after ``timeout`` seconds; a probe still queued
+    by then is dropped.
+
+    Env: ``FACE_BATCH_MAX`` (default 16), ``FACE_BATCH_WAIT_MS`` (default 5),
+    ``FACE_BATCH_TIMEOUT_MS`` (default 2000).
+    """
+
+    def __init__(self, adapter, max_batch: int | None = None, max_wait_ms: float | None = None,
+                 timeout_ms: float | None = None):
+        self.adapter = adapter
+        self.max_batch = max_batch if max_batch is not None else env_int("FACE_BATCH_MAX", 16)
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else env_float("FACE_BATCH_WAIT_MS", 5.0)) / 1000.0
+        self.timeout = (timeout_ms if timeout_ms is not None else env_float("FACE_BATCH_TIMEOUT_MS", 2000.0)) / 1000.0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+
+    def _ensure_worker(self):
+        # Threads do not survive fork (e.g. gunicorn --preload); start one per process.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            threading.Thread(target=self._run, args=(self._queue,), name="face-microbatch", daemon=True).start()
+            self._pid = os.getpid()
+
+    def submit(self, image_bgr, gallery=None, k: int = 2, normalized: bool = True) -> Future:
+        """Queue one probe; the future resolves to ``(unit_probe, MatchResult | None)``."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((image_bgr, gallery, k, normalized, future))
+        return future
+
+    def wait(self, future: Future):
+        """Result of a submitted ``future``; raises TimeoutError after ``timeout``."""
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise
+
+    def embed_and_match(self, image_bgr, gallery, k: int = 2, normalized: bool = True):
+        return self.wait(self.submit(image_bgr, gallery, k, normalized))
+
+    def _run(self, q):
+        while True:
+            batch = [q.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Skip probes whose callers timed out and cancelled them
+            batch = [item for item in batch if item[-1].set_running_or_notify_cancel()]
+            if batch:
+                self._settle(batch)
+
+    def _settle(self, batch):
+        try:
+            self._process(batch)
+        except Exception as exc:
+            if len(batch) > 1:
+                logging.warning("micro-batch of %d probes failed (%s); retrying them one by one", len(batch), exc)
+                for item in batch:
+                    if not item[-1].done():
+                        self._settle([item])
+                return
+            logging.exception("micro-batch probe failed")
+            if not batch[0][-1].done():
+                batch[0][-1].set_exception(exc)
+
+    def _process(self, batch):
+        vectors = np.asarray(self.adapter.embed_batch([item[0] for item in batch]), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        probes = np.divide(vectors, norms, out=vectors.copy(), where=norms > 0)
+        results: list[MatchResult | None] = [None] * len(batch)
+        groups: dict = {}
+        for i, (_img, gallery, k, normalized, _future) in enumerate(batch):
+            if gallery is None:
+                continue
+            if hasattr(gallery, "search"):
+                results[i] = gallery.search(probes[i], k)
+            else:
+                groups.setdefault((id(gallery), k, normalized), (gallery, []))[1].append(i)
+        for (_gid, k, normalized), (gallery, rows) in groups.items():
+            for i, res in zip(rows, exact_search_batch(gallery, probes[rows], k, normalized)):
+                results[i] = res
+        for i, (*_, future) in enumerate(batch):
+            future.set_result((probes[i], results[i]))
+
+
+_BATCHERS: dict = {}
+_BATCHERS_LOCK = threading.Lock()
+
+
+def get_batcher(adapter) -> MicroBatcher:
+    """Process-wide batcher for ``adapter.model_name``, embedding with the latest ``adapter``."""
+    batcher = _BATCHERS.get(adapter.model_name)
+    if batcher is None:
+        with _BATCHERS_LOCK:
+            batcher = _BATCHERS.setdefault(adapter.model_name, MicroBatcher(adapter))
+    # A reloaded registry brings a new adapter for the same model
+    batcher.adapter = adapter
+    return batcher
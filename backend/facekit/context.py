@@ -0,0 +1,123 @@
+import inspect
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+def luma(bgr: np.ndarray) -> np.ndarray:
+    """float32 grayscale (0.114 B + 0.587 G + 0.299 R) of a (..., 3) BGR array.
+
+    Accumulated in place in that order, so results match the expression.
+    """
+    out = bgr[..., 0].astype(np.float32)
+    out *= np.float32(0.114)
+    tmp = bgr[..., 1].astype(np.float32)
+    tmp *= np.float32(0.587)
+    out += tmp
+    np.multiply(bgr[..., 2], np.float32(0.299), out=tmp, dtype=np.float32)
+    out += tmp
+    return out
+
+
+def sample_indices(h: int, w: int, target: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Row and column indices of a nearest-neighbour (target, target) resize."""
+    ys = (np.linspace(0, max(h - 1, 0), target)).astype(np.int32)
+    xs = (np.linspace(0, max(w - 1, 0), target)).astype(np.int32)
+    return ys, xs
+
+
+def accepts_context(fn) -> bool:
+    """True when a custom callable declares a ``ctx`` parameter (opting in to FaceContext)."""
+    try:
+        return "ctx" in inspect.signature(fn).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+class FaceContext:
+    """Per-request image state shared by liveness, detection and embedding.
+
+    Built once from the decoded upload; each derived form is computed on
+    first use and reused by later stages:
+      - ``bgr``: C-contiguous uint8 (H, W, 3) frame
+      - ``gray``: float32 luma of the frame
+      - ``level(n)``: pyramid level n, 2x2 area-averaged ``n`` times
+      - ``face`` / ``face_box``: the region the detector selected (the whole
+        frame until one is set), and its (x1, y1, x2, y2) box when known
+      - ``face_sample(t)`` / ``face_gray_sample(t)``: nearest-neighbour
+        (t, t) resizes of the face, in BGR and luma
+
+    Custom ``FACE_*_FUNC`` callables receive it as ``ctx=`` when they declare
+    that parameter; ``cached(key, fn)`` stores their own derived forms. Stages
+    may run concurrently, so each form is computed once under a per-key lock.
+    """
+
+    def __init__(self, bgr: np.ndarray):
+        self.bgr = np.ascontiguousarray(bgr)
+        self._face = None
+        self.face_box: Optional[Tuple[int, int, int, int]] = None
+        self._cache: dict = {}
+        self._locks: dict = {}
+        self._lock = threading.Lock()
+
+    def cached(self, key, fn):
+        """Return ``fn()`` computed once per context under ``key``."""
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._cache:
+                self._cache[key] = fn()
+            return self._cache[key]
+
+    @property
+    def gray(self) -> np.ndarray:
+        return self.cached("gray", lambda: luma(self.bgr))
+
+    def level(self, n: int) -> np.ndarray:
+        """Pyramid level ``n`` of the frame (level 0 is ``bgr``)."""
+        if n <= 0:
+            return self.bgr
+
+        def down():
+            prev = self.level(n - 1).astype(np.uint16)
+            h, w = (prev.shape[0] // 2) * 2, (prev.shape[1] // 2) * 2
+            p = prev[:h, :w]
+            return ((p[0::2, 0::2] + p[1::2, 0::2] + p[0::2, 1::2] + p[1::2, 1::2] + 2) // 4).astype(np.uint8)
+
+        return self.cached(("level", n), down)
+
+    @property
+    def face(self) -> np.ndarray:
+        return self.bgr if self._face is None else self._face
+
+    def set_face(self, face: np.ndarray, box: Optional[Tuple[int, int, int, int]] = None):
+        """Record the detected face region; ``box`` when it is a slice of ``bgr``."""
+        self._face = face
+        self.face_box = tuple(box) if box is not None else None
+        for key in list(self._cache):
+            if isinstance(key, tuple) and key[0] in ("face_sample", "face_gray_sample"):
+                self._cache.pop(key, None)
+
+    def face_sample(self, target: int) -> np.ndarray:
+        def sample():
+            ys, xs = sample_indices(*self.face.shape[:2], target)
+            return self.face[ys][:, xs]
+
+        return self.cached(("face_sample", target), sample)
+
+    def face_gray_sample(self, target: int) -> np.ndarray:
+        """Luma of ``face_sample(target)``; read from ``gray`` when it was already computed."""
+        def sample():
+            if "gray" in self._cache and (self._face is None or self.face_box is not None):
+                x1, y1 = self.face_box[:2] if self.face_box else (0, 0)
+                h, w = self.face.shape[:2]
+                ys, xs = sample_indices(h, w, target)
+                return self.gray[y1:y1 + h, x1:x1 + w][ys][:, xs]
+            return luma(self.face_sample(target))
+
+        return self.cached(("face_gray_sample", target), sample)
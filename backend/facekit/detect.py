@@ -1,18 +1,10 @@
 import os
-import importlib
 from typing import Optional, Tuple
 import numpy as np
 
-
-def _load_callable(path: str):
-    if not path:
-        return None
-    try:
-        mod_name, func_name = path.split(":", 1)
-        mod = importlib.import_module(mod_name)
-        return getattr(mod, func_name)
-    except Exception:
-        return None
+from .context import FaceContext, accepts_context
+from .env import env_float, env_int
+from .execution import load_stage_callable
 
 
 class FaceDetector:
@@ -26,11 +18,19 @@ class FaceDetector:
           - (x1, y1, x2, y2) bbox in pixels
           - (bbox, prob) where bbox is (x1, y1, x2, y2) and prob is float
           - list of the above (we'll take the best/highest prob)
+    Declaring a ``ctx`` parameter also passes the request's ``FaceContext``
+    (e.g. to detect on ``ctx.level(1)`` and scale the bbox back up).
+    The func runs in the embedding sidecar when FACE_SIDECAR_SOCKET is set,
+    or in the stage process pool with FACE_STAGE_ROUTES=detect=process.
     """
 
     def __init__(self):
-        self._fn = _load_callable(os.getenv("FACE_DETECT_FUNC", ""))
-        self.min_prob = float(os.getenv("FACE_DETECT_MIN_PROB", "0.85"))
+        self._fn = load_stage_callable("detect", os.getenv("FACE_DETECT_FUNC", ""))
+        self._fn_ctx = self._fn is not None and accepts_context(self._fn)
+        self.min_prob = env_float("FACE_DETECT_MIN_PROB", 0.85)
+        self.precrop_max_side = env_int("FACE_PRECROP_MAX_SIDE", 512)
+        self.precrop_mode = os.getenv("FACE_PRECROP_MODE", "verify").strip().lower()
+        self.precrop_min_score = env_float("FACE_PRECROP_MIN_SCORE", 0.9)
 
     def _select_from_list(self, items):
         # Prefer items with probability, otherwise first item
@@ -55,35 +55,66 @@ class FaceDetector:
             return None, 0.0
         return best
 
-    def detect_and_crop(self, bgr: np.ndarray) -> Optional[np.ndarray]:
+    def detect_and_crop(self, bgr: np.ndarray, ctx: Optional[FaceContext] = None) -> Optional[np.ndarray]:
+        return self._detect(bgr, ctx)[0]
+
+    def _detect(self, bgr: np.ndarray, ctx: Optional[FaceContext] = None) -> Tuple[Optional[np.ndarray], float, Optional[tuple]]:
+        """Run the detector; returns (crop, prob, box), prob 1.0 when the callable
+        gives none and box None unless the crop is a bbox slice of ``bgr``."""
         if self._fn is None:
-            return None
+            return None, 0.0, None
         try:
-            out = self._fn(bgr)
+            out = self._fn(bgr, ctx=ctx) if self._fn_ctx else self._fn(bgr)
         except Exception:
-            return None
+            return None, 0.0, None
         # Normalize outputs
         if out is None:
-            return None
+            return None, 0.0, None
         if isinstance(out, list):
             selected = self._select_from_list(out)
             if not selected:
-                return None
+                return None, 0.0, None
             out = selected
         if isinstance(out, np.ndarray):
-            return out
+            return out, 1.0, None
         if isinstance(out, tuple) and len(out) == 2 and isinstance(out[0], (tuple, list)):
             bbox, prob = out
             if prob is not None and prob < self.min_prob:
-                return None
+                return None, 0.0, None
             x1, y1, x2, y2 = map(int, bbox)
             x1 = max(0, x1); y1 = max(0, y1)
             x2 = max(x1 + 1, x2); y2 = max(y1 + 1, y2)
-            return bgr[y1:y2, x1:x2, :]
+            return bgr[y1:y2, x1:x2, :], 1.0 if prob is None else float(prob), (x1, y1, x2, y2)
         if isinstance(out, (tuple, list)) and len(out) == 4:
             x1, y1, x2, y2 = map(int, out)
             x1 = max(0, x1); y1 = max(0, y1)
             x2 = max(x1 + 1, x2); y2 = max(y1 + 1, y2)
-            return bgr[y1:y2, x1:x2, :]
-        return None
+            return bgr[y1:y2, x1:x2, :], 1.0, (x1, y1, x2, y2)
+        return None, 0.0, None
+
+    def face_image(self, bgr, precropped: bool = False, client_score: Optional[float] = None) -> Optional[np.ndarray]:
+        """Face region to embed from an upload, or None when no face is found.
 
+        Full frames go through :meth:`detect_and_crop`; without a configured
+        detector the whole image is used. Pre-cropped uploads (the padded,
+        fixed-size crop CameraCapture sends with ``face_bbox``) no larger than
+        FACE_PRECROP_MAX_SIDE follow FACE_PRECROP_MODE:
+          - ``verify`` (default): detect again, but only on the small crop
+          - ``trust``: embed the crop as sent when the client detector's
+            score is at least FACE_PRECROP_MIN_SCORE, else verify
+
+        ``bgr`` may be a ``FaceContext``; the selected region is then recorded
+        as its ``face`` for the embedding stage.
+        """
+        ctx = None
+        if isinstance(bgr, FaceContext):
+            ctx, bgr = bgr, bgr.bgr
+        if self._fn is None:
+            return bgr
+        if precropped and max(bgr.shape[:2]) <= self.precrop_max_side:
+            if self.precrop_mode == "trust" and client_score is not None and client_score >= self.precrop_min_score:
+                return bgr
+        crop, _prob, box = self._detect(bgr, ctx)
+        if ctx is not None and crop is not None:
+            ctx.set_face(crop, box)
+        return crop
@@ -1,5 +1,7 @@
 import numpy as np
 
+from .context import luma, sample_indices
+
 
 def simple_embed(image_bgr: np.ndarray) -> np.ndarray:
     """Deterministic 128-dim embedding based on mean color.
@@ -15,62 +17,110 @@ def simple_embed(image_bgr: np.ndarray) -> np.ndarray:
     return vec.astype(np.float32)
 
 
-def robust_embed(image_bgr: np.ndarray) -> np.ndarray:
-    """Lightweight, ML-free embedding using HOG-like gradients.
+def simple_embed_batch(images_bgr) -> np.ndarray:
+    """Batched :func:`simple_embed`: (N, 128) float32, one row per image."""
+    for img in images_bgr:
+        if img.ndim != 3 or img.shape[2] != 3:
+            raise ValueError("expected BGR image")
+    if not len(images_bgr):
+        return np.empty((0, 128), dtype=np.float32)
+    mean_bgr = np.stack([img.mean(axis=(0, 1)) for img in images_bgr]).astype(np.float32) / 255.0
+    return np.tile(mean_bgr, (1, int(np.ceil(128 / 3))))[:, :128].astype(np.float32)
 
-    - Converts to grayscale (from BGR)
-    - Resizes to 64x64 (nearest)
-    - Computes simple gradients and 8-bin orientation histograms on 8x8 cells
-    - L2 normalizes the final descriptor
 
-    This is not production-grade, but significantly better than mean color.
-    """
+def _sample(image_bgr: np.ndarray, target: int = 64) -> np.ndarray:
+    """Nearest-neighbour resize to (target, target, 3) by numpy indexing (no CV dependency)."""
     if image_bgr.ndim != 3 or image_bgr.shape[2] != 3:
         raise ValueError("expected BGR image")
+    ys, xs = sample_indices(*image_bgr.shape[:2], target)
+    return image_bgr[ys][:, xs]
 
-    b = image_bgr[..., 0].astype(np.float32)
-    g = image_bgr[..., 1].astype(np.float32)
-    r = image_bgr[..., 2].astype(np.float32)
-    gray = (0.114 * b + 0.587 * g + 0.299 * r)
-
-    # Resize to 64x64 via nearest-neighbor using numpy indexing (no CV dependency)
-    H, W = gray.shape
-    target = 64
-    ys = (np.linspace(0, max(H - 1, 0), target)).astype(np.int32)
-    xs = (np.linspace(0, max(W - 1, 0), target)).astype(np.int32)
-    small = gray[ys][:, xs]
 
+def _hog_cells(small: np.ndarray, cell: int = 8, bins: int = 8) -> np.ndarray:
+    """Per-cell orientation histograms of (N, T, T) luma crops: (N, T/cell, T/cell, bins) float32."""
     # Gradients (simple [-1, 0, 1])
     dx = np.zeros_like(small)
     dy = np.zeros_like(small)
-    dx[:, 1:-1] = (small[:, 2:] - small[:, :-2]) * 0.5
-    dy[1:-1, :] = (small[2:, :] - small[:-2, :]) * 0.5
+    dx[:, :, 1:-1] = (small[:, :, 2:] - small[:, :, :-2]) * 0.5
+    dy[:, 1:-1, :] = (small[:, 2:, :] - small[:, :-2, :]) * 0.5
 
     mag = np.sqrt(dx * dx + dy * dy) + 1e-6
     ang = (np.arctan2(dy, dx) + 2 * np.pi) % (2 * np.pi)  # [0, 2pi)
 
-    # 8x8 cells, 8 orientation bins
-    cell = 8
-    bins = 8
     bin_w = (2 * np.pi) / bins
-    hists = []
-    for y0 in range(0, target, cell):
-        for x0 in range(0, target, cell):
-            m = mag[y0:y0 + cell, x0:x0 + cell]
-            a = ang[y0:y0 + cell, x0:x0 + cell]
-            # Vote into bins by magnitude
-            bidx = np.floor(a / bin_w).astype(np.int32)
-            bidx = np.clip(bidx, 0, bins - 1)
-            hist = np.zeros((bins,), dtype=np.float32)
-            # Flatten loops for speed
-            for i in range(m.shape[0]):
-                for j in range(m.shape[1]):
-                    hist[bidx[i, j]] += m[i, j]
-            hists.append(hist)
-
-    desc = np.concatenate(hists).astype(np.float32)
-    # Block-wise normalize (optional); do simple global L2 normalize
-    n = float(np.linalg.norm(desc))
-    if n > 0:
-        desc /= n
+    bidx = np.clip(np.floor(ang / bin_w).astype(np.int32), 0, bins - 1)
+
+    # Reorder pixels cell by cell (cells row-major, pixels row-major inside a
+    # cell) so np.add.at accumulates each bin in the same float32 order as a
+    # per-pixel loop would, keeping the descriptor bit-identical.
+    N, T = small.shape[:2]
+    n = T // cell
+
+    def by_cell(a):
+        return a.reshape(N, n, cell, n, cell).transpose(0, 1, 3, 2, 4).reshape(N * n * n, cell * cell)
+
+    cells = np.repeat(np.arange(N * n * n), cell * cell)
+    hists = np.zeros((N * n * n, bins), dtype=np.float32)
+    np.add.at(hists, (cells, by_cell(bidx).ravel()), by_cell(mag).ravel())
+    return hists.reshape(N, n, n, bins)
+
+
+def _hog_descriptors(hists: np.ndarray, block_norm: bool) -> np.ndarray:
+    N = len(hists)
+    if block_norm:
+        # Standard HOG blocks: 2x2 cells, stride one cell
+        blocks = np.concatenate(
+            [hists[:, :-1, :-1], hists[:, :-1, 1:], hists[:, 1:, :-1], hists[:, 1:, 1:]], axis=3
+        ).reshape(N, -1, 4 * hists.shape[3])
+        norms = np.linalg.norm(blocks, axis=2, keepdims=True)
+        desc = (blocks / np.maximum(norms, 1e-6)).astype(np.float32).reshape(N, -1)
+    else:
+        desc = hists.reshape(N, -1).astype(np.float32)
+    # Row by row: a 1-D norm sums in a different order than norm(axis=1)
+    for row in desc:
+        n = float(np.linalg.norm(row))
+        if n > 0:
+            row /= n
     return desc
+
+
+def robust_embed(image_bgr: np.ndarray, block_norm: bool = False, ctx=None) -> np.ndarray:
+    """Lightweight, ML-free embedding using HOG-like gradients.
+
+    - Resizes to 64x64 (nearest)
+    - Converts to grayscale (from BGR)
+    - Computes simple gradients and 8-bin orientation histograms on 8x8 cells
+    - Optionally L2 normalizes overlapping 2x2-cell blocks (1568 dims instead of 512)
+    - L2 normalizes the final descriptor
+
+    This is not production-grade, but significantly better than mean color.
+    With a ``FaceContext`` whose face is ``image_bgr``, the 64x64 luma comes
+    from the context (sampled from the frame grayscale when liveness already
+    computed it).
+    """
+    if ctx is not None and ctx.face is image_bgr:
+        if image_bgr.ndim != 3 or image_bgr.shape[2] != 3:
+            raise ValueError("expected BGR image")
+        return _hog_descriptors(_hog_cells(ctx.face_gray_sample(64)[None]), block_norm)[0]
+    return robust_embed_batch([image_bgr], block_norm=block_norm)[0]
+
+
+def robust_embed_batch(images_bgr, block_norm: bool = False) -> np.ndarray:
+    """Batched :func:`robust_embed`: the 64x64 crops are stacked and processed as one tensor."""
+    if not len(images_bgr):
+        return np.empty((0, 1568 if block_norm else 512), dtype=np.float32)
+    px = np.stack([_sample(img) for img in images_bgr])
+    return _hog_descriptors(_hog_cells(luma(px)), block_norm)
+
+
+def robust_embed_blocknorm(image_bgr: np.ndarray, ctx=None) -> np.ndarray:
+    """``robust_embed`` with block normalization, usable as ``FACE_EMBED_FUNC``.
+
+    It is a different descriptor, so keep it under its own
+    ``FACE_EMBED_MODEL_NAME`` (the default, the function path, already is).
+    """
+    return robust_embed(image_bgr, block_norm=True, ctx=ctx)
+
+
+def robust_embed_blocknorm_batch(images_bgr) -> np.ndarray:
+    return robust_embed_batch(images_bgr, block_norm=True)
@@ -0,0 +1,23 @@
+import os
+
+
+# Numeric settings fall back to their default on a malformed value, so a
+# typo in the environment cannot fail every request.
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def env_flag(name: str) -> bool:
+    return os.getenv(name, "").strip().lower() == "true"
@@ -0,0 +1,214 @@
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from . import sidecar
+from .env import env_float, env_int
+from .shm import _Segment
+
+
+# Where each FacePipeline stage runs, overridable through FACE_STAGE_ROUTES:
+#   inline  - on the request thread
+#   thread  - on the stage pool, overlapping adjacent thread/process stages
+#   process - the stage's FACE_*_FUNC runs in the stage process pool (and
+#             overlaps like a thread stage)
+DEFAULT_ROUTES = {"decode": "inline", "liveness": "thread", "detect": "thread",
+                  "gallery": "thread", "embed": "inline", "match": "inline"}
+ALLOWED_ROUTES = {"decode": ("inline",), "liveness": ("inline", "thread", "process"),
+                  "detect": ("inline", "thread", "process"), "gallery": ("inline", "thread"),
+                  "embed": ("inline", "process"), "match": ("inline",)}
+
+_PROC = None
+_PROC_PID = None
+_PROC_LOCK = threading.Lock()
+_CPU = None
+_CPU_PID = None
+_WORKER = None
+
+
+def stage_routes() -> dict:
+    """``DEFAULT_ROUTES`` updated from ``FACE_STAGE_ROUTES`` (e.g. ``liveness=process,embed=process``).
+
+    Like the numeric settings, a malformed value falls back to the defaults
+    (with a warning) rather than failing every request.
+    """
+    return dict(_parse_routes(os.getenv("FACE_STAGE_ROUTES", "")))
+
+
+@functools.lru_cache(maxsize=8)
+def _parse_routes(value: str) -> dict:
+    # Cached so each component build does not repeat the warning
+    routes = dict(DEFAULT_ROUTES)
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        stage, _, mode = (part.strip().lower() for part in item.partition("="))
+        if mode not in ALLOWED_ROUTES.get(stage, ()):
+            logging.warning("invalid FACE_STAGE_ROUTES entry %r; using the default stage routes", item.strip())
+            return dict(DEFAULT_ROUTES)
+        routes[stage] = mode
+    return routes
+
+
+def mp_context():
+    """Start method for facekit's process pools: forkserver (children fork from a
+    clean single-threaded server, not from a threaded web worker) where available."""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def worker_init(env: dict | None = None):
+    """Initializer for facekit pool processes: their stages always run in-process.
+
+    ``env`` is the parent's environment when the pool started; forkserver
+    children would otherwise see the server's, which may predate a reload.
+    """
+    if env is not None:
+        os.environ.clear()
+        os.environ.update(env)
+    os.environ.pop("FACE_STAGE_ROUTES", None)
+
+
+def _init_stage_worker(env: dict):
+    global _WORKER
+    worker_init(env)
+    os.environ.pop("FACE_SIDECAR_SOCKET", None)
+    # Imported here: the registry imports this module
+    from .registry import components
+    parts = components()
+    _WORKER = (parts.adapter, parts.detector, parts.liveness)
+
+
+def _ready():
+    return os.getpid()
+
+
+def process_pool() -> ProcessPoolExecutor:
+    """Process-wide pool for ``process``-routed stages, started eagerly.
+
+    Each child loads the detector, liveness and embed callables once.
+    ``FACE_STAGE_PROCESSES`` sizes it (default: CPU count).
+    """
+    global _PROC, _PROC_PID
+    if _PROC_PID != os.getpid():
+        with _PROC_LOCK:
+            if _PROC_PID != os.getpid():
+                workers = env_int("FACE_STAGE_PROCESSES", 0) or os.cpu_count() or 1
+                _PROC = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context(),
+                                            initializer=_init_stage_worker, initargs=(dict(os.environ),))
+                for _ in range(workers):
+                    _PROC.submit(_ready)
+                _PROC_PID = os.getpid()
+    return _PROC
+
+
+def cpu_executor() -> ThreadPoolExecutor | ProcessPoolExecutor:
+    """Process-wide executor for the CPU stages of ``FacePipeline.arun``.
+
+    ``FACE_ASYNC_EXECUTOR`` is ``thread`` (default) or ``process``: worker
+    processes for embedders that hold the GIL, which build their own
+    components. ``FACE_ASYNC_WORKERS`` sizes it (default: CPU count).
+    """
+    global _CPU, _CPU_PID
+    if _CPU_PID != os.getpid():
+        with _PROC_LOCK:
+            if _CPU_PID != os.getpid():
+                workers = env_int("FACE_ASYNC_WORKERS", 0) or os.cpu_count() or 1
+                if os.getenv("FACE_ASYNC_EXECUTOR", "thread").lower() == "process":
+                    _CPU = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context(),
+                                               initializer=worker_init, initargs=(dict(os.environ),))
+                else:
+                    _CPU = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="face-cpu")
+                _CPU_PID = os.getpid()
+    return _CPU
+
+
+def discard_cpu_executor(executor):
+    """Forget ``executor`` (broken or shut down) so :func:`cpu_executor` starts a new one."""
+    global _CPU_PID
+    with _PROC_LOCK:
+        if _CPU is executor:
+            _CPU_PID = None
+
+
+def shutdown_pools():
+    """Retire this process's stage and async process pools; the next use starts new ones.
+
+    Work already submitted still completes.
+    """
+    global _PROC_PID, _CPU_PID
+    with _PROC_LOCK:
+        if _PROC_PID == os.getpid():
+            _PROC.shutdown(wait=False)
+        if _CPU_PID == os.getpid() and isinstance(_CPU, ProcessPoolExecutor):
+            _CPU.shutdown(wait=False)
+            _CPU_PID = None
+        _PROC_PID = None
+
+
+def _run_in_worker(op: str, name: str, shape: tuple):
+    # Pool children share the parent's resource tracker, so a plain attach
+    # (unlike shm._attach) leaves the parent's registration in place
+    segment = _Segment(name=name)
+    image = np.ndarray(shape, np.uint8, buffer=segment.buf)
+    image.flags.writeable = False
+    return sidecar.run_op(op, image, *_WORKER)
+
+
+class ProcessTransport:
+    """``RemoteCallable`` transport into :func:`process_pool`.
+
+    Each frame is copied into a shared-memory segment that lives for the
+    call; only its name and shape are pickled. A broken pool is replaced on
+    the next call. Calls give up after ``FACE_STAGE_TIMEOUT_MS`` (default
+    2000), and like a broken pool or one retired by a registry reload, this
+    raises SidecarError, so the caller falls back to running in-process.
+    """
+
+    def __init__(self, timeout: float | None = None):
+        self.timeout = timeout if timeout is not None else env_float("FACE_STAGE_TIMEOUT_MS", 2000.0) / 1000.0
+
+    def call(self, op: str, image: np.ndarray):
+        global _PROC_PID
+        shm = shared_memory.SharedMemory(create=True, size=max(image.nbytes, 1))
+        try:
+            np.ndarray(image.shape, np.uint8, buffer=shm.buf)[...] = image
+            future = process_pool().submit(_run_in_worker, op, shm.name, image.shape)
+            return future.result(timeout=self.timeout)
+        except FutureTimeout as exc:
+            future.cancel()
+            raise sidecar.SidecarError(f"stage process pool {op} timed out") from exc
+        except BrokenProcessPool as exc:
+            with _PROC_LOCK:
+                _PROC_PID = None
+            raise sidecar.SidecarError(f"stage process pool failed: {exc}") from exc
+        except RuntimeError as exc:
+            # submit() raced shutdown_pools()
+            raise sidecar.SidecarError(f"stage process pool unavailable: {exc}") from exc
+        finally:
+            shm.close()
+            shm.unlink()
+
+
+def load_stage_callable(stage: str, func_path: str):
+    """The ``FACE_*_FUNC`` callable for ``stage`` (``embed``, ``detect`` or ``liveness``).
+
+    The sidecar's when ``FACE_SIDECAR_SOCKET`` is set, a stage-process-pool
+    proxy when the stage is routed to ``process`` (starting the pool), else
+    the function itself.
+    """
+    if not func_path:
+        return None
+    if sidecar.socket_path():
+        return sidecar.RemoteCallable(stage, func_path)
+    if stage_routes()[stage] == "process":
+        process_pool()
+        return sidecar.RemoteCallable(stage, func_path, transport=ProcessTransport())
+    return sidecar._load_callable(func_path)
@@ -0,0 +1,63 @@
+import io
+import math
+
+import numpy as np
+from PIL import Image
+
+from .env import env_int
+
+# Modes Image.reduce() averages correctly; it rejects 1-bit and 16-bit
+# modes and would average palette indices
+_REDUCE_MODES = frozenset({"L", "LA", "RGB", "RGBA", "RGBX", "CMYK", "I", "F"})
+
+
+class ImageDecodeError(ValueError):
+    """The upload is not a decodable image."""
+
+
+class ImageTooLarge(ImageDecodeError):
+    """The upload declares more pixels than ``FACE_DECODE_MAX_PIXELS``."""
+
+
+def decode_bgr(source, max_side: int | None = None, max_pixels: int | None = None) -> np.ndarray:
+    """Decode image bytes (or a file object) into an (H, W, 3) BGR uint8 array.
+
+    The declared size is checked against ``max_pixels`` before any pixel is
+    decoded. Images whose long side exceeds ``max_side`` are shrunk while
+    decoding: JPEGs through ``draft()`` (DCT scaling), then any format
+    through integer ``reduce()``, after converting palette, 1-bit and 16-bit
+    images. The BGR array is packed by PIL in a single copy and is
+    read-only; copy it before modifying in place.
+
+    Env: ``FACE_DECODE_MAX_SIDE`` (default 1280, 0 = keep full size),
+    ``FACE_DECODE_MAX_PIXELS`` (default 40 megapixels).
+    """
+    if max_side is None:
+        max_side = env_int("FACE_DECODE_MAX_SIDE", 1280)
+    if max_pixels is None:
+        max_pixels = env_int("FACE_DECODE_MAX_PIXELS", 40000000)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    try:
+        img = Image.open(source)
+        w, h = img.size
+        if w * h > max_pixels:
+            raise ImageTooLarge(f"image is {w}x{h}, over the {max_pixels} pixel limit")
+        long_side = max(w, h)
+        if max_side and long_side > max_side:
+            if img.format == "JPEG":
+                scale = max_side / long_side
+                img.draft("RGB", (math.ceil(w * scale), math.ceil(h * scale)))
+            factor = math.ceil(max(img.size) / max_side)
+            if factor > 1:
+                if img.mode not in _REDUCE_MODES:
+                    img = img.convert("L" if img.mode == "1" else "RGB")
+                img = img.reduce(factor)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        w, h = img.size
+        return np.frombuffer(img.tobytes("raw", "BGR"), dtype=np.uint8).reshape(h, w, 3)
+    except ImageDecodeError:
+        raise
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as exc:
+        raise ImageDecodeError(str(exc)) from exc
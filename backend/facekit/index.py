@@ -0,0 +1,830 @@
+import heapq
+import os
+import numpy as np
+
+from .env import env_int
+
+
+class MatchResult:
+    """Top-k outcome of a gallery match.
+
+    ``indices`` are gallery row numbers, best first, with ``scores`` the
+    matching cosine similarities. ``top2`` is 0.0 when fewer than two rows
+    were scored, which is what the margin check has always assumed.
+    """
+
+    __slots__ = ("indices", "scores")
+
+    def __init__(self, indices: np.ndarray, scores: np.ndarray):
+        self.indices = indices
+        self.scores = scores
+
+    @classmethod
+    def empty(cls) -> "MatchResult":
+        return cls(np.empty((0,), dtype=np.int64), np.empty((0,), dtype=np.float32))
+
+    @classmethod
+    def from_scores(cls, sims: np.ndarray, k: int) -> "MatchResult":
+        if len(sims) == 0:
+            return cls.empty()
+        k = max(1, min(int(k), len(sims)))
+        if k < len(sims):
+            top = np.argpartition(-sims, k - 1)[:k]
+        else:
+            top = np.arange(len(sims))
+        order = top[np.argsort(-sims[top], kind="stable")]
+        return cls(order.astype(np.int64), sims[order])
+
+    @property
+    def index(self) -> int:
+        return int(self.indices[0]) if len(self.indices) else -1
+
+    @property
+    def score(self) -> float:
+        return float(self.scores[0]) if len(self.scores) else 0.0
+
+    @property
+    def top1(self) -> float:
+        return self.score
+
+    @property
+    def top2(self) -> float:
+        return float(self.scores[1]) if len(self.scores) > 1 else 0.0
+
+    @property
+    def margin(self) -> float:
+        return self.top1 - self.top2
+
+
+def _unit_probe(probe) -> np.ndarray | None:
+    probe = np.asarray(probe, dtype=np.float32).ravel()
+    pnorm = float(np.linalg.norm(probe))
+    if not np.isfinite(pnorm) or pnorm == 0.0:
+        return None
+    return probe / pnorm
+
+
+def _clean(sims: np.ndarray) -> np.ndarray:
+    sims[~np.isfinite(sims)] = -1.0
+    return np.clip(sims, -1.0, 1.0, out=sims)
+
+
+def exact_search(gallery, probe, k: int = 2, normalized: bool = False) -> MatchResult:
+    """Brute-force cosine search: one matrix-vector product over every row."""
+    if len(gallery) == 0:
+        return MatchResult.empty()
+    p = _unit_probe(probe)
+    if p is None:
+        return MatchResult.empty()
+    matrix = np.ascontiguousarray(gallery, dtype=np.float32)
+    if normalized:
+        sims = matrix @ p
+    else:
+        gnorms = np.sqrt(np.einsum("ij,ij->i", matrix, matrix))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sims = (matrix @ p) / gnorms
+    return MatchResult.from_scores(_clean(sims), k)
+
+
+def exact_search_batch(gallery, probes: np.ndarray, k: int = 2, normalized: bool = False) -> list[MatchResult]:
+    """:func:`exact_search` for several probes with one matrix-matrix product."""
+    probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+    if len(gallery) == 0:
+        return [MatchResult.empty() for _ in probes]
+    pnorms = np.linalg.norm(probes, axis=1)
+    ok = np.isfinite(pnorms) & (pnorms > 0)
+    units = probes[ok] / pnorms[ok, None]
+    matrix = np.ascontiguousarray(gallery, dtype=np.float32)
+    sims = matrix @ units.T
+    if not normalized:
+        gnorms = np.sqrt(np.einsum("ij,ij->i", matrix, matrix))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sims /= gnorms[:, None]
+    columns = iter(range(sims.shape[1]))
+    return [
+        MatchResult.from_scores(_clean(np.ascontiguousarray(sims[:, next(columns)])), k) if good else MatchResult.empty()
+        for good in ok
+    ]
+
+
+def kmeans(vectors: np.ndarray, k: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means over unit vectors; returns (k, d) unit centroids."""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    k = max(1, min(k, n))
+    centroids = vectors[rng.choice(n, size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty clusters from random points
+            sums[empty] = vectors[rng.choice(n, size=int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+class _Snapshot:
+    """Common helpers for index snapshots (``vectors`` + ``search``)."""
+
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def recall(self, queries: np.ndarray, k: int = 10) -> float:
+        """Mean recall@k of this snapshot against exact search for ``queries``."""
+        hits = 0
+        total = 0
+        for q in np.atleast_2d(queries):
+            truth = exact_search(self.vectors, q, k, normalized=True).indices
+            found = self.search(q, k).indices
+            hits += len(np.intersect1d(truth, found))
+            total += len(truth)
+        return hits / total if total else 1.0
+
+
+class IVFSnapshot(_Snapshot):
+    """Immutable view of an :class:`IVFIndex` over a fixed gallery matrix."""
+
+    __slots__ = ("vectors", "centroids", "lists", "nprobe")
+
+    def __init__(self, vectors, centroids, lists, nprobe):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.lists = lists
+        self.nprobe = nprobe
+
+    def candidates(self, p: np.ndarray) -> np.ndarray:
+        nprobe = min(self.nprobe, len(self.lists))
+        csims = self.centroids @ p
+        if nprobe < len(self.lists):
+            probed = np.argpartition(-csims, nprobe - 1)[:nprobe]
+        else:
+            probed = np.arange(len(self.lists))
+        return np.concatenate([self.lists[i] for i in probed])
+
+    def search(self, probe, k: int = 2) -> MatchResult:
+        """Probe the ``nprobe`` nearest lists, then re-rank their rows exactly.
+
+        Scores are exact cosine similarities, so top1/top2 (and therefore the
+        ``FACE_MATCH_MARGIN`` check) are exact among the probed candidates.
+        """
+        p = _unit_probe(probe)
+        if p is None or len(self.vectors) == 0:
+            return MatchResult.empty()
+        rows = self.candidates(p)
+        if rows.size == 0:
+            return MatchResult.empty()
+        res = MatchResult.from_scores(_clean(self.vectors[rows] @ p), k)
+        return MatchResult(rows[res.indices], res.scores)
+
+
+class IVFIndex:
+    """Inverted-file ANN index over the rows of a gallery matrix.
+
+    Rows are clustered with spherical k-means into ``nlist`` lists; a query
+    probes the ``nprobe`` closest lists only. The index stores row numbers,
+    not vectors, and is kept in sync by the gallery through ``add`` (new
+    rows) and ``remap`` (after compaction). Each update replaces the lists
+    tuple, so snapshots handed to readers never change.
+
+    Env: ``FACE_IVF_NLIST`` (0 = about 4*sqrt(N)), ``FACE_IVF_NPROBE``,
+    ``FACE_IVF_MIN_SIZE`` (below it the gallery stays on exact search).
+    """
+
+    def __init__(self, nlist: int | None = None, nprobe: int | None = None, min_size: int | None = None):
+        self.nlist = nlist if nlist is not None else env_int("FACE_IVF_NLIST", 0)
+        self.nprobe = nprobe if nprobe is not None else env_int("FACE_IVF_NPROBE", 8)
+        self.min_size = min_size if min_size is not None else env_int("FACE_IVF_MIN_SIZE", 10000)
+        self.centroids = None
+        self.lists: tuple = ()
+        self.trained_size = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def needs_training(self, n: int) -> bool:
+        if n < self.min_size:
+            return False
+        # Retrain once the gallery has doubled since the last training
+        return not self.is_trained or n > 2 * self.trained_size
+
+    def train(self, vectors: np.ndarray, sample: int = 65536):
+        n = len(vectors)
+        nlist = self.nlist or max(1, int(4 * np.sqrt(n)))
+        train_on = vectors
+        if n > sample:
+            train_on = vectors[np.random.default_rng(0).choice(n, size=sample, replace=False)]
+        self.centroids = kmeans(train_on, nlist)
+        self.lists = tuple(np.empty((0,), dtype=np.int64) for _ in range(len(self.centroids)))
+        self.trained_size = n
+        self.add(np.arange(n, dtype=np.int64), vectors)
+
+    def add(self, rows: np.ndarray, matrix: np.ndarray):
+        """Index ``rows`` of the gallery ``matrix``."""
+        if not self.is_trained or len(rows) == 0:
+            return
+        assign = np.argmax(matrix[rows] @ self.centroids.T, axis=1)
+        lists = list(self.lists)
+        for c in np.unique(assign):
+            lists[c] = np.concatenate([lists[c], np.asarray(rows, dtype=np.int64)[assign == c]])
+        self.lists = tuple(lists)
+
+    def remap(self, mapping: np.ndarray, size: int | None = None):
+        """Renumber rows via ``mapping[old] -> new``; rows mapped to -1 are dropped."""
+        if not self.is_trained:
+            return
+        lists = []
+        for rows in self.lists:
+            new = mapping[rows]
+            lists.append(new[new >= 0])
+        self.lists = tuple(lists)
+
+    def snapshot(self, vectors: np.ndarray) -> IVFSnapshot:
+        return IVFSnapshot(vectors, self.centroids, self.lists, self.nprobe)
+
+
+class CentroidSnapshot(_Snapshot):
+    """Immutable two-stage view: per-user centroids first, then those users' templates.
+
+    Stage 1 scores one centroid per user and keeps the ``candidates`` best
+    users; stage 2 re-ranks every template of those users exactly, so
+    returned indices and scores are gallery rows and true cosine similarities.
+    """
+
+    __slots__ = ("vectors", "owners", "centroids", "centroid_owners", "candidates", "_groups")
+
+    def __init__(self, vectors, owners, centroids, centroid_owners, candidates):
+        self.vectors = vectors
+        self.owners = owners
+        self.centroids = centroids
+        self.centroid_owners = centroid_owners
+        self.candidates = candidates
+        self._groups = None
+
+    def groups(self):
+        """Rows grouped by owner: ``(order, owner_ids, starts, ends)``; built on first use."""
+        if self._groups is None:
+            order = np.argsort(self.owners, kind="stable")
+            owner_ids, starts, counts = np.unique(self.owners[order], return_index=True, return_counts=True)
+            self._groups = (order, owner_ids, starts, starts + counts)
+        return self._groups
+
+    def search(self, probe, k: int = 2) -> MatchResult:
+        p = _unit_probe(probe)
+        if p is None or len(self.vectors) == 0 or len(self.centroids) == 0:
+            return MatchResult.empty()
+        c = max(1, min(self.candidates, len(self.centroids)))
+        csims = self.centroids @ p
+        top = np.argpartition(-csims, c - 1)[:c] if c < len(csims) else np.arange(len(csims))
+        order, owner_ids, starts, ends = self.groups()
+        pos = np.minimum(np.searchsorted(owner_ids, self.centroid_owners[top]), len(owner_ids) - 1)
+        pos = pos[owner_ids[pos] == self.centroid_owners[top]]
+        if pos.size == 0:
+            return MatchResult.empty()
+        rows = np.concatenate([order[starts[i]:ends[i]] for i in pos])
+        res = MatchResult.from_scores(_clean(self.vectors[rows] @ p), k)
+        return MatchResult(rows[res.indices], res.scores)
+
+
+class CentroidIndex:
+    """Per-user aggregate templates (normalized centroid of a user's active rows).
+
+    Keeps a running sum and count per user, so adding or removing a template
+    costs O(d); ``snapshot`` normalizes the live sums into a fresh centroid
+    matrix for readers. Stage-1 search size is the user count rather than
+    the template count.
+
+    Env: ``FACE_CENTROID_CANDIDATES`` (users re-ranked in stage 2, default 8).
+    """
+
+    def __init__(self, candidates: int | None = None):
+        self.candidates = candidates if candidates is not None else env_int("FACE_CENTROID_CANDIDATES", 8)
+        self._slots: dict[int, int] = {}
+        self._sums = None
+        self._counts = np.zeros((0,), dtype=np.int64)
+        self._owners = np.zeros((0,), dtype=np.int64)
+
+    def _slot(self, owner: int, dim: int) -> int:
+        slot = self._slots.get(owner)
+        if slot is not None:
+            return slot
+        slot = len(self._slots)
+        if self._sums is None or slot == len(self._sums):
+            cap = max(64, 2 * slot)
+            sums = np.zeros((cap, dim), dtype=np.float64)
+            counts = np.zeros((cap,), dtype=np.int64)
+            owners = np.zeros((cap,), dtype=np.int64)
+            if self._sums is not None:
+                sums[:slot] = self._sums[:slot]
+                counts[:slot] = self._counts[:slot]
+                owners[:slot] = self._owners[:slot]
+            self._sums, self._counts, self._owners = sums, counts, owners
+        self._slots[owner] = slot
+        self._owners[slot] = owner
+        return slot
+
+    def add(self, owner: int, vec: np.ndarray):
+        slot = self._slot(int(owner), vec.shape[0])
+        self._sums[slot] += vec
+        self._counts[slot] += 1
+
+    def remove(self, owner: int, vec: np.ndarray):
+        slot = self._slots.get(int(owner))
+        if slot is None or self._counts[slot] == 0:
+            return
+        self._counts[slot] -= 1
+        if self._counts[slot] == 0:
+            # Start the next template from a clean sum rather than float residue
+            self._sums[slot] = 0.0
+        else:
+            self._sums[slot] -= vec
+
+    def snapshot(self, vectors: np.ndarray, owners: np.ndarray) -> CentroidSnapshot:
+        m = len(self._slots)
+        live = np.flatnonzero(self._counts[:m] > 0)
+        if self._sums is None or live.size == 0:
+            centroids = np.empty((0, vectors.shape[1] if vectors.ndim == 2 else 0), dtype=np.float32)
+        else:
+            sums = self._sums[live]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+        return CentroidSnapshot(vectors, owners, centroids, self._owners[live], self.candidates)
+
+
+def _search_layer(vectors, n, neighbors, q, entry_points, ef, level, width=8):
+    """Best-first beam search of one HNSW layer; returns [(sim, node)] (unsorted).
+
+    Up to ``width`` of the best open candidates are expanded per step, so
+    their neighbours are filtered and scored with one matrix product.
+    """
+    visited = np.zeros((n,), dtype=bool)
+    visited[[node for _, node in entry_points]] = True
+    candidates = [(-sim, node) for sim, node in entry_points]
+    heapq.heapify(candidates)
+    results = list(entry_points)
+    heapq.heapify(results)
+    while len(results) > ef:
+        heapq.heappop(results)
+    while candidates:
+        batch = []
+        while candidates and len(batch) < width:
+            neg, node = heapq.heappop(candidates)
+            if len(results) >= ef and -neg < results[0][0]:
+                # Every other open candidate is worse still
+                candidates.clear()
+                break
+            batch.append(node)
+        if not batch:
+            break
+        nbrs = np.concatenate([neighbors(node, level) for node in batch]) if len(batch) > 1 else neighbors(batch[0], level)
+        nbrs = nbrs[(nbrs >= 0) & (nbrs < n)]
+        nbrs = nbrs[~visited[nbrs]]
+        if not nbrs.size:
+            continue
+        if len(batch) > 1:
+            nbrs = np.unique(nbrs)
+        visited[nbrs] = True
+        sims = vectors[nbrs] @ q
+        if len(results) >= ef:
+            # The bar only rises while pushing, so this drops no winner
+            better = sims > results[0][0]
+            nbrs, sims = nbrs[better], sims[better]
+        for sim, x in zip(sims.tolist(), nbrs.tolist()):
+            if len(results) < ef or sim > results[0][0]:
+                heapq.heappush(candidates, (-sim, x))
+                heapq.heappush(results, (sim, x))
+                if len(results) > ef:
+                    heapq.heappop(results)
+    return results
+
+
+class _HNSWGraph:
+    """Array-backed HNSW adjacency shared by the index and its snapshots.
+
+    ``links0`` holds the (N, 2M) layer-0 neighbour table. Nodes above layer 0
+    own ``levels[node]`` consecutive rows of the (U, M) ``upper`` table
+    starting at ``offsets[node]``. Empty slots are -1.
+    """
+
+    __slots__ = ("levels", "offsets", "links0", "upper", "entry", "max_level")
+
+    def neighbors(self, node: int, level: int) -> np.ndarray:
+        if level == 0:
+            return self.links0[node]
+        return self.upper[self.offsets[node] + level - 1]
+
+    def descend(self, vectors, n, q):
+        """Greedy search from the entry point down to layer 1."""
+        node = self.entry
+        best = float(vectors[node] @ q)
+        for level in range(self.max_level, 0, -1):
+            changed = True
+            while changed:
+                changed = False
+                nbrs = self.neighbors(node, level)
+                nbrs = nbrs[(nbrs >= 0) & (nbrs < n)]
+                if nbrs.size == 0:
+                    break
+                sims = vectors[nbrs] @ q
+                i = int(np.argmax(sims))
+                if sims[i] > best:
+                    best, node, changed = float(sims[i]), int(nbrs[i]), True
+        return best, node
+
+
+class HNSWSnapshot(_HNSWGraph, _Snapshot):
+    """Read-only view of an :class:`HNSWIndex` over a fixed gallery matrix.
+
+    The index rewrites link rows in place as it grows (its owner serialises
+    writers). Links to rows past ``len(vectors)`` are ignored, so a search
+    racing an insert may take a different path but only returns rows the
+    snapshot holds.
+    """
+
+    __slots__ = ("vectors", "ef")
+
+    def __init__(self, vectors, graph, ef):
+        self.vectors = vectors
+        self.ef = ef
+        for name in _HNSWGraph.__slots__:
+            setattr(self, name, getattr(graph, name))
+
+    def search(self, probe, k: int = 2) -> MatchResult:
+        p = _unit_probe(probe)
+        n = len(self.vectors)
+        if p is None or n == 0 or self.entry < 0 or self.entry >= n:
+            return MatchResult.empty()
+        best, node = self.descend(self.vectors, n, p)
+        found = _search_layer(self.vectors, n, self.neighbors, p, [(best, node)], max(self.ef, k), 0)
+        sims = np.array([sim for sim, _ in found], dtype=np.float32)
+        rows = np.array([node for _, node in found], dtype=np.int64)
+        res = MatchResult.from_scores(_clean(sims), k)
+        return MatchResult(rows[res.indices], res.scores)
+
+
+class HNSWIndex(_HNSWGraph):
+    """Hierarchical navigable small-world graph over the rows of a gallery matrix.
+
+    Node ids are gallery row numbers; the vectors stay in the gallery. The
+    graph is built once the gallery reaches ``FACE_HNSW_MIN_SIZE`` rows and
+    extended row by row afterwards. ``remap`` drops removed rows (their
+    links become holes) and the graph is rebuilt once a quarter of its nodes
+    were removed. ``save``/``load`` persist the graph with the embedding ids
+    of its rows so a restarted worker can reattach it to a reloaded gallery.
+
+    Building costs a few milliseconds per row, so the index is ``offline``:
+    serving galleries only load a graph saved by ``build_gallery_index``
+    and extend it, and below ``FACE_HNSW_MIN_SIZE`` the exact scan is faster.
+
+    Env: ``FACE_HNSW_M``, ``FACE_HNSW_EF_CONSTRUCTION``, ``FACE_HNSW_EF``,
+    ``FACE_HNSW_MIN_SIZE``.
+    """
+
+    __slots__ = ("M", "M0", "ef_construction", "ef", "min_size", "size", "upper_used", "removed", "built",
+                 "_ml", "_rng")
+
+    offline = True
+
+    def __init__(self, M: int | None = None, ef_construction: int | None = None, ef: int | None = None,
+                 min_size: int | None = None, seed: int = 0):
+        self.M = M if M is not None else env_int("FACE_HNSW_M", 16)
+        self.M0 = 2 * self.M
+        self.ef_construction = ef_construction if ef_construction is not None else env_int("FACE_HNSW_EF_CONSTRUCTION", 100)
+        self.ef = ef if ef is not None else env_int("FACE_HNSW_EF", 64)
+        self.min_size = min_size if min_size is not None else env_int("FACE_HNSW_MIN_SIZE", 25000)
+        self._ml = 1.0 / np.log(max(self.M, 2))
+        self._rng = np.random.default_rng(seed)
+        self._clear(0)
+
+    def _clear(self, capacity: int):
+        self.levels = np.full((capacity,), -1, dtype=np.int8)
+        self.offsets = np.full((capacity,), -1, dtype=np.int64)
+        self.links0 = np.full((capacity, self.M0), -1, dtype=np.int32)
+        self.upper = np.full((max(16, capacity // self.M), self.M), -1, dtype=np.int32)
+        self.upper_used = 0
+        self.size = 0
+        self.entry = -1
+        self.max_level = -1
+        self.removed = 0
+        self.built = False
+
+    @property
+    def is_trained(self) -> bool:
+        return self.built
+
+    def needs_training(self, n: int) -> bool:
+        if n < self.min_size:
+            return False
+        return not self.built or self.removed > 0.25 * max(n, 1)
+
+    # -- construction ------------------------------------------------------
+    def _reserve(self, node: int, level: int):
+        # Grow by replacing arrays; existing snapshots keep the smaller ones.
+        if node >= len(self.levels):
+            cap = max(64, 2 * len(self.levels), node + 1)
+            levels = np.full((cap,), -1, dtype=np.int8)
+            levels[:len(self.levels)] = self.levels
+            offsets = np.full((cap,), -1, dtype=np.int64)
+            offsets[:len(self.offsets)] = self.offsets
+            links0 = np.full((cap, self.M0), -1, dtype=np.int32)
+            links0[:len(self.links0)] = self.links0
+            self.levels, self.offsets, self.links0 = levels, offsets, links0
+        if self.upper_used + level > len(self.upper):
+            upper = np.full((max(2 * len(self.upper), self.upper_used + level), self.M), -1, dtype=np.int32)
+            upper[:self.upper_used] = self.upper[:self.upper_used]
+            self.upper = upper
+        self.levels[node] = level
+        if level > 0:
+            self.offsets[node] = self.upper_used
+            self.upper_used += level
+        self.size = max(self.size, node + 1)
+
+    def _select(self, matrix, q_sims, cands, m):
+        """HNSW neighbour-selection heuristic: prefer candidates not dominated by a closer pick."""
+        order = np.argsort(-q_sims)
+        cands, q_sims = cands[order], q_sims[order]
+        pair = matrix[cands] @ matrix[cands].T
+        # closest[j]: similarity of candidate j to its nearest pick so far
+        closest = np.full((len(cands),), -np.inf, dtype=np.float32)
+        keep = np.zeros((len(cands),), dtype=bool)
+        i = 0
+        for _ in range(m):
+            ahead = q_sims[i:] > closest[i:]
+            j = ahead.argmax() if ahead.size else 0
+            if not ahead.size or not ahead[j]:
+                break
+            i += int(j)
+            keep[i] = True
+            np.maximum(closest, pair[i], out=closest)
+            i += 1
+        picked = np.flatnonzero(keep)
+        if len(picked) < m:
+            picked = np.concatenate([picked, np.flatnonzero(~keep)[:m - len(picked)]])
+        return cands[picked]
+
+    def _connect(self, matrix, node, nbr, level):
+        row = self.neighbors(nbr, level)
+        free = np.flatnonzero(row < 0)
+        if free.size:
+            row[free[0]] = node
+            return
+        # Prune with the same heuristic, so links bridging clusters survive
+        cands = np.append(row, node).astype(np.int64)
+        row[:] = self._select(matrix, matrix[cands] @ matrix[nbr], cands, len(row))
+
+    def _insert(self, node: int, matrix: np.ndarray):
+        q = matrix[node]
+        level = min(int(-np.log(1.0 - self._rng.random()) * self._ml), 16)
+        self._reserve(node, level)
+        if self.entry < 0:
+            self.entry, self.max_level = node, level
+            return
+        n = self.size
+        best, ep = float(matrix[self.entry] @ q), self.entry
+        for lc in range(self.max_level, level, -1):
+            found = _search_layer(matrix, n, self.neighbors, q, [(best, ep)], 1, lc)
+            best, ep = max(found)
+        entry_points = [(best, ep)]
+        for lc in range(min(level, self.max_level), -1, -1):
+            found = _search_layer(matrix, n, self.neighbors, q, entry_points, self.ef_construction, lc)
+            found = [(sim, x) for sim, x in found if x != node]
+            if not found:
+                continue
+            cands = np.array([x for _, x in found], dtype=np.int64)
+            sims = np.array([sim for sim, _ in found], dtype=np.float32)
+            picked = self._select(matrix, sims, cands, self.M0 if lc == 0 else self.M)
+            row = self.neighbors(node, lc)
+            row[:] = -1
+            row[:len(picked)] = picked
+            for nbr in picked.tolist():
+                self._connect(matrix, node, nbr, lc)
+            entry_points = found
+        if level > self.max_level:
+            self.entry, self.max_level = node, level
+
+    def train(self, vectors: np.ndarray):
+        """(Re)build the graph over all rows of ``vectors``."""
+        self._clear(len(vectors))
+        self.built = True
+        self.add(np.arange(len(vectors), dtype=np.int64), vectors)
+
+    def add(self, rows: np.ndarray, matrix: np.ndarray):
+        if not self.built:
+            return
+        for row in np.asarray(rows, dtype=np.int64).tolist():
+            self._insert(row, matrix)
+
+    def remap(self, mapping: np.ndarray, size: int | None = None):
+        """Renumber nodes via ``mapping[old] -> new`` (-1 drops the node)."""
+        if not self.built:
+            return
+        n_old = self.size
+        mapping = np.asarray(mapping[:n_old], dtype=np.int64)
+        size = size if size is not None else int(mapping.max(initial=-1)) + 1
+        ext = np.append(mapping, -1)  # index -1 (empty slot) stays -1
+        old = np.flatnonzero((mapping >= 0) & (self.levels[:n_old] >= 0))
+        new = mapping[old]
+        levels = np.full((max(size, 1),), -1, dtype=np.int8)
+        levels[new] = self.levels[old]
+        offsets = np.full((max(size, 1),), -1, dtype=np.int64)
+        offsets[new] = self.offsets[old]
+        links0 = np.full((max(size, 1), self.M0), -1, dtype=np.int32)
+        links0[new] = ext[self.links0[old]]
+        upper = ext[self.upper].astype(np.int32)
+        self.removed += int((self.levels[:n_old] >= 0).sum()) - len(old)
+        self.levels, self.offsets, self.links0, self.upper = levels, offsets, links0, upper
+        self.size = size
+        if self.entry >= 0 and mapping[self.entry] >= 0:
+            self.entry = int(mapping[self.entry])
+        elif len(new):
+            top = int(np.argmax(levels))
+            self.entry, self.max_level = top, int(levels[top])
+        else:
+            self.entry, self.max_level = -1, -1
+
+    def snapshot(self, vectors: np.ndarray) -> HNSWSnapshot:
+        return HNSWSnapshot(vectors, self, self.ef)
+
+    # -- persistence -------------------------------------------------------
+    def save(self, path: str, ids: np.ndarray):
+        """Write the graph to ``path``; ``ids[row]`` is the embedding id of each row."""
+        tmp = f"{path}.tmp.{os.getpid()}"
+        with open(tmp, "wb") as fh:
+            np.savez(
+                fh, M=self.M, entry=self.entry, max_level=self.max_level,
+                levels=self.levels[:self.size], offsets=self.offsets[:self.size],
+                links0=self.links0[:self.size], upper=self.upper[:self.upper_used],
+                ids=np.asarray(ids[:self.size], dtype=np.int64),
+            )
+        os.replace(tmp, path)
+
+    def load(self, path: str) -> np.ndarray | None:
+        """Load a graph written by ``save``; returns the saved row ids or None."""
+        try:
+            with np.load(path) as data:
+                if int(data["M"]) != self.M:
+                    return None
+                self.levels = data["levels"]
+                self.offsets = data["offsets"]
+                self.links0 = data["links0"]
+                self.upper = data["upper"]
+                self.entry = int(data["entry"])
+                self.max_level = int(data["max_level"])
+                ids = data["ids"]
+        except (OSError, ValueError, KeyError):
+            return None
+        self.upper_used = len(self.upper)
+        self.size = len(self.levels)
+        self.removed = 0
+        self.built = True
+        return ids
+
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(words: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(words)
+else:
+    _POP8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(words: np.ndarray) -> np.ndarray:
+        return _POP8[words.view(np.uint8)].reshape(len(words), 8).sum(axis=1, dtype=np.uint8)
+
+
+def _simhash(vectors: np.ndarray, planes: np.ndarray) -> np.ndarray:
+    """Sign of each random-hyperplane projection, packed into (N, bits/64) uint64 words."""
+    bits = (vectors @ planes.T) > 0
+    return np.packbits(bits, axis=1, bitorder="little").view(np.uint64)
+
+
+class SimHashSnapshot(_Snapshot):
+    """Immutable view of a :class:`SimHashIndex` over a fixed gallery matrix."""
+
+    __slots__ = ("vectors", "codes", "planes", "candidates")
+
+    def __init__(self, vectors, codes, planes, candidates):
+        self.vectors = vectors
+        self.codes = codes
+        self.planes = planes
+        self.candidates = candidates
+
+    def hamming(self, p: np.ndarray) -> np.ndarray:
+        n = len(self.vectors)
+        code = _simhash(p[None, :], self.planes)[0]
+        # One pass per 64-bit word over contiguous rows of the (words, N) table
+        dist = _popcount(self.codes[0, :n] ^ code[0]).astype(np.uint16)
+        for w in range(1, len(code)):
+            dist += _popcount(self.codes[w, :n] ^ code[w])
+        return dist
+
+    def search(self, probe, k: int = 2) -> MatchResult:
+        """Keep the ``candidates`` rows nearest in Hamming distance, then re-rank them exactly."""
+        p = _unit_probe(probe)
+        n = len(self.vectors)
+        if p is None or n == 0:
+            return MatchResult.empty()
+        dist = self.hamming(p)
+        c = max(k, self.candidates)
+        if c < n:
+            # Distances are small integers: cut at the c-th smallest via a histogram
+            cut = int(np.searchsorted(np.cumsum(np.bincount(dist)), c))
+            rows = np.flatnonzero(dist < cut)
+            rows = np.concatenate([rows, np.flatnonzero(dist == cut)[:c - len(rows)]])
+        else:
+            rows = np.arange(n)
+        res = MatchResult.from_scores(_clean(self.vectors[rows] @ p), k)
+        return MatchResult(rows[res.indices], res.scores)
+
+
+class SimHashIndex:
+    """Random-hyperplane (SimHash) binary codes as a coarse filter.
+
+    Each row gets ``bits`` sign bits packed into uint64 words, stored word
+    major as a (bits/64, N) table; a query keeps the ``candidates`` rows
+    with the smallest Hamming distance (XOR and popcount) and scores only
+    those exactly. The planes are random, so there is nothing to train:
+    ``train`` just encodes the rows present when the gallery reaches
+    ``min_size``, and ``add`` encodes new rows into spare capacity, leaving
+    published snapshots untouched.
+
+    Env: ``FACE_SIMHASH_BITS`` (multiple of 64), ``FACE_SIMHASH_CANDIDATES``,
+    ``FACE_SIMHASH_MIN_SIZE``.
+    """
+
+    def __init__(self, bits: int | None = None, candidates: int | None = None, min_size: int | None = None,
+                 seed: int = 0):
+        bits = bits if bits is not None else env_int("FACE_SIMHASH_BITS", 256)
+        self.bits = max(64, bits // 64 * 64)
+        self.candidates = candidates if candidates is not None else env_int("FACE_SIMHASH_CANDIDATES", 2048)
+        self.min_size = min_size if min_size is not None else env_int("FACE_SIMHASH_MIN_SIZE", 10000)
+        self.seed = seed
+        self.planes = None
+        self.codes = np.zeros((self.bits // 64, 0), dtype=np.uint64)
+        self.size = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.planes is not None
+
+    def needs_training(self, n: int) -> bool:
+        return not self.is_trained and n >= self.min_size
+
+    def _table(self, size: int) -> np.ndarray:
+        return np.zeros((self.bits // 64, max(64, 2 * size)), dtype=np.uint64)
+
+    def train(self, vectors: np.ndarray):
+        rng = np.random.default_rng(self.seed)
+        self.planes = rng.standard_normal((self.bits, vectors.shape[1])).astype(np.float32)
+        self.codes = self._table(len(vectors))
+        self.size = 0
+        self.add(np.arange(len(vectors), dtype=np.int64), vectors)
+
+    def add(self, rows: np.ndarray, matrix: np.ndarray):
+        """Encode ``rows`` of the gallery ``matrix``."""
+        if not self.is_trained or len(rows) == 0:
+            return
+        rows = np.asarray(rows, dtype=np.int64)
+        end = int(rows.max()) + 1
+        if end > self.codes.shape[1]:
+            codes = self._table(end)
+            codes[:, :self.size] = self.codes[:, :self.size]
+            self.codes = codes
+        self.codes[:, rows] = _simhash(matrix[rows], self.planes).T
+        self.size = max(self.size, end)
+
+    def remap(self, mapping: np.ndarray, size: int | None = None):
+        """Renumber rows via ``mapping[old] -> new``; rows mapped to -1 are dropped."""
+        if not self.is_trained:
+            return
+        keep = np.flatnonzero(mapping[:self.size] >= 0)
+        size = size if size is not None else (int(mapping[keep].max()) + 1 if keep.size else 0)
+        codes = self._table(size)
+        codes[:, mapping[keep]] = self.codes[:, keep]
+        self.codes = codes
+        self.size = size
+
+    def snapshot(self, vectors: np.ndarray) -> SimHashSnapshot:
+        return SimHashSnapshot(vectors, self.codes, self.planes, self.candidates)
+
+
+def make_index(kind: str | None = None):
+    """Build the ANN index selected by ``FACE_INDEX`` (``exact`` -> None).
+
+    ``centroid`` is handled by the gallery itself (see :class:`CentroidIndex`)
+    since it groups rows by owner, and also yields None here.
+    """
+    kind = (kind if kind is not None else os.getenv("FACE_INDEX", "exact")).strip().lower()
+    if kind == "ivf":
+        return IVFIndex()
+    if kind == "hnsw":
+        return HNSWIndex()
+    if kind == "simhash":
+        return SimHashIndex()
+    return None
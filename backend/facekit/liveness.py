@@ -1,17 +1,9 @@
 import os
-import importlib
 import numpy as np
 
-
-def _load_callable(path: str):
-    if not path:
-        return None
-    try:
-        mod_name, func_name = path.split(":", 1)
-        mod = importlib.import_module(mod_name)
-        return getattr(mod, func_name)
-    except Exception:
-        return None
+from .context import FaceContext, accepts_context
+from .env import env_float
+from .execution import load_stage_callable
 
 
 class LivenessChecker:
@@ -19,24 +11,35 @@ class LivenessChecker:
 
     Provide env `FACE_LIVENESS_FUNC` as `module.sub:func` to use your own
     liveness function. The function should accept a single frame (BGR numpy
-    array) or a list of frames and return a truthy value for live.
+    array) or a list of frames and return a truthy value for live; declare a
+    ``ctx`` parameter to also receive the request's ``FaceContext``.
+
+    ``check`` takes a frame, a list of frames, or a ``FaceContext`` (whose
+    cached grayscale is then shared with the embedder). The function runs in
+    the embedding sidecar when `FACE_SIDECAR_SOCKET` is set, or in the stage
+    process pool with `FACE_STAGE_ROUTES=liveness=process`.
     """
 
     def __init__(self):
-        self._custom_check = _load_callable(os.getenv("FACE_LIVENESS_FUNC", ""))
+        self._custom_check = load_stage_callable("liveness", os.getenv("FACE_LIVENESS_FUNC", ""))
+        self._custom_ctx = self._custom_check is not None and accepts_context(self._custom_check)
+        # Thresholds of the default heuristics
+        self.min_mean = env_float("LIVENESS_MIN_MEAN", 35.0)
+        self.min_std = env_float("LIVENESS_MIN_STD", 12.0)
+        self.min_motion = env_float("LIVENESS_MIN_MOTION", 2.0)
 
-    def _default_single(self, bgr: np.ndarray) -> bool:
+    def _default_single(self, bgr: np.ndarray, ctx: FaceContext | None = None) -> bool:
         # Basic heuristics: reject too-dark/flat frames
         if bgr is None or not isinstance(bgr, np.ndarray) or bgr.size == 0:
             return False
         # Compute luma-like grayscale
-        gray = (0.114 * bgr[..., 0] + 0.587 * bgr[..., 1] + 0.299 * bgr[..., 2]).astype(np.float32)
+        if ctx is not None:
+            gray = ctx.gray
+        else:
+            gray = (0.114 * bgr[..., 0] + 0.587 * bgr[..., 1] + 0.299 * bgr[..., 2]).astype(np.float32)
         mean = float(np.mean(gray))
         std = float(np.std(gray))
-        # Tunable thresholds via env
-        min_mean = float(os.getenv("LIVENESS_MIN_MEAN", "35"))
-        min_std = float(os.getenv("LIVENESS_MIN_STD", "12"))
-        return mean >= min_mean and std >= min_std
+        return mean >= self.min_mean and std >= self.min_std
 
     def _default_multi(self, frames: list) -> bool:
         if not frames:
@@ -55,12 +58,16 @@ class LivenessChecker:
             diffs.append(float(da))
         if not diffs:
             return True
-        min_motion = float(os.getenv("LIVENESS_MIN_MOTION", "2.0"))
-        return max(diffs) >= min_motion
+        return max(diffs) >= self.min_motion
 
     def check(self, frame_or_frames) -> bool:
+        ctx = None
+        if isinstance(frame_or_frames, FaceContext):
+            ctx, frame_or_frames = frame_or_frames, frame_or_frames.bgr
         if self._custom_check is not None:
+            if self._custom_ctx:
+                return bool(self._custom_check(frame_or_frames, ctx=ctx))
             return bool(self._custom_check(frame_or_frames))
         if isinstance(frame_or_frames, list):
             return self._default_multi(frame_or_frames)
-        return self._default_single(frame_or_frames)
+        return self._default_single(frame_or_frames, ctx)
@@ -0,0 +1,386 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from .adapter import FaceAdapter, normalize_vector
+from .context import FaceContext
+from .detect import FaceDetector
+from .env import env_int
+from .execution import cpu_executor, discard_cpu_executor
+from .imaging import ImageDecodeError, ImageTooLarge, decode_bgr
+from .index import MatchResult
+from .liveness import LivenessChecker
+from .registry import FaceSettings, components
+
+
+# Stage sets used by the endpoints; "gallery" loads candidates before the
+# probe is embedded so an empty gallery exits without running the model
+MATCH_STAGES = ("decode", "liveness", "detect", "gallery", "embed", "match")
+ENROLL_STAGES = ("decode", "liveness", "detect", "embed")
+# Independent once the frame is decoded: they overlap on the stage pool
+# unless routed inline (see facekit.execution)
+PARALLEL_STAGES = ("liveness", "detect", "gallery")
+
+_POOL = None
+_POOL_PID = None
+_POOL_LOCK = threading.Lock()
+
+
+def stage_pool() -> ThreadPoolExecutor | None:
+    """Process-wide pool for concurrent stages; None when ``FACE_STAGE_WORKERS`` is 0."""
+    global _POOL, _POOL_PID
+    workers = env_int("FACE_STAGE_WORKERS", 4)
+    if workers <= 0:
+        return None
+    # Pool threads do not survive fork (e.g. gunicorn --preload); one pool per process
+    if _POOL_PID != os.getpid():
+        with _POOL_LOCK:
+            if _POOL_PID != os.getpid():
+                _POOL = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="face-stage")
+                _POOL_PID = os.getpid()
+    return _POOL
+
+
+def _probe_in_worker(stages: tuple, source, precropped: bool, client_score: float | None):
+    """Probe job of :meth:`FacePipeline.arun` in a worker process; picklable in and out.
+
+    Returns ``(stage, reason, vector, probe, timings)``, with ``stage`` and
+    ``reason`` set when a stage rejected the upload.
+    """
+    pipeline = FacePipeline(stages, name="face-worker")
+    res = PipelineResult()
+    try:
+        pipeline._run(res, source, None, precropped, client_score, None)
+    except Rejected as exc:
+        return exc.stage, exc.reason, None, None, res.timings
+    return None, None, res.vector, res.probe, res.timings
+
+
+class Rejected(Exception):
+    """A stage stopped the pipeline early.
+
+    ``stage`` names it, ``reason`` is a short client-facing message and
+    ``result`` holds what had been computed so far (timings; scores for
+    ``match`` rejections).
+    """
+
+    def __init__(self, stage: str, reason: str, result: "PipelineResult"):
+        super().__init__(reason)
+        self.stage = stage
+        self.reason = reason
+        self.result = result
+
+
+class GalleryEngine:
+    """Source of candidates for the ``gallery`` and ``match`` stages.
+
+    ``load(model_name)`` returns ``(embeddings, owner_ids)``: a unit-row
+    float32 matrix (exact scan) or an index snapshot exposing ``search``
+    (ANN). It runs alongside liveness and detection (see
+    ``PARALLEL_STAGES``), so it may load for a frame they reject. ``verify=True``
+    marks 1:1 verification against one user's templates, where the
+    top-1/top-2 margin does not apply. Subclass and override ``candidates``
+    to plug in another source.
+
+    The load may run on a stage-pool thread; ``release`` is then called on
+    that thread afterwards (e.g. to give back per-thread DB connections).
+    """
+
+    def __init__(self, load, verify: bool = False, release=None):
+        self._load = load
+        self._release = release
+        self.verify = verify
+
+    def candidates(self, model_name: str):
+        return self._load(model_name)
+
+    def release(self):
+        if self._release is not None:
+            self._release()
+
+    def kind(self, embeddings) -> str:
+        if self.verify:
+            return "1:1"
+        return "ann" if hasattr(embeddings, "search") else "exact"
+
+
+class PipelineResult:
+    """State threaded through the stages; ``timings`` maps stage to milliseconds."""
+
+    __slots__ = ("ctx", "vector", "probe", "match", "embeddings", "owners", "owner_id",
+                 "engine", "threshold", "margin", "timings")
+
+    def __init__(self):
+        self.ctx: FaceContext | None = None
+        self.vector: np.ndarray | None = None
+        self.probe: np.ndarray | None = None
+        self.match: MatchResult | None = None
+        self.embeddings = None
+        self.owners = None
+        self.owner_id: int | None = None
+        self.engine = ""
+        self.threshold = 0.0
+        self.margin = 0.0
+        self.timings: dict[str, float] = {}
+
+    @property
+    def score(self) -> float:
+        return self.match.score if self.match is not None else 0.0
+
+    def debug(self) -> dict:
+        """The ``FACE_DEBUG`` payload: match scores, thresholds and stage timings."""
+        top1 = self.match.top1 if self.match is not None else 0.0
+        top2 = self.match.top2 if self.match is not None else 0.0
+        return {"top1": top1, "top2": top2, "threshold": self.threshold, "margin": self.margin,
+                "engine": self.engine, "timings_ms": {k: round(v, 3) for k, v in dict(self.timings).items()}}
+
+
+class FacePipeline:
+    """decode -> liveness -> detect -> gallery -> embed -> match, declaratively.
+
+    ``stages`` picks which of ``STAGES`` run (always in that order); each is
+    timed into ``PipelineResult.timings`` and may stop the run by raising
+    :class:`Rejected`. Components and settings default to the process's
+    shared ones from ``facekit.registry``. The match decision uses
+    ``FACE_MATCH_THRESHOLD`` (0.7) and ``FACE_MATCH_MARGIN`` (0.0, 1:N
+    only). With ``FACE_MICROBATCH=true`` the embed stage embeds and matches
+    in one batched call.
+
+    Liveness, detection and the gallery load run concurrently on
+    :func:`stage_pool`. A rejection is raised once every earlier stage has
+    finished, so the response is the one the sequential order gives (the
+    earliest rejecting stage); later stages still queued are cancelled.
+    ``FACE_STAGE_ROUTES``
+    keeps stages inline or sends their callables to a process pool (see
+    ``facekit.execution.stage_routes``). :meth:`arun` is the variant for
+    async views.
+    """
+
+    STAGES = ("decode", "liveness", "detect", "gallery", "embed", "match")
+
+    def __init__(self, stages=MATCH_STAGES, name: str = "face", adapter: FaceAdapter | None = None,
+                 liveness: LivenessChecker | None = None, detector: FaceDetector | None = None,
+                 settings: FaceSettings | None = None):
+        unknown = [s for s in stages if s not in self.STAGES]
+        if unknown:
+            raise ValueError(f"unknown pipeline stages: {unknown}")
+        if "match" in stages and not {"gallery", "embed"} <= set(stages):
+            raise ValueError("the match stage needs the gallery and embed stages")
+        self.stages = tuple(s for s in self.STAGES if s in stages)
+        self.name = name
+        parts = components()
+        self.settings = settings or parts.settings
+        self.adapter = adapter or parts.adapter
+        self.liveness = liveness or parts.liveness
+        self.detector = detector or parts.detector
+
+    def run(self, source, engine: GalleryEngine | None = None, precropped: bool = False,
+            client_score: float | None = None) -> PipelineResult:
+        """Run the stages on ``source`` (image bytes or file, BGR array or FaceContext)."""
+        if "gallery" in self.stages and engine is None:
+            raise ValueError("a GalleryEngine is required to match")
+        res = PipelineResult()
+        try:
+            self._run(res, source, engine, precropped, client_score, stage_pool())
+        finally:
+            self._log_timings(res)
+        return res
+
+    async def arun(self, source, engine: GalleryEngine | None = None, precropped: bool = False,
+                   client_score: float | None = None) -> PipelineResult:
+        """:meth:`run` without blocking the event loop.
+
+        decode, liveness, detect and embed run as one job on
+        :func:`cpu_executor` while the gallery loads on a pool thread; the
+        match follows once both are done; a gallery rejection waits for the
+        probe job, whose earlier rejection wins. The probe is embedded before the
+        gallery is known, so ``FACE_MICROBATCH`` does not apply. In process
+        mode ``result.ctx`` stays None; when that pool is broken or retired,
+        it is replaced and the probe runs on a thread instead.
+        """
+        if "gallery" in self.stages and engine is None:
+            raise ValueError("a GalleryEngine is required to match")
+        loop = asyncio.get_running_loop()
+        executor = cpu_executor()
+        threads = stage_pool() if isinstance(executor, ProcessPoolExecutor) else executor
+        res = PipelineResult()
+        args = (res, source, engine, precropped, client_score)
+        probe_stages = tuple(s for s in self.stages if s not in ("gallery", "match"))
+        jobs = {}
+        if probe_stages:
+            jobs[asyncio.ensure_future(self._aprobe(res, probe_stages, source, precropped, client_score))] = probe_stages[0]
+        if "gallery" in self.stages:
+            jobs[loop.run_in_executor(stage_pool(), self._run_pooled, "gallery", args)] = "gallery"
+        try:
+            try:
+                if jobs:
+                    await asyncio.wait(jobs, return_when=asyncio.FIRST_EXCEPTION)
+                    errors = self._job_errors(jobs)
+                    if errors:
+                        # A job that may still reject at an earlier stage decides the response
+                        first = self.STAGES.index(min(errors, key=self.STAGES.index))
+                        earlier = [job for job, stage in jobs.items() if self.STAGES.index(stage) < first]
+                        if earlier:
+                            await asyncio.wait(earlier)
+            finally:
+                for job in jobs:
+                    job.cancel()
+            errors = self._job_errors(jobs)
+            if errors:
+                raise errors[min(errors, key=self.STAGES.index)]
+            if "match" in self.stages:
+                await loop.run_in_executor(threads, self._run_stage, "match", args)
+        finally:
+            self._log_timings(res)
+        return res
+
+    async def _aprobe(self, res, stages: tuple, source, precropped, client_score):
+        loop = asyncio.get_running_loop()
+        executor = cpu_executor()
+        if isinstance(executor, ProcessPoolExecutor):
+            # Only picklable values cross the process boundary
+            if isinstance(source, FaceContext):
+                source = source.bgr
+            elif hasattr(source, "read"):
+                source = source.read()
+            try:
+                job = loop.run_in_executor(executor, _probe_in_worker, stages, source, precropped, client_score)
+                stage, reason, res.vector, res.probe, timings = await job
+            except BrokenExecutor as exc:
+                failed = exc
+            except RuntimeError as exc:
+                # Submitting to a pool retired by a registry reload
+                if "after shutdown" not in str(exc):
+                    raise
+                failed = exc
+            else:
+                res.timings.update(timings)
+                if stage is not None:
+                    raise Rejected(stage, reason, res)
+                return
+            discard_cpu_executor(executor)
+            logging.warning("%s: async worker pool unavailable (%s); probing on a thread", self.name, failed)
+            executor = stage_pool()
+        probe = FacePipeline(stages, self.name, self.adapter, self.liveness, self.detector, self.settings)
+        await loop.run_in_executor(executor, probe._run, res, source, None, precropped, client_score, None)
+
+    def _run(self, res, source, engine, precropped, client_score, pool):
+        if isinstance(source, FaceContext):
+            res.ctx = source
+        elif isinstance(source, np.ndarray):
+            res.ctx = FaceContext(source)
+        args = (res, source, engine, precropped, client_score)
+        pending = list(self.stages)
+        while pending:
+            group = [pending.pop(0)]
+            while self._overlaps(group[0]) and pending and self._overlaps(pending[0]):
+                group.append(pending.pop(0))
+            if len(group) > 1 and pool is not None:
+                self._run_concurrently(pool, group, args)
+            else:
+                for stage in group:
+                    self._run_stage(stage, args)
+
+    def _overlaps(self, stage: str) -> bool:
+        return stage in PARALLEL_STAGES and self.settings.routes[stage] != "inline"
+
+    def _log_timings(self, res):
+        if self.settings.debug:
+            logging.info("%s timings: %s", self.name, " ".join(f"{k}={v:.2f}ms" for k, v in dict(res.timings).items()))
+
+    def _run_stage(self, stage: str, args):
+        start = time.perf_counter()
+        try:
+            getattr(self, f"_{stage}")(*args)
+        finally:
+            args[0].timings[stage] = (time.perf_counter() - start) * 1e3
+
+    def _job_errors(self, jobs: dict) -> dict:
+        """Exceptions of finished ``{future: first_stage}`` jobs, keyed by the stage that raised them."""
+        return {getattr(job.exception(), "stage", stage): job.exception() for job, stage in jobs.items()
+                if job.done() and not job.cancelled() and job.exception() is not None}
+
+    def _run_concurrently(self, pool: ThreadPoolExecutor, group: list, args):
+        futures = {pool.submit(self._run_pooled, s, args): s for s in group}
+        try:
+            wait(futures, return_when=FIRST_EXCEPTION)
+            errors = self._job_errors(futures)
+            if errors:
+                # An earlier stage still running may reject too; its rejection wins
+                first = self.STAGES.index(min(errors, key=self.STAGES.index))
+                wait([f for f, stage in futures.items() if self.STAGES.index(stage) < first])
+        except BaseException:
+            for f in futures:
+                f.cancel()
+            raise
+        errors = self._job_errors(futures)
+        if errors:
+            for f in futures:
+                f.cancel()
+            # Report the earliest stage when several have failed
+            raise errors[min(errors, key=self.STAGES.index)]
+
+    def _run_pooled(self, stage: str, args):
+        try:
+            self._run_stage(stage, args)
+        finally:
+            if stage == "gallery":
+                args[2].release()
+
+    def _decode(self, res, source, *_):
+        if res.ctx is not None:
+            return
+        try:
+            res.ctx = FaceContext(decode_bgr(source))
+        except ImageTooLarge:
+            raise Rejected("decode", "image too large", res)
+        except ImageDecodeError:
+            raise Rejected("decode", "invalid image upload", res)
+
+    def _liveness(self, res, *_):
+        if not self.liveness.check(res.ctx):
+            raise Rejected("liveness", "liveness failed", res)
+
+    def _detect(self, res, _source, _engine, precropped, client_score):
+        if self.detector.face_image(res.ctx, precropped, client_score) is None:
+            raise Rejected("detect", "no face detected", res)
+
+    def _gallery(self, res, _source, engine, *_):
+        res.embeddings, res.owners = engine.candidates(self.adapter.model_name)
+        res.engine = engine.kind(res.embeddings)
+        if not len(res.embeddings):
+            raise Rejected("gallery", "no enrolled faces", res)
+
+    def _embed(self, res, *_):
+        if res.embeddings is not None and self.adapter.microbatch:
+            res.probe, res.match = self.adapter.embed_and_match(res.ctx, res.embeddings)
+            return
+        res.vector = self.adapter.embed(res.ctx)
+        res.probe, _ = normalize_vector(res.vector)
+
+    def _match(self, res, _source, engine, *_):
+        if res.match is None:
+            res.match = self.adapter.match(res.probe, res.embeddings, k=2, normalized=True)
+        res.threshold = self.settings.match_threshold
+        res.margin = self.settings.match_margin
+        top1, top2 = res.match.top1, res.match.top2
+        # The margin separates identities, so it does not apply to 1:1 verification
+        if res.margin > 0 and len(res.embeddings) > 1 and not engine.verify and (top1 - top2) < res.margin:
+            self._log_reject("margin", res)
+            raise Rejected("match", "no match", res)
+        if res.match.index == -1 or res.match.score < res.threshold:
+            self._log_reject("threshold", res)
+            raise Rejected("match", "no match", res)
+        res.owner_id = int(res.owners[res.match.index])
+        if self.settings.debug:
+            logging.info("%s accept: top1=%.3f top2=%.3f thr=%.3f margin=%.3f", self.name, top1, top2, res.threshold, res.margin)
+
+    def _log_reject(self, why: str, res):
+        if self.settings.debug:
+            logging.info("%s reject (%s): top1=%.3f top2=%.3f thr=%.3f margin=%.3f",
+                         self.name, why, res.match.top1, res.match.top2, res.threshold, res.margin)
@@ -0,0 +1,111 @@
+import struct
+
+import numpy as np
+
+from .env import env_int
+from .index import MatchResult, _clean, _unit_probe
+
+
+MAGIC = b"FVEC"
+VERSION = 1
+# magic, version, dtype code, dim, scale (int8 only; 1.0 otherwise)
+_HEADER = struct.Struct("<4sBBIf")
+_DTYPES = {0: np.float32, 1: np.float16, 2: np.int8}
+_CODES = {np.dtype(t): code for code, t in _DTYPES.items()}
+
+
+def _dtype(name) -> np.dtype:
+    dtype = np.dtype(name)
+    if dtype not in _CODES:
+        raise ValueError(f"unsupported vector dtype {name!r} (float32, float16 or int8)")
+    return dtype
+
+
+def quantize(matrix: np.ndarray, dtype="int8") -> tuple[np.ndarray, np.ndarray]:
+    """Return ``(codes, scales)`` for the rows of ``matrix``.
+
+    int8 uses one symmetric scale per row (``max|x| / 127``); float16 and
+    float32 are plain casts with scales of 1.0.
+    """
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    dtype = _dtype(dtype)
+    scales = np.ones((len(matrix),), dtype=np.float32)
+    if dtype != np.int8:
+        return matrix.astype(dtype), scales
+    peak = np.abs(matrix).max(axis=1) if matrix.size else scales
+    scales = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def dequantize(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    out = codes.astype(np.float32)
+    if codes.dtype == np.int8:
+        out *= scales[:, None]
+    return out
+
+
+def pack_vector(vec, dtype="float32") -> bytes:
+    """Serialize one embedding with a self-describing header (dtype, dim, scale)."""
+    codes, scales = quantize(np.asarray(vec, dtype=np.float32).ravel(), dtype)
+    header = _HEADER.pack(MAGIC, VERSION, _CODES[codes.dtype], codes.shape[1], float(scales[0]))
+    return header + codes.tobytes()
+
+
+def unpack_vector(raw: bytes) -> np.ndarray:
+    """Decode :func:`pack_vector` output (or legacy headerless float32 bytes) to float32."""
+    if raw[:4] == MAGIC and len(raw) >= _HEADER.size:
+        _magic, version, code, dim, scale = _HEADER.unpack_from(raw)
+        dtype = _DTYPES.get(code)
+        if version == VERSION and dtype is not None and len(raw) == _HEADER.size + dim * np.dtype(dtype).itemsize:
+            vec = np.frombuffer(raw, dtype=dtype, offset=_HEADER.size).astype(np.float32)
+            if dtype == np.int8:
+                vec *= scale
+            return vec
+    if len(raw) % 4:
+        raise ValueError("vector bytes are neither headered nor float32")
+    return np.frombuffer(raw, dtype=np.float32)
+
+
+class QuantizedSnapshot:
+    """Exact-scan view over float16 or int8 gallery codes with float32 re-ranking.
+
+    The scan reads the compact codes in blocks, keeps the ``rerank`` best
+    rows and scores those again against their float32 vectors from
+    ``fetch(rows)``, so returned scores are on the same scale
+    ``FACE_MATCH_THRESHOLD`` was calibrated on. Without ``fetch`` the
+    dequantized scores are returned.
+    """
+
+    __slots__ = ("codes", "scales", "fetch", "rerank")
+
+    BLOCK = 4096
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray, fetch=None, rerank: int | None = None):
+        self.codes = codes
+        self.scales = scales
+        self.fetch = fetch
+        self.rerank = rerank if rerank is not None else env_int("FACE_QUANT_RERANK", 16)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def scan(self, p: np.ndarray) -> np.ndarray:
+        sims = np.empty((len(self.codes),), dtype=np.float32)
+        for start in range(0, len(self.codes), self.BLOCK):
+            block = self.codes[start:start + self.BLOCK]
+            sims[start:start + len(block)] = block.astype(np.float32) @ p
+        if self.codes.dtype == np.int8:
+            sims *= self.scales
+        return _clean(sims)
+
+    def search(self, probe, k: int = 2) -> MatchResult:
+        p = _unit_probe(probe)
+        if p is None or len(self.codes) == 0:
+            return MatchResult.empty()
+        coarse = MatchResult.from_scores(self.scan(p), max(k, self.rerank))
+        if self.fetch is None:
+            return MatchResult(coarse.indices[:k], coarse.scores[:k])
+        rows = coarse.indices
+        res = MatchResult.from_scores(_clean(np.asarray(self.fetch(rows), dtype=np.float32) @ p), k)
+        return MatchResult(rows[res.indices], res.scores)
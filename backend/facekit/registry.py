@@ -0,0 +1,167 @@
+import importlib
+import logging
+import os
+import signal
+import sys
+import threading
+
+import numpy as np
+
+from . import execution, sidecar
+from .adapter import FaceAdapter
+from .detect import FaceDetector
+from .env import env_flag, env_float
+from .liveness import LivenessChecker
+
+
+# Modules named by these are re-imported on reload
+_FUNC_VARS = ("FACE_EMBED_FUNC", "FACE_EMBED_BATCH_FUNC", "FACE_DETECT_FUNC", "FACE_LIVENESS_FUNC")
+
+_CURRENT = None
+_BUILD_LOCK = threading.Lock()
+_RELOAD_PENDING = threading.Event()
+_WARMUP_HOOKS: list = []
+
+
+class FaceSettings:
+    """Pipeline settings, parsed once per build.
+
+    Env: ``FACE_MATCH_THRESHOLD`` (0.7), ``FACE_MATCH_MARGIN`` (0.0),
+    ``FACE_DEBUG``, ``FACE_WARMUP`` and ``FACE_STAGE_ROUTES``.
+    """
+
+    __slots__ = ("match_threshold", "match_margin", "debug", "warmup", "routes")
+
+    def __init__(self):
+        self.match_threshold = env_float("FACE_MATCH_THRESHOLD", 0.7)
+        self.match_margin = env_float("FACE_MATCH_MARGIN", 0.0)
+        self.debug = env_flag("FACE_DEBUG")
+        self.warmup = env_flag("FACE_WARMUP")
+        self.routes = execution.stage_routes()
+
+
+class Components:
+    """One build of the settings and the adapter, detector and liveness checker."""
+
+    __slots__ = ("settings", "adapter", "detector", "liveness")
+
+    def __init__(self):
+        self.settings = FaceSettings()
+        self.adapter = FaceAdapter()
+        self.detector = FaceDetector()
+        self.liveness = LivenessChecker()
+
+
+def components() -> Components:
+    """The process's components, built on first use.
+
+    After :func:`request_reload` the current build keeps serving while a
+    background thread replaces it.
+    """
+    global _CURRENT
+    current = _CURRENT
+    if current is None:
+        with _BUILD_LOCK:
+            if _CURRENT is None:
+                _CURRENT = _build()
+            return _CURRENT
+    # Claim a pending reload; a build already under way will pick it up next time
+    if _RELOAD_PENDING.is_set() and _BUILD_LOCK.acquire(blocking=False):
+        try:
+            if _RELOAD_PENDING.is_set():
+                _RELOAD_PENDING.clear()
+                threading.Thread(target=_reload_in_background, name="face-reload", daemon=True).start()
+        finally:
+            _BUILD_LOCK.release()
+    return current
+
+
+def reload() -> Components:
+    """Rebuild the components now from the current env.
+
+    Re-imports the ``FACE_*_FUNC`` modules and restarts the stage and async
+    process pools, so models reload in this process and its workers. An
+    embedding sidecar is restarted separately.
+    """
+    global _CURRENT
+    with _BUILD_LOCK:
+        _RELOAD_PENDING.clear()
+        execution.shutdown_pools()
+        _reimport_funcs()
+        _CURRENT = _build()
+        return _CURRENT
+
+
+def request_reload(*_):
+    """Mark the components for rebuilding on next use; safe in a signal handler."""
+    _RELOAD_PENDING.set()
+
+
+def _reload_in_background():
+    try:
+        reload()
+    except Exception:
+        logging.exception("face component reload failed; keeping the previous components")
+
+
+def install_reload_signal():
+    """Call :func:`request_reload` on ``FACE_RELOAD_SIGNAL`` (e.g. ``SIGUSR2``); off unless set.
+
+    Called from the WSGI/ASGI entry points, so only serving processes take
+    the signal, never management commands. Only possible from the main
+    thread; a signal the server already handles (gunicorn's arbiter
+    re-execs on SIGUSR2, its workers reopen logs on SIGUSR1) is left alone.
+    """
+    name = os.getenv("FACE_RELOAD_SIGNAL", "").strip().upper()
+    if not name:
+        return
+    signum = getattr(signal, name if name.startswith("SIG") else f"SIG{name}", None)
+    if not isinstance(signum, signal.Signals):
+        logging.warning("unknown FACE_RELOAD_SIGNAL %r; face components reload only on restart", name)
+        return
+    if threading.current_thread() is not threading.main_thread():
+        return
+    if signal.getsignal(signum) not in (signal.SIG_DFL, request_reload):
+        logging.warning("%s is already handled by the server; not installing the face reload handler", signum.name)
+        return
+    signal.signal(signum, request_reload)
+
+
+def add_warmup_hook(fn):
+    """Call ``fn(components)`` after each build when ``FACE_WARMUP=true``, e.g. to prime a cache."""
+    _WARMUP_HOOKS.append(fn)
+    return fn
+
+
+def warm_up(parts: Components):
+    """Run detection, liveness and embedding once on a blank frame, then the warm-up hooks."""
+    frame = np.zeros((160, 160, 3), dtype=np.uint8)
+    for op in ("detect", "liveness", "embed"):
+        try:
+            sidecar.run_op(op, frame, parts.adapter, parts.detector, parts.liveness)
+        except Exception:
+            logging.warning("face warm-up of %s failed", op, exc_info=True)
+    for hook in _WARMUP_HOOKS:
+        try:
+            hook(parts)
+        except Exception:
+            logging.warning("face warm-up hook %r failed", hook, exc_info=True)
+
+
+def _build() -> Components:
+    parts = Components()
+    if parts.settings.warmup:
+        warm_up(parts)
+    return parts
+
+
+def _reimport_funcs():
+    names = {os.getenv(var, "").split(":", 1)[0].strip() for var in _FUNC_VARS}
+    for name in sorted(names):
+        module = sys.modules.get(name) if name else None
+        if module is None:
+            continue
+        try:
+            importlib.reload(module)
+        except Exception:
+            logging.warning("could not re-import %s", name, exc_info=True)
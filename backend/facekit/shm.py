@@ -0,0 +1,176 @@
+import hashlib
+import os
+import struct
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .snapshot import GallerySnapshot, pack_snapshot, snapshot_size
+
+
+_CTL_MAGIC = b"VGSH"
+# magic, seqlock counter (odd while a swap is in progress), generation, active segment name,
+# writer epoch (pid, start time)
+_CTL = struct.Struct("<4sQQ64sQd")
+
+
+def segment_prefix(model_name: str, prefix: str = "vg") -> str:
+    # POSIX shm names are short on some platforms; hash the model name.
+    return f"{prefix}_{hashlib.sha1(model_name.encode()).hexdigest()[:10]}"
+
+
+class _Segment(shared_memory.SharedMemory):
+    """An attached segment that NumPy views of ``buf`` may outlive.
+
+    ``SharedMemory.close()`` refuses to unmap while views exist; the views
+    keep the mapping alive on their own, so a segment dropped before them
+    skips the close instead of raising from ``__del__``.
+    """
+
+    def __del__(self):
+        try:
+            self.close()
+        except (OSError, BufferError):
+            pass
+
+    def replaced(self) -> bool:
+        """Whether the name was unlinked or now refers to another segment.
+
+        Only detectable where POSIX shared memory shows up under /dev/shm.
+        """
+        if getattr(self, "_fd", -1) < 0 or not os.path.isdir("/dev/shm"):
+            return False
+        try:
+            return os.stat(os.path.join("/dev/shm", self.name)).st_ino != os.fstat(self._fd).st_ino
+        except FileNotFoundError:
+            return True
+
+
+def _attach(name: str) -> _Segment:
+    """Attach to an existing segment without letting this process's tracker unlink it on exit."""
+    if sys.version_info >= (3, 13):
+        return _Segment(name=name, track=False)
+    shm = _Segment(name=name)
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+class SharedGalleryWriter:
+    """Publishes gallery snapshots into shared memory for one model.
+
+    Each publish writes a complete snapshot (same layout as
+    :mod:`facekit.snapshot`) into a new segment and then swaps the name in a
+    small control segment under a seqlock. The previous segment is kept
+    until the next publish, so readers that read the old name just before a
+    swap can still attach to it (double buffering); readers that already
+    attached keep their mapping even after it is unlinked. The control block
+    also records the writer's epoch, so readers can tell a restarted loader
+    from the one they attached to.
+    """
+
+    def __init__(self, model_name: str, prefix: str = "vg"):
+        self.model_name = model_name
+        self.base = segment_prefix(model_name, prefix)
+        self._seq = 0
+        self._segments: list[shared_memory.SharedMemory] = []
+        try:
+            self._ctl = shared_memory.SharedMemory(name=f"{self.base}_ctl", create=True, size=_CTL.size)
+        except FileExistsError:
+            # Left behind by a crashed loader; take it over.
+            self._ctl = shared_memory.SharedMemory(name=f"{self.base}_ctl")
+        _CTL.pack_into(self._ctl.buf, 0, _CTL_MAGIC, 0, 0, b"", os.getpid(), time.time())
+
+    def publish(self, vectors: np.ndarray, ids: np.ndarray, owners: np.ndarray, watermark: float, generation: int) -> str:
+        self._seq += 1
+        name = f"{self.base}_{generation}_{self._seq}"
+        dim = vectors.shape[1] if vectors.ndim == 2 else 0
+        seg = shared_memory.SharedMemory(name=name, create=True, size=max(1, snapshot_size(dim, len(ids))))
+        pack_snapshot(seg.buf, self.model_name, vectors, ids, owners, watermark, generation)
+        self._swap(generation, name)
+        self._segments.append(seg)
+        while len(self._segments) > 2:
+            old = self._segments.pop(0)
+            old.close()
+            old.unlink()
+        return name
+
+    def _swap(self, generation: int, name: str):
+        # Under the seqlock: an odd counter marks the control block as being written.
+        (counter,) = struct.unpack_from("<Q", self._ctl.buf, 4)
+        struct.pack_into("<Q", self._ctl.buf, 4, counter + 1)
+        struct.pack_into("<Q64s", self._ctl.buf, 12, generation, name.encode())
+        struct.pack_into("<Q", self._ctl.buf, 4, counter + 2)
+
+    def close(self):
+        # Readers still mapping the control block see no segment and fall back.
+        self._swap(0, "")
+        for seg in self._segments:
+            seg.close()
+            seg.unlink()
+        self._segments = []
+        self._ctl.close()
+        self._ctl.unlink()
+
+
+class SharedGalleryReader:
+    """Attaches to the segment currently published by a :class:`SharedGalleryWriter`.
+
+    ``current()`` never blocks on the writer: it re-reads the control block
+    until it sees a stable, even seqlock counter and returns the snapshot for
+    the active segment, reusing the previous attachment when nothing changed.
+    It returns None while no loader is publishing, and re-attaches when the
+    control block is replaced or written by a new loader (a restart).
+    """
+
+    def __init__(self, model_name: str, prefix: str = "vg"):
+        self.model_name = model_name
+        self.base = segment_prefix(model_name, prefix)
+        self._ctl = None
+        self._key = None
+        self._snapshot = None
+
+    def _read_control(self):
+        """Return ``(epoch, name)`` of the published segment, or None while it is being swapped."""
+        if self._ctl is not None and self._ctl.replaced():
+            self._ctl = None
+        if self._ctl is None:
+            self._ctl = _attach(f"{self.base}_ctl")
+        for _ in range(100):
+            magic, c1, _generation, raw, pid, started = _CTL.unpack_from(self._ctl.buf)
+            (c2,) = struct.unpack_from("<Q", self._ctl.buf, 4)
+            if magic == _CTL_MAGIC and c1 == c2 and not c1 % 2:
+                return (pid, started), raw.rstrip(b"\0").decode()
+            time.sleep(0)
+        return None
+
+    def current(self) -> GallerySnapshot | None:
+        try:
+            control = self._read_control()
+        except FileNotFoundError:
+            self._ctl = None
+            control = (None, "")
+        if control is None:
+            return self._snapshot
+        epoch, name = control
+        if not name:
+            # Loader stopped (or not started): let the caller fall back.
+            self._key = self._snapshot = None
+            return None
+        if (epoch, name) != self._key:
+            try:
+                segment = _attach(name)
+            except FileNotFoundError:
+                # Superseded between reading the name and attaching; keep the
+                # last one unless it belongs to an earlier loader.
+                if self._key is None or self._key[0] != epoch:
+                    self._key = self._snapshot = None
+                return self._snapshot
+            self._snapshot = GallerySnapshot(buffer=segment.buf, owner=segment)
+            self._key = (epoch, name)
+        return self._snapshot
@@ -0,0 +1,337 @@
+import importlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import socketserver
+import struct
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .batching import MicroBatcher
+from .context import FaceContext, accepts_context
+from .env import env_float, env_int
+from .shm import _attach
+
+
+# Message: header length, payload length, JSON header, raw payload bytes.
+# Frames themselves travel through the client's shared-memory segment.
+_FRAME = struct.Struct("<II")
+_MIN_SEGMENT = 1 << 20
+
+
+def _load_callable(path: str):
+    if not path:
+        return None
+    try:
+        mod_name, func_name = path.split(":", 1)
+        mod = importlib.import_module(mod_name)
+        return getattr(mod, func_name)
+    except Exception:
+        return None
+
+
+def socket_path() -> str:
+    """``FACE_SIDECAR_SOCKET``; when set, components run their models in the sidecar."""
+    return os.getenv("FACE_SIDECAR_SOCKET", "").strip()
+
+
+class SidecarError(RuntimeError):
+    """The sidecar could not serve a request."""
+
+
+def _recv_exact(sock, n: int) -> bytearray:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:])
+        if not k:
+            raise ConnectionError("sidecar connection closed")
+        got += k
+    return buf
+
+
+def _send(sock, header: dict, payload=b""):
+    data = json.dumps(header).encode()
+    sock.sendall(_FRAME.pack(len(data), len(payload)) + data)
+    if len(payload):
+        sock.sendall(payload)
+
+
+def _recv(sock):
+    hlen, plen = _FRAME.unpack(_recv_exact(sock, _FRAME.size))
+    header = json.loads(_recv_exact(sock, hlen))
+    return header, _recv_exact(sock, plen) if plen else b""
+
+
+class _Channel:
+    """One thread's connection and frame segment; the segment is unlinked with it."""
+
+    def __init__(self, path: str, timeout: float):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(path)
+        except OSError:
+            self.sock.close()
+            raise
+        self.shm = None
+
+    def put(self, image: np.ndarray) -> str:
+        if self.shm is None or self.shm.size < image.nbytes:
+            self._drop_segment()
+            self.shm = shared_memory.SharedMemory(create=True, size=max(image.nbytes, _MIN_SEGMENT))
+        np.ndarray(image.shape, np.uint8, buffer=self.shm.buf)[...] = image
+        return self.shm.name
+
+    def _drop_segment(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def close(self):
+        self.sock.close()
+        self._drop_segment()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class SidecarClient:
+    """Client of the embedding sidecar; one connection and frame segment per thread.
+
+    Frames are copied into the thread's shared-memory segment and only their
+    shape goes over the socket. With ``replicas`` > 1 threads spread over
+    ``<path>.0`` .. ``<path>.N-1``. Any failure closes the connection; the
+    next call reconnects.
+
+    Env: ``FACE_SIDECAR_REPLICAS`` (default 1), ``FACE_SIDECAR_TIMEOUT_MS``
+    (default 2000).
+    """
+
+    def __init__(self, path: str, replicas: int | None = None, timeout: float | None = None):
+        self.path = path
+        self.replicas = replicas if replicas is not None else env_int("FACE_SIDECAR_REPLICAS", 1)
+        self.timeout = timeout if timeout is not None else env_float("FACE_SIDECAR_TIMEOUT_MS", 2000.0) / 1000.0
+        self._local = threading.local()
+        self._next = itertools.count()
+
+    def _channel(self) -> _Channel:
+        channel = getattr(self._local, "channel", None)
+        # A forked child must not share its parent's connection or segment
+        if channel is None or getattr(self._local, "pid", None) != os.getpid():
+            path = self.path if self.replicas <= 1 else f"{self.path}.{next(self._next) % self.replicas}"
+            channel = self._local.channel = _Channel(path, self.timeout)
+            self._local.pid = os.getpid()
+        return channel
+
+    def call(self, op: str, image: np.ndarray):
+        """Run ``op`` on a uint8 (H, W, 3) frame; returns the reply ``(header, payload)``."""
+        try:
+            channel = self._channel()
+            _send(channel.sock, {"op": op, "shm": channel.put(image), "shape": list(image.shape)})
+            header, payload = _recv(channel.sock)
+        except (OSError, ValueError) as exc:
+            channel = getattr(self._local, "channel", None)
+            self._local.channel = None
+            if channel is not None:
+                channel.close()
+            raise SidecarError(f"sidecar {op} failed: {exc}") from exc
+        if "error" in header:
+            raise SidecarError(f"sidecar {op} failed: {header['error']}")
+        return header, payload
+
+
+_CLIENTS: dict = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(path: str) -> SidecarClient:
+    client = _CLIENTS.get(path)
+    if client is None:
+        with _CLIENTS_LOCK:
+            client = _CLIENTS.setdefault(path, SidecarClient(path))
+    return client
+
+
+class RemoteCallable:
+    """Stand-in for a ``FACE_*_FUNC`` callable that runs ``op`` in the sidecar.
+
+    Returns what the callable contract expects: a vector for ``embed``, a
+    ``(bbox, prob)``/crop/None for ``detect``, a bool for ``liveness``.
+    When the sidecar is unreachable, times out or fails, ``func_path`` is
+    loaded in this process (on first need) and called instead. Another
+    ``transport`` (anything with ``call(op, image)`` raising SidecarError)
+    replaces the sidecar client, e.g. ``facekit.execution``'s process pool.
+    """
+
+    def __init__(self, op: str, func_path: str, transport=None):
+        self.op = op
+        self.func_path = func_path
+        self.transport = transport
+        self._fn = None
+
+    def __call__(self, image):
+        if isinstance(image, np.ndarray) and image.ndim == 3 and image.shape[2] == 3:
+            transport = self.transport or get_client(socket_path())
+            try:
+                header, payload = transport.call(self.op, np.ascontiguousarray(image, dtype=np.uint8))
+                return self._reply(header, payload)
+            except SidecarError as exc:
+                logging.warning("%s; running %s in-process", exc, self.func_path)
+        return self._local(image)
+
+    def _reply(self, header: dict, payload):
+        if self.op == "embed":
+            return np.frombuffer(payload, dtype=np.float32).reshape(header["shape"])
+        if self.op == "detect":
+            if not header.get("face"):
+                return None
+            if header.get("box") is not None:
+                return tuple(header["box"]), header["prob"]
+            return np.frombuffer(payload, dtype=np.uint8).reshape(header["shape"])
+        return bool(header["live"])
+
+    def _local(self, image):
+        if self._fn is None:
+            self._fn = _load_callable(self.func_path)
+            if self._fn is None:
+                raise SidecarError(f"cannot load {self.func_path} in-process")
+        if accepts_context(self._fn):
+            return self._fn(image, ctx=None)
+        return self._fn(image)
+
+
+def run_op(op: str, image: np.ndarray, adapter, detector, liveness, embed=None):
+    """Run ``op`` on a frame with loaded components; returns the reply ``(header, payload)``."""
+    if op == "embed":
+        vector = np.asarray((embed or adapter.embed)(image), dtype=np.float32)
+        return {"shape": list(vector.shape)}, vector.tobytes()
+    if op == "detect":
+        crop, prob, box = detector._detect(image, FaceContext(image))
+        if crop is None:
+            return {"face": False}, b""
+        if box is not None:
+            return {"face": True, "box": list(box), "prob": prob}, b""
+        crop = np.ascontiguousarray(crop, dtype=np.uint8)
+        return {"face": True, "shape": list(crop.shape)}, crop.tobytes()
+    if op == "liveness":
+        return {"live": bool(liveness.check(FaceContext(image)))}, b""
+    raise ValueError(f"unknown sidecar op: {op}")
+
+
+class _VectorBatcher(MicroBatcher):
+    """MicroBatcher resolving each future to the raw embedding (no matching)."""
+
+    def _process(self, batch):
+        vectors = np.asarray(self.adapter.embed_batch([item[0] for item in batch]), dtype=np.float32)
+        for vector, (*_, future) in zip(vectors, batch):
+            future.set_result(vector)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # The client's current frame segment, re-attached when it grows
+        name, segment = None, None
+        while True:
+            try:
+                header, _ = _recv(self.request)
+            except (OSError, ValueError):
+                return
+            try:
+                if header["shm"] != name:
+                    segment, name = _attach(header["shm"]), header["shm"]
+                image = np.ndarray(tuple(header["shape"]), np.uint8, buffer=segment.buf)
+                image.flags.writeable = False
+                reply, payload = self.server.serve_op(header["op"], image)
+            except Exception as exc:
+                logging.exception("sidecar %s failed", header.get("op"))
+                reply, payload = {"error": str(exc)}, b""
+            try:
+                _send(self.request, reply, payload)
+            except OSError:
+                return
+
+
+class SidecarServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves ``embed``, ``detect`` and ``liveness`` on a UNIX socket.
+
+    The components are loaded once for all request workers. Concurrent
+    embeds from any connection are coalesced into ``embed_batch`` calls
+    (``FACE_BATCH_MAX``, ``FACE_BATCH_WAIT_MS``).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: str, adapter, detector, liveness):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, _Handler)
+        self.adapter = adapter
+        self.detector = detector
+        self.liveness = liveness
+        self.batcher = _VectorBatcher(adapter)
+
+    def serve_op(self, op: str, image: np.ndarray):
+        return run_op(op, image, self.adapter, self.detector, self.liveness,
+                      embed=lambda frame: self.batcher.wait(self.batcher.submit(frame)))
+
+    def warm_up(self):
+        """Run each component once so lazily loaded models are ready before the first request."""
+        frame = np.zeros((160, 160, 3), dtype=np.uint8)
+        for op in ("detect", "liveness", "embed"):
+            try:
+                self.serve_op(op, frame)
+            except Exception:
+                logging.warning("sidecar warm-up of %s failed", op, exc_info=True)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def _serve_replica(path: str, build, cpu: int | None):
+    if cpu is not None:
+        os.sched_setaffinity(0, {cpu})
+    server = SidecarServer(path, *build())
+    server.warm_up()
+    logging.info("face sidecar listening on %s%s", path, f" (cpu {cpu})" if cpu is not None else "")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def serve(path: str, build, replicas: int = 1, pin: bool = False):
+    """Run the sidecar on ``path`` until interrupted.
+
+    ``build()`` returns the ``(adapter, detector, liveness)`` each replica
+    loads once. ``replicas`` > 1 forks that many servers on ``<path>.0`` ..
+    ``<path>.N-1``; with ``pin`` replica i is pinned to the i-th usable CPU.
+    """
+    cpus = sorted(os.sched_getaffinity(0)) if pin and hasattr(os, "sched_getaffinity") else []
+    if replicas <= 1:
+        _serve_replica(path, build, cpus[0] if cpus else None)
+        return
+    fork = multiprocessing.get_context("fork")
+    procs = [fork.Process(target=_serve_replica, args=(f"{path}.{i}", build, cpus[i % len(cpus)] if cpus else None),
+                          name=f"face-sidecar-{i}", daemon=True) for i in range(replicas)]
+    for proc in procs:
+        proc.start()
+    try:
+        for proc in procs:
+            proc.join()
+    finally:
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
@@ -0,0 +1,174 @@
+import hashlib
+import os
+import struct
+
+import numpy as np
+
+from .index import MatchResult, _clean, _unit_probe
+
+
+MAGIC = b"VGAL"
+VERSION = 1
+HEADER_SIZE = 4096
+_ALIGN = 64
+# magic, version, dim, count, watermark (epoch seconds), generation, sha256, model_name length
+_HEADER = struct.Struct("<4sHIQdQ32sH")
+
+
+def _aligned(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _layout(dim: int, count: int) -> tuple[int, int, int, int]:
+    vectors_at = HEADER_SIZE
+    ids_at = vectors_at + _aligned(count * dim * 4)
+    owners_at = ids_at + _aligned(count * 8)
+    end = owners_at + count * 8
+    return vectors_at, ids_at, owners_at, end
+
+
+def snapshot_size(dim: int, count: int) -> int:
+    """Bytes needed for a snapshot of ``count`` rows of dimension ``dim``."""
+    return _layout(dim, count)[3]
+
+
+def _prepare(model_name, vectors, ids, owners, watermark, generation):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    owners = np.ascontiguousarray(owners, dtype=np.int64)
+    dim = vectors.shape[1] if vectors.ndim == 2 else 0
+    name = model_name.encode()
+    if _HEADER.size + len(name) > HEADER_SIZE:
+        raise ValueError("model name too long for snapshot header")
+    digest = hashlib.sha256()
+    for part in (vectors, ids, owners):
+        digest.update(memoryview(part).cast("B"))
+    header = _HEADER.pack(MAGIC, VERSION, dim, len(ids), float(watermark), int(generation), digest.digest(), len(name)) + name
+    return header.ljust(HEADER_SIZE, b"\0"), dim, (vectors, ids, owners)
+
+
+def pack_snapshot(buf, model_name: str, vectors: np.ndarray, ids: np.ndarray, owners: np.ndarray,
+                  watermark: float, generation: int = 0) -> None:
+    """Write a snapshot into a writable buffer of at least :func:`snapshot_size` bytes."""
+    header, dim, parts = _prepare(model_name, vectors, ids, owners, watermark, generation)
+    out = np.frombuffer(buf, dtype=np.uint8)
+    for offset, part in zip(_layout(dim, len(parts[1]))[:3], parts):
+        raw = np.frombuffer(memoryview(part).cast("B"), dtype=np.uint8)
+        out[offset:offset + raw.size] = raw
+    out[:HEADER_SIZE] = np.frombuffer(header, dtype=np.uint8)
+
+
+def write_snapshot(path: str, model_name: str, vectors: np.ndarray, ids: np.ndarray, owners: np.ndarray,
+                   watermark: float, generation: int = 0) -> None:
+    """Write a gallery snapshot file atomically.
+
+    Layout: a 4 KiB header (magic, format version, dim, count, watermark,
+    generation, SHA-256 of the payload, model name) followed by the (N, d)
+    float32 matrix, the int64 embedding ids and the int64 owner ids, each
+    64-byte aligned so readers can ``np.memmap`` them in place. Rows must be
+    sorted by embedding id.
+    """
+    header, dim, parts = _prepare(model_name, vectors, ids, owners, watermark, generation)
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "wb") as fh:
+        fh.write(header)
+        for offset, part in zip(_layout(dim, len(parts[1]))[:3], parts):
+            fh.seek(offset)
+            fh.write(memoryview(part).cast("B"))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+class GallerySnapshot:
+    """Read-only gallery snapshot written by :func:`write_snapshot` or :func:`pack_snapshot`.
+
+    Opened from a path, the arrays are ``np.memmap`` views, so every process
+    mapping the same file shares one page-cache copy of the matrix. Opened
+    from a buffer they are zero-copy views of it, marked read-only; ``owner``
+    (e.g. the ``SharedMemory`` the buffer belongs to) is kept alive with them.
+    """
+
+    def __init__(self, path: str | None = None, buffer=None, owner=None):
+        self.path = path
+        self.owner = owner
+        if buffer is not None:
+            raw = bytes(memoryview(buffer)[:HEADER_SIZE])
+            size = len(memoryview(buffer).cast("B"))
+        else:
+            with open(path, "rb") as fh:
+                raw = fh.read(HEADER_SIZE)
+            size = os.path.getsize(path)
+        if len(raw) < _HEADER.size:
+            raise ValueError("truncated gallery snapshot")
+        magic, version, dim, count, watermark, generation, digest, name_len = _HEADER.unpack_from(raw)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a gallery snapshot (or unsupported version)")
+        self.model_name = raw[_HEADER.size:_HEADER.size + name_len].decode()
+        self.dim = dim
+        self.count = count
+        self.watermark = watermark
+        self.generation = generation
+        self.digest = digest
+        vectors_at, ids_at, owners_at, end = _layout(dim, count)
+        if size < end:
+            raise ValueError("truncated gallery snapshot")
+        if not count:
+            self.vectors = np.empty((0, dim), dtype=np.float32)
+            self.ids = np.empty((0,), dtype=np.int64)
+            self.owners = np.empty((0,), dtype=np.int64)
+        elif buffer is not None:
+            self.vectors = np.frombuffer(buffer, dtype=np.float32, count=count * dim, offset=vectors_at).reshape(count, dim)
+            self.ids = np.frombuffer(buffer, dtype=np.int64, count=count, offset=ids_at)
+            self.owners = np.frombuffer(buffer, dtype=np.int64, count=count, offset=owners_at)
+            for array in (self.vectors, self.ids, self.owners):
+                array.flags.writeable = False
+        else:
+            self.vectors = np.memmap(path, dtype=np.float32, mode="r", offset=vectors_at, shape=(count, dim))
+            self.ids = np.memmap(path, dtype=np.int64, mode="r", offset=ids_at, shape=(count,))
+            self.owners = np.memmap(path, dtype=np.int64, mode="r", offset=owners_at, shape=(count,))
+
+    def verify(self) -> bool:
+        """Recompute the payload checksum (reads the whole file)."""
+        digest = hashlib.sha256()
+        for part in (self.vectors, self.ids, self.owners):
+            digest.update(memoryview(np.ascontiguousarray(part)).cast("B"))
+        return digest.digest() == self.digest
+
+    def rows_for(self, ids) -> np.ndarray:
+        """Row numbers of embedding ``ids`` in this snapshot (-1 where absent)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not self.count:
+            return np.full(ids.shape, -1, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.ids, ids), self.count - 1)
+        return np.where(self.ids[rows] == ids, rows, -1)
+
+
+class SnapshotOverlay:
+    """Exact search over a memory-mapped base matrix plus in-memory delta rows.
+
+    Rows ``[0, len(base))`` are snapshot rows (masked out by ``base_live``
+    once superseded or removed); rows after that are the delta matrix.
+    """
+
+    __slots__ = ("base", "base_live", "delta", "live_count")
+
+    def __init__(self, base: np.ndarray, base_live: np.ndarray, delta: np.ndarray, live_count: int):
+        self.base = base
+        self.base_live = base_live
+        self.delta = delta
+        self.live_count = live_count
+
+    def __len__(self):
+        return self.live_count
+
+    def search(self, probe, k: int = 2) -> MatchResult:
+        p = _unit_probe(probe)
+        if p is None or self.live_count == 0:
+            return MatchResult.empty()
+        base = _clean(np.asarray(self.base @ p)) if len(self.base) else np.empty((0,), dtype=np.float32)
+        base[~self.base_live] = -np.inf
+        delta = _clean(self.delta @ p) if len(self.delta) else np.empty((0,), dtype=np.float32)
+        res = MatchResult.from_scores(np.concatenate([base, delta]), k)
+        keep = np.isfinite(res.scores)
+        return MatchResult(res.indices[keep], res.scores[keep])
@@ -0,0 +1,759 @@
+import io
+import os
+import signal
+import tempfile
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+from django.apps import apps
+from django.test import SimpleTestCase
+
+from . import registry
+from .adapter import FaceAdapter
+from .batching import MicroBatcher
+from .context import FaceContext, accepts_context, luma
+from .detect import FaceDetector
+from .devfuncs import robust_embed
+from .execution import (
+    DEFAULT_ROUTES, ProcessTransport, _parse_routes, load_stage_callable, shutdown_pools, stage_routes,
+)
+from .imaging import ImageDecodeError, ImageTooLarge, decode_bgr
+from .index import CentroidIndex, HNSWIndex, IVFIndex, MatchResult, SimHashIndex, exact_search
+from .liveness import LivenessChecker
+from .pipeline import ENROLL_STAGES, MATCH_STAGES, FacePipeline, GalleryEngine, Rejected
+from .quant import QuantizedSnapshot, quantize
+from .registry import FaceSettings
+from .shm import SharedGalleryReader, SharedGalleryWriter, _Segment
+from .sidecar import RemoteCallable, SidecarClient, SidecarError, SidecarServer
+from .snapshot import GallerySnapshot, SnapshotOverlay, write_snapshot
+
+
+def _clustered(seed: int, n: int = 800, dim: int = 32, clusters: int = 20):
+    """Unit rows drawn around ``clusters`` centres, and 50 queries near existing rows."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim))
+    vectors = (centres[rng.integers(0, clusters, n)] + 0.35 * rng.normal(size=(n, dim))).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[:50] + (0.05 * rng.normal(size=(50, dim))).astype(np.float32)
+    return vectors, queries
+
+
+class MatchResultTests(SimpleTestCase):
+    def test_top_k_best_first(self):
+        res = MatchResult.from_scores(np.array([0.1, 0.9, 0.5, 0.7], dtype=np.float32), 3)
+        self.assertEqual(res.indices.tolist(), [1, 3, 2])
+        self.assertAlmostEqual(res.top1, 0.9)
+        self.assertAlmostEqual(res.top2, 0.7)
+        self.assertAlmostEqual(res.margin, 0.2, places=6)
+
+    def test_k_is_clamped_to_the_gallery(self):
+        res = MatchResult.from_scores(np.array([0.2, 0.4], dtype=np.float32), 10)
+        self.assertEqual(res.indices.tolist(), [1, 0])
+        self.assertEqual(MatchResult.from_scores(np.array([0.2], dtype=np.float32), 0).indices.tolist(), [0])
+
+    def test_single_row_has_no_runner_up(self):
+        res = MatchResult.from_scores(np.array([0.8], dtype=np.float32), 2)
+        self.assertEqual(res.top2, 0.0)
+        self.assertAlmostEqual(res.margin, res.top1)
+
+    def test_empty(self):
+        res = MatchResult.from_scores(np.empty((0,), dtype=np.float32), 2)
+        self.assertEqual((res.index, res.score, res.top2), (-1, 0.0, 0.0))
+
+    def test_exact_search_top_k(self):
+        gallery = np.eye(4, dtype=np.float32)
+        probe = np.array([0.1, 0.8, 0.0, 0.6], dtype=np.float32)
+        res = exact_search(gallery, probe, k=3)
+        self.assertEqual(res.indices.tolist(), [1, 3, 0])
+        self.assertTrue(np.all(np.diff(res.scores) <= 0))
+
+
+class IndexRecallTests(SimpleTestCase):
+    def test_ivf_recall_against_exact_search(self):
+        for seed in range(3):
+            vectors, queries = _clustered(seed)
+            index = IVFIndex(nprobe=8, min_size=0)
+            index.train(vectors)
+            self.assertGreaterEqual(index.snapshot(vectors).recall(queries, k=10), 0.95, f"seed {seed}")
+
+    def test_hnsw_recall_against_exact_search(self):
+        for seed in range(3):
+            vectors, queries = _clustered(seed)
+            index = HNSWIndex(M=8, ef_construction=64, ef=64, min_size=0)
+            index.train(vectors)
+            self.assertGreaterEqual(index.snapshot(vectors).recall(queries, k=10), 0.95, f"seed {seed}")
+
+    def test_hnsw_snapshot_survives_later_inserts(self):
+        # Inserts rewrite the shared link rows; the snapshot must keep to its own rows
+        vectors, queries = _clustered(0, n=600)
+        index = HNSWIndex(M=8, ef_construction=64, ef=64, min_size=0)
+        index.train(vectors[:400])
+        snapshot = index.snapshot(vectors[:400])
+        index.add(np.arange(400, 600), vectors)
+        found = np.concatenate([snapshot.search(q, 5).indices for q in queries])
+        self.assertLess(found.max(), 400)
+        self.assertGreaterEqual(snapshot.recall(queries, k=10), 0.95)
+        self.assertGreaterEqual(index.snapshot(vectors).recall(queries, k=10), 0.95)
+
+    def test_ivf_snapshot_is_unchanged_by_later_inserts(self):
+        vectors, queries = _clustered(1, n=600)
+        index = IVFIndex(nprobe=4, min_size=0)
+        index.train(vectors[:400])
+        snapshot = index.snapshot(vectors[:400])
+        before = [snapshot.search(q, 5).indices.tolist() for q in queries]
+        index.add(np.arange(400, 600), vectors)
+        self.assertEqual([snapshot.search(q, 5).indices.tolist() for q in queries], before)
+
+
+class SimHashIndexTests(SimpleTestCase):
+    def test_hamming_distance_counts_differing_signs(self):
+        vectors, queries = _clustered(0, n=200)
+        index = SimHashIndex(bits=128, candidates=20, min_size=0)
+        index.train(vectors)
+        snap = index.snapshot(vectors)
+        signs = (vectors @ index.planes.T) > 0
+        for q in queries[:5]:
+            p = q / np.linalg.norm(q)
+            expected = (signs != ((index.planes @ p) > 0)).sum(axis=1)
+            np.testing.assert_array_equal(snap.hamming(p), expected)
+
+    def test_recall_and_exact_scores(self):
+        for seed in range(3):
+            vectors, queries = _clustered(seed)
+            index = SimHashIndex(bits=256, candidates=100, min_size=0)
+            index.train(vectors)
+            snap = index.snapshot(vectors)
+            self.assertGreaterEqual(snap.recall(queries, k=10), 0.95, f"seed {seed}")
+            res, exact = snap.search(queries[0], 2), exact_search(vectors, queries[0], 2)
+            self.assertAlmostEqual(res.score, exact.score, places=6)
+
+    def test_snapshot_is_unchanged_by_later_inserts_and_remaps(self):
+        vectors, queries = _clustered(1, n=600)
+        index = SimHashIndex(bits=128, candidates=50, min_size=0)
+        index.train(vectors[:400])
+        snap = index.snapshot(vectors[:400])
+        before = [snap.search(q, 5).indices.tolist() for q in queries]
+        index.add(np.arange(400, 600), vectors)
+        mapping = np.arange(600)
+        mapping[:100] = -1
+        mapping[100:] -= 100
+        index.remap(mapping)
+        self.assertEqual([snap.search(q, 5).indices.tolist() for q in queries], before)
+        self.assertGreaterEqual(index.snapshot(vectors[100:]).recall(queries, k=5), 0.95)
+
+
+class CentroidIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centres = rng.normal(size=(40, 32))
+        self.owners = np.repeat(np.arange(100, 140), 3)
+        vectors = (centres[self.owners - 100] + 0.3 * rng.normal(size=(120, 32))).astype(np.float32)
+        self.vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.probes = centres + 0.3 * rng.normal(size=centres.shape)
+        self.index = CentroidIndex(candidates=4)
+        for owner, vec in zip(self.owners, self.vectors):
+            self.index.add(owner, vec)
+
+    def test_matches_exact_search(self):
+        snap = self.index.snapshot(self.vectors, self.owners)
+        self.assertEqual(len(snap.centroids), 40)
+        for probe in self.probes:
+            res, exact = snap.search(probe, 2), exact_search(self.vectors, probe, 2)
+            self.assertEqual(res.index, exact.index)
+            self.assertAlmostEqual(res.score, exact.score, places=5)
+
+    def test_centroid_is_the_normalized_mean(self):
+        snap = self.index.snapshot(self.vectors, self.owners)
+        mean = self.vectors[self.owners == 105].mean(axis=0)
+        slot = snap.centroid_owners.tolist().index(105)
+        np.testing.assert_allclose(snap.centroids[slot], mean / np.linalg.norm(mean), atol=1e-6)
+
+    def test_removed_owner_leaves_later_snapshots_only(self):
+        before = self.index.snapshot(self.vectors, self.owners)
+        for vec in self.vectors[self.owners == 100]:
+            self.index.remove(100, vec)
+        keep = self.owners != 100
+        after = self.index.snapshot(self.vectors[keep], self.owners[keep])
+        self.assertNotIn(100, after.centroid_owners.tolist())
+        self.assertNotEqual(self.owners[keep][after.search(self.probes[0], 1).index], 100)
+        self.assertEqual(self.owners[before.search(self.probes[0], 1).index], 100)
+
+
+class QuantizedSnapshotTests(SimpleTestCase):
+    def test_rerank_restores_float32_scores(self):
+        vectors, queries = _clustered(2)
+        for dtype in ("float16", "int8"):
+            codes, scales = quantize(vectors, dtype)
+            coarse = QuantizedSnapshot(codes, scales, rerank=16)
+            ranked = QuantizedSnapshot(codes, scales, fetch=vectors.__getitem__, rerank=16)
+            for q in queries:
+                exact, res = exact_search(vectors, q, 2), ranked.search(q, 2)
+                with self.subTest(dtype=dtype):
+                    self.assertEqual(res.index, exact.index)
+                    self.assertAlmostEqual(res.score, exact.score, places=6)
+                    self.assertAlmostEqual(coarse.search(q, 2).score, exact.score, places=1)
+
+
+class SnapshotTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "test.gallery")
+        self.vectors = np.eye(3, 8, dtype=np.float32)
+        write_snapshot(self.path, "test-model", self.vectors, np.array([10, 20, 30]), np.array([1, 2, 3]), 1234.5, 7)
+
+    def test_round_trip(self):
+        snap = GallerySnapshot(self.path)
+        self.assertEqual((snap.model_name, snap.dim, snap.count, snap.watermark, snap.generation),
+                         ("test-model", 8, 3, 1234.5, 7))
+        np.testing.assert_array_equal(snap.vectors, self.vectors)
+        self.assertEqual(snap.owners.tolist(), [1, 2, 3])
+        self.assertEqual(snap.rows_for([30, 15, 10]).tolist(), [2, -1, 0])
+        self.assertTrue(snap.verify())
+
+    def test_corruption_is_detected(self):
+        with open(self.path, "r+b") as fh:
+            fh.seek(-1, os.SEEK_END)
+            fh.write(b"\xff")
+        self.assertFalse(GallerySnapshot(self.path).verify())
+        with open(self.path, "r+b") as fh:
+            fh.truncate(100)
+        with self.assertRaises(ValueError):
+            GallerySnapshot(self.path)
+
+    def test_overlay_masks_base_rows_and_searches_the_delta(self):
+        snap = GallerySnapshot(self.path)
+        live = np.array([True, False, True])
+        delta = np.eye(1, 8, 5, dtype=np.float32)
+        overlay = SnapshotOverlay(snap.vectors, live, delta, 3)
+        self.assertEqual(len(overlay), 3)
+        self.assertEqual(overlay.search(np.eye(1, 8, 5)[0], 1).index, 3)
+        # Masked rows never come back, whatever the probe
+        self.assertNotIn(1, overlay.search(np.eye(1, 8, 1)[0], 4).indices.tolist())
+        self.assertEqual(len(overlay.search(np.eye(1, 8, 1)[0], 4).indices), 3)
+
+
+class SharedGalleryTests(SimpleTestCase):
+    def setUp(self):
+        # One segment family per test, so leftovers cannot leak between them
+        self.model_name = f"{self.id()}.{os.getpid()}"
+        self.reader = SharedGalleryReader(self.model_name, prefix="vgtest")
+
+    def current(self):
+        # Reader and writer share this process's resource tracker here; keep
+        # the writer's registrations so its unlink does not trip the tracker
+        with mock.patch("multiprocessing.resource_tracker.unregister"):
+            return self.reader.current()
+
+    def writer(self) -> SharedGalleryWriter:
+        writer = SharedGalleryWriter(self.model_name, prefix="vgtest")
+        self.addCleanup(lambda: writer._segments and writer.close())
+        return writer
+
+    def publish(self, writer, rows: int, generation: int = 1):
+        vectors = np.eye(rows, 4, dtype=np.float32)
+        ids = np.arange(1, rows + 1)
+        writer.publish(vectors, ids, ids * 10, 0.0, generation)
+
+    def test_reader_follows_publishes(self):
+        self.assertIsNone(self.current())
+        writer = self.writer()
+        self.assertIsNone(self.current())
+        self.publish(writer, 2)
+        first = self.current()
+        self.assertEqual(first.owners.tolist(), [10, 20])
+        self.assertFalse(first.vectors.flags.writeable)
+        self.assertIs(self.current(), first)
+        self.publish(writer, 3, generation=2)
+        self.assertEqual(self.current().count, 3)
+        # The superseded snapshot stays readable
+        self.assertEqual(first.owners.tolist(), [10, 20])
+
+    def test_stopped_loader_is_not_served(self):
+        writer = self.writer()
+        self.publish(writer, 2)
+        self.assertIsNotNone(self.current())
+        writer.close()
+        self.assertIsNone(self.current())
+
+    def test_restarted_loader_is_picked_up(self):
+        writer = self.writer()
+        self.publish(writer, 2)
+        self.assertEqual(self.current().count, 2)
+        writer.close()
+        self.assertIsNone(self.current())
+        # Same generation and sequence number: only the new epoch tells them apart
+        self.publish(self.writer(), 3)
+        self.assertEqual(self.current().count, 3)
+
+    def test_replaced_control_block_is_picked_up(self):
+        if not os.path.isdir("/dev/shm"):
+            self.skipTest("needs /dev/shm")
+        writer = self.writer()
+        self.publish(writer, 2)
+        self.assertEqual(self.current().count, 2)
+        # A crashed loader's segments are removed without clearing the control block
+        for seg in [writer._ctl, *writer._segments]:
+            seg.unlink()
+        writer._segments = []
+        self.publish(self.writer(), 3, generation=5)
+        self.assertEqual(self.current().count, 3)
+
+
+class _RowEmbedder:
+    """Embeds an image as its flattened pixels; ``bad`` images raise."""
+
+    def __init__(self, bad=None, gate=None):
+        self.bad = bad
+        self.gate = gate
+        self.batches = []
+
+    def embed_batch(self, images):
+        if self.gate is not None:
+            self.gate.wait()
+        self.batches.append(len(images))
+        if any(img is self.bad for img in images):
+            raise ValueError("bad probe")
+        return np.stack([np.asarray(img, dtype=np.float32).ravel() for img in images])
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def probes(self, n: int = 6):
+        return [np.random.default_rng(i).normal(size=(2, 4)) for i in range(n)]
+
+    def test_concurrent_probes_share_one_embed_and_match(self):
+        gate = threading.Event()
+        adapter = _RowEmbedder(gate=gate)
+        batcher = MicroBatcher(adapter, max_batch=16, max_wait_ms=200, timeout_ms=5000)
+        gallery = np.eye(8, dtype=np.float32)
+        futures = [batcher.submit(img, gallery) for img in self.probes()]
+        gate.set()
+        for img, future in zip(self.probes(), futures):
+            probe, res = batcher.wait(future)
+            exact = exact_search(gallery, img.ravel(), 2)
+            self.assertEqual(res.indices.tolist(), exact.indices.tolist())
+            self.assertAlmostEqual(float(np.linalg.norm(probe)), 1.0, places=5)
+        self.assertEqual(adapter.batches, [6])
+
+    def test_failing_probe_only_fails_itself(self):
+        probes = self.probes()
+        gate = threading.Event()
+        adapter = _RowEmbedder(bad=probes[2], gate=gate)
+        batcher = MicroBatcher(adapter, max_batch=16, max_wait_ms=200, timeout_ms=5000)
+        futures = [batcher.submit(img) for img in probes]
+        with self.assertLogs(level="WARNING") as logs:
+            gate.set()
+            for i, future in enumerate(futures):
+                if i == 2:
+                    with self.assertRaises(ValueError):
+                        batcher.wait(future)
+                else:
+                    self.assertIsNone(batcher.wait(future)[1])
+        self.assertIn("retrying them one by one", logs.output[0])
+
+    def test_wait_times_out_and_drops_the_probe(self):
+        gate = threading.Event()
+        self.addCleanup(gate.set)
+        batcher = MicroBatcher(_RowEmbedder(gate=gate), max_batch=1, max_wait_ms=0, timeout_ms=50)
+        batcher.submit(self.probes(1)[0])  # holds the worker at the gate
+        queued = batcher.submit(self.probes(1)[0])
+        with self.assertRaises(FutureTimeout):
+            batcher.wait(queued)
+        self.assertTrue(queued.cancelled())
+
+
+def _encoded(img: Image.Image, fmt: str = "PNG") -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+class DecodeTests(SimpleTestCase):
+    def test_large_images_are_shrunk_while_decoding(self):
+        rgb = Image.new("RGB", (4000, 1000), (255, 0, 0))
+        for fmt in ("PNG", "JPEG"):
+            with self.subTest(fmt=fmt):
+                out = decode_bgr(_encoded(rgb, fmt), max_side=1000)
+                self.assertLessEqual(max(out.shape[:2]), 1000)
+                self.assertGreaterEqual(max(out.shape[:2]), 500)
+                np.testing.assert_allclose(out[10, 10], [0, 0, 255], atol=2)
+                self.assertFalse(out.flags.writeable)
+
+    def test_palette_image_keeps_its_colours(self):
+        # Pillow's reduce() rejects palette images; they are converted first
+        img = Image.new("RGB", (3000, 400), (0, 0, 255))
+        img.paste((0, 255, 0), (1500, 0, 3000, 400))
+        img = img.convert("P", palette=Image.Palette.ADAPTIVE, colors=4)
+        out = decode_bgr(_encoded(img), max_side=1000)
+        self.assertEqual(out.shape, (134, 1000, 3))
+        np.testing.assert_array_equal(out[50, 100], [255, 0, 0])
+        np.testing.assert_array_equal(out[50, 900], [0, 255, 0])
+
+    def test_one_bit_and_sixteen_bit_images(self):
+        for img in (Image.new("1", (3000, 300), 1), Image.new("I;16", (3000, 300), 200)):
+            with self.subTest(mode=img.mode):
+                out = decode_bgr(_encoded(img), max_side=1000)
+                self.assertEqual(out.shape, (100, 1000, 3))
+
+    def test_pixel_budget_and_garbage(self):
+        with self.assertRaises(ImageTooLarge):
+            decode_bgr(_encoded(Image.new("L", (1000, 1000))), max_pixels=999_999)
+        with self.assertRaises(ImageDecodeError):
+            decode_bgr(b"not an image")
+
+
+def _frame(seed: int = 0, shape=(96, 128, 3)) -> np.ndarray:
+    return (np.random.default_rng(seed).random(shape) * 255).astype(np.uint8)
+
+
+class FaceContextTests(SimpleTestCase):
+    def test_gray_matches_the_luma_expression(self):
+        bgr = _frame()
+        expected = 0.114 * bgr[..., 0].astype(np.float32) + 0.587 * bgr[..., 1] + 0.299 * bgr[..., 2]
+        np.testing.assert_allclose(FaceContext(bgr).gray, expected, rtol=1e-6)
+
+    def test_forms_are_computed_once(self):
+        ctx, calls = FaceContext(_frame()), []
+        threads = [threading.Thread(target=ctx.cached, args=("key", lambda: calls.append(1) or len(calls)))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual((calls, ctx.cached("key", list)), ([1], 1))
+        self.assertIs(ctx.gray, ctx.gray)
+
+    def test_pyramid_levels_average_2x2_blocks(self):
+        ctx = FaceContext(_frame(shape=(9, 13, 3)))
+        self.assertIs(ctx.level(0), ctx.bgr)
+        one = ctx.level(1)
+        self.assertEqual(one.shape, (4, 6, 3))
+        block = ctx.bgr[2:4, 4:6].astype(np.float64)
+        np.testing.assert_array_equal(one[1, 2], np.floor(block.mean(axis=(0, 1)) + 0.5))
+        self.assertEqual(ctx.level(2).shape, (2, 3, 3))
+
+    def test_face_samples_follow_the_selected_face(self):
+        ctx = FaceContext(_frame())
+        whole = ctx.face_sample(16)
+        ctx.set_face(ctx.bgr[10:74, 20:84], (20, 10, 84, 74))
+        self.assertEqual(ctx.face_box, (20, 10, 84, 74))
+        self.assertFalse(np.array_equal(ctx.face_sample(16), whole))
+        np.testing.assert_array_equal(ctx.face_gray_sample(16), luma(ctx.face_sample(16)))
+
+    def test_cached_forms_do_not_change_embeddings(self):
+        bgr = _frame()
+        crop = bgr[10:74, 20:84]
+        expected = robust_embed(crop)
+        for liveness_ran in (False, True):
+            with self.subTest(liveness_ran=liveness_ran):
+                ctx = FaceContext(bgr)
+                if liveness_ran:
+                    ctx.gray
+                ctx.set_face(crop, (20, 10, 84, 74))
+                np.testing.assert_array_equal(robust_embed(ctx.face, ctx=ctx), expected)
+
+    def test_callables_opt_in_with_a_ctx_parameter(self):
+        self.assertTrue(accepts_context(robust_embed))
+        self.assertFalse(accepts_context(lambda bgr: bgr))
+        self.assertFalse(accepts_context(len))
+
+
+class _BoxDetector:
+    """Detector callable returning a fixed (bbox, prob) and recording the frames it saw."""
+
+    def __init__(self, box=(2, 4, 10, 12), prob=0.99):
+        self.result = (box, prob)
+        self.shapes = []
+
+    def __call__(self, bgr):
+        self.shapes.append(bgr.shape[:2])
+        return self.result
+
+
+class PrecropTests(SimpleTestCase):
+    def detector(self, fn, mode: str = "verify") -> FaceDetector:
+        env = {"FACE_PRECROP_MODE": mode, "FACE_PRECROP_MAX_SIDE": "64", "FACE_PRECROP_MIN_SCORE": "0.9"}
+        with mock.patch.dict(os.environ, env), mock.patch("facekit.detect.load_stage_callable", return_value=fn):
+            return FaceDetector()
+
+    def test_full_frames_are_detected_and_recorded(self):
+        fn = _BoxDetector()
+        ctx = FaceContext(np.zeros((480, 640, 3), dtype=np.uint8))
+        face = self.detector(fn).face_image(ctx)
+        self.assertEqual(fn.shapes, [(480, 640)])
+        self.assertEqual(face.shape, (8, 8, 3))
+        self.assertIs(ctx.face, face)
+        self.assertEqual(ctx.face_box, (2, 4, 10, 12))
+
+    def test_trusted_crops_skip_the_detector(self):
+        fn = _BoxDetector()
+        crop = np.zeros((64, 64, 3), dtype=np.uint8)
+        face = self.detector(fn, "trust").face_image(crop, precropped=True, client_score=0.95)
+        self.assertIs(face, crop)
+        self.assertEqual(fn.shapes, [])
+
+    def test_crops_are_verified_unless_trusted(self):
+        crop, frame = np.zeros((64, 64, 3), dtype=np.uint8), np.zeros((65, 64, 3), dtype=np.uint8)
+        cases = [
+            ("verify", crop, 0.99),  # verify mode always re-detects
+            ("trust", crop, 0.5),  # the client's score is below FACE_PRECROP_MIN_SCORE
+            ("trust", crop, None),  # no client score
+            ("trust", frame, 0.99),  # larger than FACE_PRECROP_MAX_SIDE: not a crop
+        ]
+        for mode, image, score in cases:
+            with self.subTest(mode=mode, shape=image.shape, score=score):
+                fn = _BoxDetector()
+                face = self.detector(fn, mode).face_image(image, precropped=True, client_score=score)
+                self.assertEqual(fn.shapes, [image.shape[:2]])
+                self.assertEqual(face.shape, (8, 8, 3))
+
+    def test_low_probability_detections_are_rejected(self):
+        fn = _BoxDetector(prob=0.5)
+        self.assertIsNone(self.detector(fn).face_image(np.zeros((64, 64, 3), dtype=np.uint8), precropped=True))
+
+
+def _engine(rows: int = 3, dim: int = 128) -> GalleryEngine:
+    vectors = np.eye(rows, dim, dtype=np.float32)
+    return GalleryEngine(lambda _model: (vectors, np.arange(1, rows + 1, dtype=np.int64)))
+
+
+def _empty_engine() -> GalleryEngine:
+    return GalleryEngine(lambda _model: (np.empty((0, 0), dtype=np.float32), np.empty((0,), dtype=np.int64)))
+
+
+class PipelineRejectionTests(SimpleTestCase):
+    def _pipeline(self, stages=MATCH_STAGES, threshold: float = 0.7) -> FacePipeline:
+        settings = FaceSettings()
+        settings.match_threshold = threshold
+        return FacePipeline(stages, name="test", settings=settings)
+
+    def _rejected(self, pipeline, source, engine=None) -> Rejected:
+        with self.assertRaises(Rejected) as caught:
+            pipeline.run(source, engine)
+        return caught.exception
+
+    async def _arejected(self, pipeline, source, engine=None) -> Rejected:
+        with self.assertRaises(Rejected) as caught:
+            await pipeline.arun(source, engine)
+        return caught.exception
+
+    def _cases(self):
+        dark = np.zeros((64, 64, 3), dtype=np.uint8)
+        return [
+            ("decode", self._pipeline(), b"not an image", _engine()),
+            ("liveness", self._pipeline(), dark, _engine()),
+            ("gallery", self._pipeline(), _frame(), _empty_engine()),
+            ("match", self._pipeline(threshold=2.0), _frame(), _engine()),
+            ("liveness", self._pipeline(ENROLL_STAGES), dark, None),
+        ]
+
+    def test_rejecting_stages(self):
+        for stage, pipeline, source, engine in self._cases():
+            with self.subTest(stage=stage, stages=pipeline.stages):
+                self.assertEqual(self._rejected(pipeline, source, engine).stage, stage)
+
+    async def test_rejecting_stages_async(self):
+        for stage, pipeline, source, engine in self._cases():
+            with self.subTest(stage=stage, stages=pipeline.stages):
+                self.assertEqual((await self._arejected(pipeline, source, engine)).stage, stage)
+
+    def test_earlier_stage_rejection_wins(self):
+        # The gallery rejects at once while liveness is still running; liveness must decide
+        dark = np.zeros((480, 640, 3), dtype=np.uint8)
+        for _ in range(5):
+            self.assertEqual(self._rejected(self._pipeline(), dark, _empty_engine()).stage, "liveness")
+
+    async def test_earlier_stage_rejection_wins_async(self):
+        dark = np.zeros((480, 640, 3), dtype=np.uint8)
+        for _ in range(5):
+            self.assertEqual((await self._arejected(self._pipeline(), dark, _empty_engine())).stage, "liveness")
+
+    def test_accepts_a_match(self):
+        res = self._pipeline(threshold=0.0).run(_frame(), _engine())
+        self.assertIn(res.owner_id, (1, 2, 3))
+        self.assertEqual(res.engine, "exact")
+        self.assertEqual(set(res.timings), set(MATCH_STAGES))
+
+    async def test_accepts_a_match_async(self):
+        res = await self._pipeline(threshold=0.0).arun(_frame(), _engine())
+        self.assertIn(res.owner_id, (1, 2, 3))
+        self.assertEqual(res.engine, "exact")
+
+    def test_stage_lists_are_checked(self):
+        with self.assertRaises(ValueError):
+            FacePipeline(("decode", "crop"))
+        with self.assertRaises(ValueError):
+            FacePipeline(("decode", "match"))
+        with self.assertRaises(ValueError):
+            self._pipeline().run(_frame())
+
+
+class SidecarTests(SimpleTestCase):
+    EMBED = "facekit.devfuncs:robust_embed"
+
+    def setUp(self):
+        # Client and server share this process's resource tracker here; keep
+        # the client's registrations so its unlink does not trip the tracker
+        self.enterContext(mock.patch("facekit.sidecar._attach", lambda name: _Segment(name=name)))
+        with mock.patch.dict(os.environ, {"FACE_EMBED_FUNC": self.EMBED}):
+            adapter = FaceAdapter()
+        with mock.patch("facekit.detect.load_stage_callable", return_value=_BoxDetector()):
+            detector = FaceDetector()
+        self.path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), "sidecar.sock")
+        server = SidecarServer(self.path, adapter, detector, LivenessChecker())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+    def remote(self, op: str, func_path: str = EMBED, path: str | None = None) -> RemoteCallable:
+        client = SidecarClient(path or self.path, replicas=1, timeout=5.0)
+
+        def close():
+            channel = getattr(client._local, "channel", None)
+            if channel is not None:
+                channel.close()
+
+        self.addCleanup(close)
+        return RemoteCallable(op, func_path, transport=client)
+
+    def test_ops_match_the_in_process_callables(self):
+        frame = _frame()
+        embed = self.remote("embed")
+        vectors = [embed(frame), embed(_frame(1)), embed(frame)]
+        np.testing.assert_array_equal(vectors[0], robust_embed(frame))
+        np.testing.assert_array_equal(vectors[2], vectors[0])
+        self.assertEqual(self.remote("detect")(frame), ((2, 4, 10, 12), 0.99))
+        liveness = self.remote("liveness")
+        self.assertIs(liveness(frame), True)
+        self.assertIs(liveness(np.zeros((64, 64, 3), dtype=np.uint8)), False)
+
+    def test_larger_frames_grow_the_segment(self):
+        embed = self.remote("embed")
+        for shape in ((64, 64, 3), (1024, 800, 3), (96, 128, 3)):
+            frame = _frame(shape=shape)
+            np.testing.assert_array_equal(embed(frame), robust_embed(frame))
+
+    def test_unreachable_sidecar_runs_in_process(self):
+        embed = self.remote("embed", path=self.path + ".missing")
+        with self.assertLogs(level="WARNING"):
+            np.testing.assert_array_equal(embed(_frame()), robust_embed(_frame()))
+        with self.assertLogs(level="WARNING"), self.assertRaises(SidecarError):
+            self.remote("embed", func_path="facekit.missing:embed", path=self.path + ".missing")(_frame())
+
+    def test_failing_op_runs_in_process(self):
+        remote = self.remote("embed")
+        # The sidecar replies with an error header; the frame is embedded here instead
+        remote.op = "unknown"
+        with self.assertLogs(level="WARNING"):
+            np.testing.assert_array_equal(remote(_frame()), robust_embed(_frame()))
+
+
+class StageRoutingTests(SimpleTestCase):
+    def setUp(self):
+        _parse_routes.cache_clear()
+
+    def routes(self, value: str) -> dict:
+        with mock.patch.dict(os.environ, {"FACE_STAGE_ROUTES": value}):
+            return stage_routes()
+
+    def test_routes_override_the_defaults(self):
+        self.assertEqual(self.routes(""), DEFAULT_ROUTES)
+        routes = self.routes(" Liveness=process, embed=process ,gallery=inline")
+        self.assertEqual(routes, {**DEFAULT_ROUTES, "liveness": "process", "embed": "process", "gallery": "inline"})
+
+    def test_malformed_routes_fall_back_to_the_defaults(self):
+        for value in ("embed=thread", "match=process", "crop=inline", "liveness", "detect=process,decode=thread"):
+            with self.subTest(value=value):
+                with self.assertLogs(level="WARNING"):
+                    self.assertEqual(self.routes(value), DEFAULT_ROUTES)
+                # Warned once, not on every component build
+                with self.assertNoLogs(level="WARNING"):
+                    self.assertEqual(self.routes(value), DEFAULT_ROUTES)
+
+    def test_process_routed_stages_run_in_the_pool(self):
+        env = {"FACE_STAGE_ROUTES": "embed=process", "FACE_STAGE_PROCESSES": "1",
+               "FACE_EMBED_FUNC": SidecarTests.EMBED, "FACE_SIDECAR_SOCKET": ""}
+        self.addCleanup(shutdown_pools)
+        with mock.patch.dict(os.environ, env):
+            embed = load_stage_callable("embed", SidecarTests.EMBED)
+        self.assertIsInstance(embed.transport, ProcessTransport)
+        frame = _frame()
+        with mock.patch.object(embed, "_local", side_effect=AssertionError("ran in-process")):
+            np.testing.assert_array_equal(embed(frame), robust_embed(frame))
+        # A call that times out is retried in-process
+        pending = mock.Mock(**{"submit.return_value": Future()})
+        embed.transport = ProcessTransport(timeout=0.01)
+        with mock.patch("facekit.execution.process_pool", return_value=pending), self.assertLogs(level="WARNING"):
+            np.testing.assert_array_equal(embed(frame), robust_embed(frame))
+
+
+class RegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(registry.reload)
+        self.addCleanup(signal.signal, signal.SIGUSR2, signal.getsignal(signal.SIGUSR2))
+
+    def test_components_are_shared_until_reloaded(self):
+        first = registry.components()
+        self.assertIs(registry.components(), first)
+        with mock.patch.dict(os.environ, {"FACE_MATCH_THRESHOLD": "0.9"}):
+            rebuilt = registry.reload()
+        self.assertIsNot(rebuilt, first)
+        self.assertEqual(rebuilt.settings.match_threshold, 0.9)
+        self.assertIs(registry.components(), rebuilt)
+
+    def test_requested_reload_builds_in_the_background(self):
+        first = registry.components()
+        registry.request_reload()
+        # The old build keeps serving while the new one is made
+        self.assertIs(registry.components(), first)
+        for thread in threading.enumerate():
+            if thread.name == "face-reload":
+                thread.join()
+        self.assertIsNot(registry.components(), first)
+
+    def test_warmup_hooks_run_after_each_build(self):
+        calls = []
+        self.addCleanup(registry._WARMUP_HOOKS.remove, calls.append)
+        registry.add_warmup_hook(calls.append)
+        registry.reload()
+        self.assertEqual(calls, [])
+        with mock.patch.dict(os.environ, {"FACE_WARMUP": "true"}):
+            parts = registry.reload()
+        self.assertEqual(calls, [parts])
+
+    def install(self, value: str | None):
+        with mock.patch.dict(os.environ):
+            os.environ.pop("FACE_RELOAD_SIGNAL", None)
+            if value is not None:
+                os.environ["FACE_RELOAD_SIGNAL"] = value
+            registry.install_reload_signal()
+        return signal.getsignal(signal.SIGUSR2)
+
+    def test_reload_signal_is_opt_in(self):
+        signal.signal(signal.SIGUSR2, signal.SIG_DFL)
+        self.assertIs(self.install(None), signal.SIG_DFL)
+        self.assertIs(self.install(""), signal.SIG_DFL)
+        with self.assertLogs(level="WARNING"):
+            self.assertIs(self.install("SIGNOPE"), signal.SIG_DFL)
+        self.assertIs(self.install("usr2"), registry.request_reload)
+        self.assertIs(self.install("SIGUSR2"), registry.request_reload)
+
+    def test_app_startup_does_not_take_the_signal(self):
+        # Management commands run the app registry but not the WSGI/ASGI entry points
+        signal.signal(signal.SIGUSR2, signal.SIG_DFL)
+        with mock.patch.dict(os.environ, {"FACE_RELOAD_SIGNAL": "SIGUSR2"}):
+            apps.get_app_config("accounts").ready()
+        self.assertIs(signal.getsignal(signal.SIGUSR2), signal.SIG_DFL)
+
+    def test_a_signal_the_server_handles_is_left_alone(self):
+        def reexec(*_):
+            pass
+
+        signal.signal(signal.SIGUSR2, reexec)
+        with self.assertLogs(level="WARNING"):
+            self.assertIs(self.install("SIGUSR2"), reexec)
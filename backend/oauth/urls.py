@@ -1,12 +1,15 @@
+from django.conf import settings
 from django.urls import path
 from .views_discovery import openid_configuration
-from . import views
+from . import views, views_async
+
+verify = views_async if settings.FACE_ASYNC_VIEWS else views
 
 urlpatterns = [
     path(".well-known/openid-configuration", openid_configuration),
     path("jwks.json", views.jwks),
     path("authorize", views.authorize),
-    path("authorize/verify", views.authorize_verify),
+    path("authorize/verify", verify.authorize_verify),
     path("token", views.token),
     path("userinfo", views.userinfo),
     path("revoke", views.revoke),
@@ -1,11 +1,8 @@
 import base64
 import hashlib
-import io
 import json
 import secrets
 
-import numpy as np
-from PIL import Image
 from django.conf import settings
 from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse, HttpResponseRedirect
 from django.utils import timezone
@@ -15,16 +12,13 @@ import os
 import logging
 
 from .models import AuthSession, AuthorizationCode, Token
-from orgs.models import OAuthClient
+from orgs.models import GalleryMember, OAuthClient
 from accounts.models import User
-from facekit.adapter import FaceAdapter
-from facekit.liveness import LivenessChecker
-from facekit.detect import FaceDetector
+from accounts.gallery import match_engine
+from accounts.uploads import crop_hint, read_upload, request_fields
+from facekit.pipeline import MATCH_STAGES, FacePipeline, Rejected
 from . import tokens
 
-adapter = FaceAdapter()
-liveness = LivenessChecker()
-
 def jwks(request):
     return JsonResponse(json.loads(settings.PUBKEY_JWKS))
 
@@ -40,6 +34,7 @@ def authorize(request):
         "code_challenge": request.GET.get("code_challenge", ""),
         "code_challenge_method": request.GET.get("code_challenge_method", ""),
         "scope": request.GET.get("scope", ""),
+        "login_hint": request.GET.get("login_hint", ""),
     }
     html = f"""<!DOCTYPE html>
 <html>
@@ -56,11 +51,11 @@ def authorize(request):
         const v = document.getElementById('video');
         canvas.width = v.videoWidth; canvas.height = v.videoHeight;
         canvas.getContext('2d').drawImage(v,0,0);
-        const img = canvas.toDataURL('image/png');
-        const resp = await fetch('authorize/verify', {{
+        const img = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.92));
+        const resp = await fetch('authorize/verify?' + new URLSearchParams(params), {{
           method: 'POST',
-          headers: {{'Content-Type':'application/json'}},
-          body: JSON.stringify(Object.assign({{image: img}}, params))
+          headers: {{'Content-Type':'image/jpeg'}},
+          body: img
         }});
         const data = await resp.json();
         if (data.redirect) {{ window.location = data.redirect; }}
@@ -74,22 +69,11 @@ def authorize(request):
 def authorize_verify(request):
     if request.method != "POST":
         return HttpResponseBadRequest("POST required")
-    content_type = request.META.get("CONTENT_TYPE", "")
-    if content_type.startswith("application/json"):
-        try:
-            data = json.loads(request.body.decode() or "{}")
-        except Exception:
-            data = {}
-    else:
-        data = request.POST.dict()
+    # OAuth params come from the form, JSON body or (raw image body) query string
+    data = request_fields(request)
     client_id = data.get("client_id")
     state = data.get("state")
     redirect_uri = data.get("redirect_uri")
-    image_b64 = data.get("image")
-    if not image_b64:
-        if os.getenv("FACE_DEBUG", "").lower() == "true":
-            logging.warning("authorize_verify missing payload: ct=%s, has_image=%s", content_type, bool(image_b64))
-        return HttpResponseBadRequest("image required")
     try:
         client = OAuthClient.objects.get(client_id=client_id)
     except OAuthClient.DoesNotExist:
@@ -97,70 +81,46 @@ def authorize_verify(request):
     # Validate redirect_uri against registered URIs
     if redirect_uri not in (client.redirect_uris or []):
         return HttpResponseBadRequest("invalid redirect_uri")
-    # Decode image(s) and run checks
-    def to_bgr(data_url):
-        raw = base64.b64decode(data_url.split(",")[-1])
-        image = Image.open(io.BytesIO(raw))
-        return np.array(image)[:, :, ::-1]
-
-    try:
-        bgr = to_bgr(image_b64)
-    except Exception:
-        return HttpResponseBadRequest("invalid image data")
-
-    if not liveness.check(bgr):
-        return HttpResponseBadRequest("liveness failed")
-    # Build gallery over all active embeddings for current adapter.model_name and keep mapping to user
-    embeddings = []
-    owners = []
-    from accounts.models import FaceEmbedding as FE
-    from facekit.crypto import decrypt
-    for fe in FE.objects.filter(active=True, model_name=adapter.model_name).select_related("user"):
-        try:
-            plaintext = decrypt(bytes(fe.vector))
-            vec = np.frombuffer(plaintext, dtype=np.float32)
-            embeddings.append(vec)
-            owners.append(fe.user)
-        except Exception:
-            continue
-    # Detect/crop single frame if detector configured
-    detector = FaceDetector()
-    crop = detector.detect_and_crop(bgr)
-    if detector._fn is not None and crop is None:
-        return HttpResponseBadRequest("no face detected")
-    face_img = crop if crop is not None else bgr
-    probe = adapter.embed(face_img).astype(np.float32)
-    n = float(np.linalg.norm(probe))
-    if n > 0:
-        probe /= n
-    idx, score = adapter.match(probe, embeddings)
-    import os
-    try:
-        threshold = float(os.getenv("FACE_MATCH_THRESHOLD", "0.7"))
-    except ValueError:
-        threshold = 0.7
+    upload = read_upload(request)
+    if isinstance(upload, HttpResponseBadRequest):
+        if os.getenv("FACE_DEBUG", "").lower() == "true":
+            logging.warning("authorize_verify missing image: ct=%s, reason=%s", request.META.get("CONTENT_TYPE", ""), upload.content.decode())
+        return upload
+    # A login_hint (email or sub) narrows matching to that user's embeddings;
+    # otherwise search the client's gallery (all active embeddings for
+    # adapter.model_name, or only its org/client members when scoped)
+    hint = str(data.get("login_hint") or data.get("email") or "").strip()
+    precropped, client_score = crop_hint(request)
+    pipeline = FacePipeline(MATCH_STAGES, name="authorize_verify")
     try:
-        margin = float(os.getenv("FACE_MATCH_MARGIN", "0.0"))
-    except ValueError:
-        margin = 0.0
-    # Optional margin: top-1 must exceed top-2 by margin; add debug logging
-    sims = [float(np.dot(probe, g) / (np.linalg.norm(probe) * np.linalg.norm(g))) for g in embeddings]
-    sims_sorted = sorted(sims, reverse=True) if sims else []
-    top1 = sims_sorted[0] if sims_sorted else 0.0
-    top2 = sims_sorted[1] if len(sims_sorted) > 1 else 0.0
-    if margin > 0 and len(embeddings) > 1:
-        if (top1 - top2) < margin:
-            if os.getenv("FACE_DEBUG", "").lower() == "true":
-                logging.info("authorize_verify reject (margin): top1=%.3f top2=%.3f thr=%.3f margin=%.3f", top1, top2, threshold, margin)
+        res = pipeline.run(upload, match_engine(client.gallery_key(), hint), precropped, client_score)
+    except Rejected as exc:
+        if exc.stage in ("gallery", "match"):
             return HttpResponseBadRequest("face not recognized")
-    if idx == -1 or score < threshold:
-        if os.getenv("FACE_DEBUG", "").lower() == "true":
-            logging.info("authorize_verify reject (threshold): top1=%.3f top2=%.3f thr=%.3f margin=%.3f", top1, top2, threshold, margin)
+        return HttpResponseBadRequest(exc.reason)
+    matched_user = User.objects.filter(pk=res.owner_id, is_active=True).first()
+    if matched_user is None:
         return HttpResponseBadRequest("face not recognized")
-    matched_user = owners[idx]
+    return HttpResponseRedirect(_grant(client, matched_user, data, consent=bool(hint)))
+
+
+def _grant(client, user, data, consent: bool = False) -> str:
+    """Record the verified face login; returns the redirect URI carrying the authorization code.
+
+    ``consent`` marks a match made outside the client's scoped gallery (a
+    login_hint verification); it enrolls the user in that gallery for next
+    time. Matches from the scoped gallery are members already.
+    """
+    state = data.get("state")
+    redirect_uri = data.get("redirect_uri")
+    if consent and client.gallery_scope != "global":
+        GalleryMember.objects.get_or_create(
+            org_id=client.org_id, client=client if client.gallery_scope == "client" else None, user=user,
+            defaults={"source": "consent"},
+        )
     session = AuthSession.objects.create(
         client=client,
-        user=matched_user,
+        user=user,
         state=state,
         nonce=data.get("nonce", ""),
         code_challenge=data.get("code_challenge", ""),
@@ -177,9 +137,7 @@ def authorize_verify(request):
         code=code,
         expires_at=timezone.now() + timezone.timedelta(minutes=10),
     )
-    if os.getenv("FACE_DEBUG", "").lower() == "true":
-        logging.info("authorize_verify accept: top1=%.3f top2=%.3f thr=%.3f margin=%.3f", top1, top2, threshold, margin)
-    return HttpResponseRedirect(f"{redirect_uri}?code={code}&state={state}")
+    return f"{redirect_uri}?code={code}&state={state}"
 
 @csrf_exempt
 def token(request):
@@ -0,0 +1,47 @@
+import logging
+import os
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseBadRequest, HttpResponseRedirect
+from django.views.decorators.csrf import csrf_exempt
+
+from orgs.models import OAuthClient
+from accounts.models import User
+from accounts.gallery import match_engine
+from accounts.uploads import crop_hint, read_upload, request_fields
+from facekit.pipeline import MATCH_STAGES, FacePipeline, Rejected
+from .views import _grant
+
+
+# Async authorize_verify, routed under ASGI when FACE_ASYNC_VIEWS=true
+
+
+@csrf_exempt
+async def authorize_verify(request):
+    if request.method != "POST":
+        return HttpResponseBadRequest("POST required")
+    data = request_fields(request)
+    try:
+        client = await OAuthClient.objects.aget(client_id=data.get("client_id"))
+    except OAuthClient.DoesNotExist:
+        return HttpResponseBadRequest("invalid client")
+    if data.get("redirect_uri") not in (client.redirect_uris or []):
+        return HttpResponseBadRequest("invalid redirect_uri")
+    upload = read_upload(request)
+    if isinstance(upload, HttpResponseBadRequest):
+        if os.getenv("FACE_DEBUG", "").lower() == "true":
+            logging.warning("authorize_verify missing image: ct=%s, reason=%s", request.META.get("CONTENT_TYPE", ""), upload.content.decode())
+        return upload
+    hint = str(data.get("login_hint") or data.get("email") or "").strip()
+    precropped, client_score = crop_hint(request)
+    pipeline = FacePipeline(MATCH_STAGES, name="authorize_verify")
+    try:
+        res = await pipeline.arun(upload, match_engine(client.gallery_key(), hint), precropped, client_score)
+    except Rejected as exc:
+        if exc.stage in ("gallery", "match"):
+            return HttpResponseBadRequest("face not recognized")
+        return HttpResponseBadRequest(exc.reason)
+    matched_user = await User.objects.filter(pk=res.owner_id, is_active=True).afirst()
+    if matched_user is None:
+        return HttpResponseBadRequest("face not recognized")
+    return HttpResponseRedirect(await sync_to_async(_grant)(client, matched_user, data, consent=bool(hint)))
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Organization, OAuthClient
+from .models import Organization, OAuthClient, GalleryMember
 
 admin.site.register(Organization)
 admin.site.register(OAuthClient)
+admin.site.register(GalleryMember)
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgs', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='oauthclient',
+            name='gallery_scope',
+            field=models.CharField(choices=[('global', 'global'), ('org', 'org'), ('client', 'client')], default='global', max_length=8),
+        ),
+        migrations.CreateModel(
+            name='GalleryMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('allowlist', 'allowlist'), ('consent', 'consent')], default='allowlist', max_length=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='gallery_members', to='orgs.oauthclient')),
+                ('org', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gallery_members', to='orgs.organization')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gallery_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('org', 'client', 'user')},
+            },
+        ),
+    ]
@@ -15,6 +15,8 @@ class Organization(models.Model):
         return self.name
 
 class OAuthClient(models.Model):
+    GALLERY_SCOPE_CHOICES = [("global", "global"), ("org", "org"), ("client", "client")]
+
     org = models.ForeignKey(Organization, on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
     client_id = models.CharField(max_length=32, unique=True, default=generate_client_id)
@@ -23,7 +25,40 @@ class OAuthClient(models.Model):
     post_logout_redirect_uris = models.JSONField(default=list)
     is_confidential = models.BooleanField(default=True)
     pkce_enforced = models.BooleanField(default=True)
+    # Which users authorize/verify matches against: everyone, or only
+    # GalleryMember rows of this client's org / of this client.
+    gallery_scope = models.CharField(max_length=8, choices=GALLERY_SCOPE_CHOICES, default="global")
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.name
+
+    def gallery_key(self):
+        """Scope key for ``accounts.gallery.get_gallery`` (None for the global gallery)."""
+        if self.gallery_scope == "org":
+            return ("org", self.org_id)
+        if self.gallery_scope == "client":
+            return ("client", self.pk)
+        return None
+
+
+class GalleryMember(models.Model):
+    """A user included in an org- or client-scoped gallery.
+
+    Rows come from an explicit allow-list or from a prior consent (a
+    successful authorize for the client).
+    """
+
+    SOURCE_CHOICES = [("allowlist", "allowlist"), ("consent", "consent")]
+
+    org = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name="gallery_members")
+    client = models.ForeignKey(OAuthClient, null=True, blank=True, on_delete=models.CASCADE, related_name="gallery_members")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="gallery_memberships")
+    source = models.CharField(max_length=16, choices=SOURCE_CHOICES, default="allowlist")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("org", "client", "user")
+
+    def __str__(self):
+        return f"{self.user_id} in {self.client or self.org}"
@@ -18,6 +18,7 @@ class OAuthClientSerializer(serializers.ModelSerializer):
             "post_logout_redirect_uris",
             "is_confidential",
             "pkce_enforced",
+            "gallery_scope",
             "created_at",
         ]
         read_only_fields = ["id", "client_id", "created_at"]
@@ -49,5 +50,6 @@ class OAuthClientCreateSerializer(OAuthClientSerializer):
             "post_logout_redirect_uris",
             "is_confidential",
             "pkce_enforced",
+            "gallery_scope",
         ]
         read_only_fields = ["id"]
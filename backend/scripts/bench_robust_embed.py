@@ -0,0 +1,90 @@
+"""Micro-benchmark for facekit.devfuncs.robust_embed.
+
+Compares the vectorized HOG binning (single image and batched) against the
+original per-pixel loop and checks that all produce bit-identical descriptors.
+
+    python scripts/bench_robust_embed.py [--images 200] [--size 480x640]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from facekit.devfuncs import robust_embed, robust_embed_batch  # noqa: E402
+
+
+def robust_embed_loop(image_bgr: np.ndarray) -> np.ndarray:
+    """The original implementation, kept here as the reference."""
+    b = image_bgr[..., 0].astype(np.float32)
+    g = image_bgr[..., 1].astype(np.float32)
+    r = image_bgr[..., 2].astype(np.float32)
+    gray = (0.114 * b + 0.587 * g + 0.299 * r)
+    H, W = gray.shape
+    target = 64
+    ys = (np.linspace(0, max(H - 1, 0), target)).astype(np.int32)
+    xs = (np.linspace(0, max(W - 1, 0), target)).astype(np.int32)
+    small = gray[ys][:, xs]
+    dx = np.zeros_like(small)
+    dy = np.zeros_like(small)
+    dx[:, 1:-1] = (small[:, 2:] - small[:, :-2]) * 0.5
+    dy[1:-1, :] = (small[2:, :] - small[:-2, :]) * 0.5
+    mag = np.sqrt(dx * dx + dy * dy) + 1e-6
+    ang = (np.arctan2(dy, dx) + 2 * np.pi) % (2 * np.pi)
+    cell = 8
+    bins = 8
+    bin_w = (2 * np.pi) / bins
+    hists = []
+    for y0 in range(0, target, cell):
+        for x0 in range(0, target, cell):
+            m = mag[y0:y0 + cell, x0:x0 + cell]
+            a = ang[y0:y0 + cell, x0:x0 + cell]
+            bidx = np.clip(np.floor(a / bin_w).astype(np.int32), 0, bins - 1)
+            hist = np.zeros((bins,), dtype=np.float32)
+            for i in range(m.shape[0]):
+                for j in range(m.shape[1]):
+                    hist[bidx[i, j]] += m[i, j]
+            hists.append(hist)
+    desc = np.concatenate(hists).astype(np.float32)
+    n = float(np.linalg.norm(desc))
+    if n > 0:
+        desc /= n
+    return desc
+
+
+def bench(fn, images) -> float:
+    start = time.perf_counter()
+    for img in images:
+        fn(img)
+    return (time.perf_counter() - start) / len(images)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--size", default="480x640", help="HxW of the synthetic BGR frames")
+    args = parser.parse_args()
+    h, w = (int(x) for x in args.size.lower().split("x"))
+
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8) for _ in range(args.images)]
+
+    mismatched = sum(not np.array_equal(robust_embed(img), robust_embed_loop(img)) for img in images)
+    mismatched += int(not np.array_equal(robust_embed_batch(images), np.stack([robust_embed_loop(img) for img in images])))
+    loop = bench(robust_embed_loop, images)
+    vectorized = bench(robust_embed, images)
+    start = time.perf_counter()
+    robust_embed_batch(images)
+    batched = (time.perf_counter() - start) / len(images)
+    print(f"{args.images} images {h}x{w}: bit-identical {args.images - mismatched}/{args.images}")
+    print(f"loop       {loop * 1e3:8.3f} ms/image")
+    print(f"vectorized {vectorized * 1e3:8.3f} ms/image  ({loop / vectorized:.1f}x)")
+    print(f"batched    {batched * 1e3:8.3f} ms/image  ({loop / batched:.1f}x)")
+    return 1 if mismatched else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
 'use client'
 import React, { useMemo, useState } from 'react'
 import CameraCapture from '../../components/CameraCapture'
-import { API_BASE } from '../../lib/api'
+import { API_BASE, faceFields } from '../../lib/api'
 import { useSearchParams } from 'next/navigation'
 
 export default function Authorize() {
@@ -9,25 +9,35 @@ export default function Authorize() {
   const sp = useSearchParams()
   const params = useMemo(() => Object.fromEntries(sp.entries()), [sp])
 
-  async function onCaptured(frames, { faceImage }) {
+  async function onCaptured(capture) {
+    const { faceImage } = capture
     setError('')
     try {
       if (!faceImage) {
         setError('No face detected. Please center your face and try again.')
         return
       }
-      // Submit via form POST so browser follows 302 to RP
+      // Submit via multipart form POST so browser follows 302 to RP;
+      // the JPEG crop goes in as a file part rather than a data URL
       const form = document.createElement('form')
       form.method = 'POST'
+      form.enctype = 'multipart/form-data'
       form.action = `${API_BASE}/oauth/authorize/verify`
-      const payload = { ...params, image: faceImage }
-      for (const [k, v] of Object.entries(payload)) {
+      for (const [k, v] of Object.entries({ ...params, ...faceFields(capture) })) {
         const input = document.createElement('input')
         input.type = 'hidden'
         input.name = k
         input.value = typeof v === 'string' ? v : JSON.stringify(v)
         form.appendChild(input)
       }
+      const file = document.createElement('input')
+      file.type = 'file'
+      file.name = 'image'
+      const dt = new DataTransfer()
+      dt.items.add(new File([faceImage], 'face.jpg', { type: faceImage.type || 'image/jpeg' }))
+      file.files = dt.files
+      form.appendChild(file)
+      form.style.display = 'none'
       document.body.appendChild(form)
       form.submit()
     } catch (e) {
@@ -1,21 +1,21 @@
 'use client'
 import React, { useState } from 'react'
 import CameraCapture from '../../components/CameraCapture'
-import { postJSON } from '../../lib/api'
+import { faceFields, postImage } from '../../lib/api'
 
 export default function Enroll() {
   const [result, setResult] = useState('')
   const [busy, setBusy] = useState(false)
 
-  async function onCaptured(frames, { faceImage }) {
+  async function onCaptured(capture) {
+    const { faceImage } = capture
     try {
       setBusy(true)
       if (!faceImage) {
         setResult('No face detected. Please center your face and try again.')
         return
       }
-      const image = faceImage
-      await postJSON('/account/face/enroll', { image })
+      await postImage('/account/face/enroll', faceImage, faceFields(capture))
       setResult('Enrolled successfully. Redirecting to profile...')
       setTimeout(() => { window.location.href = '/profile' }, 800)
     } catch (e) {
@@ -1,20 +1,21 @@
 'use client'
 import React, { useState } from 'react'
 import CameraCapture from '../../components/CameraCapture'
-import { postJSON } from '../../lib/api'
+import { faceFields, postImage } from '../../lib/api'
 
 export default function Login() {
   const [error, setError] = useState('')
   const [capKey, setCapKey] = useState(0)
 
-  async function onCaptured(frames, { faceImage }) {
+  async function onCaptured(capture) {
+    const { faceImage } = capture
     setError('')
     try {
       if (!faceImage) {
         setError('No face detected. Please center your face and try again.')
         return
       }
-      await postJSON('/account/face/login', { image: faceImage })
+      await postImage('/account/face/login', faceImage, faceFields(capture))
       window.location.href = '/profile'
     } catch (e) {
       setError(e?.message || 'Login failed')
@@ -1,6 +1,6 @@
 'use client'
 import React, { useEffect, useState } from 'react'
-import { apiFetch } from '../../lib/api'
+import { apiFetch, postImage } from '../../lib/api'
 import CameraCapture from '../../components/CameraCapture'
 
 export default function Profile() {
@@ -23,14 +23,14 @@ export default function Profile() {
     alert('Saved')
   }
 
-  async function onReenrollCaptured(frames, { faceImage }) {
+  async function onReenrollCaptured({ faceImage }) {
     setReenrollMsg('')
     try {
       if (!faceImage) {
         setReenrollMsg('No face detected. Please center your face and try again.')
         return
       }
-      await apiFetch('/account/face/reenroll', { method: 'POST', body: { image: faceImage } })
+      await postImage('/account/face/reenroll', faceImage)
       setReenrollMsg('Re-enrolled successfully')
     } catch (e) {
       setReenrollMsg(String(e))
@@ -1,10 +1,17 @@
 'use client'
 import React, { useEffect, useRef, useState } from 'react'
 import { detectLargestFaceOnCanvas, warmupFaceDetector } from '../lib/aiFaceDetector'
+import { toBlob } from '../lib/api'
+
+const CROP_SIZE = Number(process.env.NEXT_PUBLIC_FACE_CROP_SIZE || 160)
 
 // Auto-captures after `seconds` of continuous face detection.
 // Draws a bounding box overlay on the video feed.
-export default function CameraCapture({ seconds = 5, onCaptured, width = 560, height = 360, detectFace = true, bboxScale = 1.10 }) {
+// Upload contract: onCaptured({ faceImage, bbox, score }) where faceImage is a
+// square crop padded by `bboxScale`, resized to `cropSize` (the embedder's
+// input size) and JPEG-encoded; bbox is that crop in video pixels and score
+// the client detector's confidence (null if unknown). See lib/api faceFields.
+export default function CameraCapture({ seconds = 5, onCaptured, width = 560, height = 360, detectFace = true, bboxScale = 1.10, cropSize = CROP_SIZE, cropQuality = 0.9 }) {
   const videoRef = useRef(null)
   const overlayRef = useRef(null)
   const offscreenRef = useRef(null)
@@ -21,9 +28,7 @@ export default function CameraCapture({ seconds = 5, onCaptured, width = 560, he
     let s
     let rafId
     let detectTimer
-    let lastSampleTs = 0
     let detectionStart = 0
-    const frames = []
 
     async function ensureStream() {
       try {
@@ -110,12 +115,12 @@ export default function CameraCapture({ seconds = 5, onCaptured, width = 560, he
             if (faces && faces.length > 0) {
               faces.sort((a, b) => (b.boundingBox.width * b.boundingBox.height) - (a.boundingBox.width * a.boundingBox.height))
               const box = faces[0].boundingBox
-              bbox = { x: box.x, y: box.y, w: box.width, h: box.height }
+              bbox = { x: box.x, y: box.y, w: box.width, h: box.height, score: null }
             }
           }
           if (!bbox) {
             const f = await detectLargestFaceOnCanvas(off, 0.7)
-            if (f) bbox = { x: f.x, y: f.y, w: f.w, h: f.h }
+            if (f) bbox = { x: f.x, y: f.y, w: f.w, h: f.h, score: f.score }
           }
         }
       } catch (e) {
@@ -133,41 +138,34 @@ export default function CameraCapture({ seconds = 5, onCaptured, width = 560, he
         if (detectionStart === 0) detectionStart = now
         const elapsed = (now - detectionStart) / 1000
         setRemaining(Math.max(0, Math.ceil(seconds - elapsed)))
-        if (now - lastSampleTs > 950) {
-          lastSampleTs = now
-          frames.push(off.toDataURL('image/png'))
-        }
         if (elapsed >= seconds && !capturedRef.current) {
-          const cx = Math.max(0, Math.floor(bbox.x))
-          const cy = Math.max(0, Math.floor(bbox.y))
-          const cw = Math.min(off.width - cx, Math.floor(bbox.w))
-          const ch = Math.min(off.height - cy, Math.floor(bbox.h))
+          // Square crop around the raw detection, padded by bboxScale and not
+          // clamped (off-frame parts stay black) so resizing does not distort
+          const size = Math.max(bbox.w, bbox.h) * bboxScale
+          const sx = bbox.x + bbox.w / 2 - size / 2
+          const sy = bbox.y + bbox.h / 2 - size / 2
           const crop = document.createElement('canvas')
-          crop.width = cw
-          crop.height = ch
+          crop.width = cropSize
+          crop.height = cropSize
           const cctx = crop.getContext('2d')
-          // Use the expanded bbox we draw (for consistency with overlay)
-          const pb = bboxRef.current || { x: cx, y: cy, w: cw, h: ch }
-          const pcx = Math.max(0, Math.floor(pb.x))
-          const pcy = Math.max(0, Math.floor(pb.y))
-          const pcw = Math.min(off.width - pcx, Math.floor(pb.w))
-          const pch = Math.min(off.height - pcy, Math.floor(pb.h))
-          crop.width = pcw
-          crop.height = pch
-          cctx.drawImage(off, pcx, pcy, pcw, pch, 0, 0, pcw, pch)
-          const faceImage = crop.toDataURL('image/png')
+          cctx.fillStyle = '#000'
+          cctx.fillRect(0, 0, cropSize, cropSize)
+          cctx.drawImage(off, sx, sy, size, size, 0, 0, cropSize, cropSize)
           capturedRef.current = true
           setArmed(false)
           if (rafId) cancelAnimationFrame(rafId)
           if (detectTimer) clearInterval(detectTimer)
           s?.getTracks()?.forEach(t => t.stop())
-          onCaptured?.(frames.slice(-seconds), { faceImage })
+          const faceImage = await toBlob(crop, 'image/jpeg', cropQuality).catch(() => null)
+          onCaptured?.({
+            faceImage,
+            bbox: { x: Math.round(sx), y: Math.round(sy), w: Math.round(size), h: Math.round(size) },
+            score: bbox.score ?? null,
+          })
         }
       } else {
         detectionStart = 0
         setRemaining(seconds)
-        lastSampleTs = 0
-        frames.length = 0
       }
     }
 
@@ -180,7 +178,7 @@ export default function CameraCapture({ seconds = 5, onCaptured, width = 560, he
       if (detectTimer) clearInterval(detectTimer)
       s && s.getTracks().forEach(t => t.stop())
     }
-  }, [seconds, detectFace, onCaptured, width, height])
+  }, [seconds, detectFace, onCaptured, width, height, cropSize, cropQuality])
 
   return (
     <div className="stack">
@@ -6,7 +6,11 @@ export async function apiFetch(
   { method = 'GET', body, headers = {}, credentials = 'include', authRedirect = true } = {}
 ) {
   const opts = { method, headers: { ...headers }, credentials };
-  if (body && !(body instanceof FormData)) {
+  if (body && typeof Blob !== 'undefined' && body instanceof Blob) {
+    // Raw image upload: the blob's type (image/jpeg, image/webp) is the Content-Type
+    opts.headers['Content-Type'] = body.type || 'application/octet-stream';
+    opts.body = body;
+  } else if (body && !(body instanceof FormData)) {
     opts.headers['Content-Type'] = 'application/json';
     opts.body = JSON.stringify(body);
   } else if (body) {
@@ -30,3 +34,25 @@ export async function apiFetch(
 export async function postJSON(path, payload, opts={}) {
   return apiFetch(path, { method: 'POST', body: payload, ...opts });
 }
+
+// Encode a canvas as a JPEG Blob (smaller than PNG, no base64 inflation)
+export function toBlob(canvas, type = 'image/jpeg', quality = 0.92) {
+  return new Promise((resolve, reject) => {
+    canvas.toBlob(b => (b ? resolve(b) : reject(new Error('image encoding failed'))), type, quality)
+  })
+}
+
+// POST an image Blob as the raw request body; other fields go in the query string
+export async function postImage(path, image, fields = {}, opts = {}) {
+  const qs = new URLSearchParams(fields).toString()
+  return apiFetch(qs ? `${path}?${qs}` : path, { method: 'POST', body: image, ...opts });
+}
+
+// Crop metadata fields for a CameraCapture result; the backend treats an
+// upload with face_bbox as pre-cropped (see FaceDetector.face_image)
+export function faceFields({ bbox, score } = {}) {
+  const fields = {}
+  if (bbox) fields.face_bbox = [bbox.x, bbox.y, bbox.w, bbox.h].join(',')
+  if (typeof score === 'number') fields.face_score = String(score)
+  return fields
+}